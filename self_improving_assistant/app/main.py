@@ -3,10 +3,14 @@ import json
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import HTMLResponse, PlainTextResponse
 from pydantic import BaseModel
-import os, yaml, glob, subprocess, sys, asyncio
+import os, yaml, glob, subprocess, sys, asyncio, threading
 from datetime import datetime
 from pathlib import Path
+from urllib.parse import quote
 from .tools.web_rag import TinyRAG, learn_from_web
+from .tools.ollama import ollama_settings, ollama_chat, warm_up, residency
+from .tools.results_db import ResultsDB
+from .tools.cycle import Stage, run_stages
 
 app = FastAPI()
 
@@ -42,7 +46,7 @@ def load_prompt(path):
 # -----------------------------------------------------------------------------
 # Dummy LLM (remplace plus tard par un appel réel OpenAI/Ollama, etc.)
 # -----------------------------------------------------------------------------
-def call_llm(prompt, question, provider="dummy", model=""):
+def call_llm(prompt, question, provider="dummy", model="", ollama=None):
     provider = (provider or "dummy").lower()
     # Real providers
     if provider == "openai":
@@ -63,20 +67,10 @@ def call_llm(prompt, question, provider="dummy", model=""):
             return f"[openai error] {e}"
     if provider == "ollama":
         try:
-            import requests
-            payload = {
-                "model": model or "llama3",
-                "messages": [
-                    {"role": "system", "content": prompt or ""},
-                    {"role": "user", "content": question},
-                ],
-                "stream": False,
-                "options": {"temperature": 0.2}
-            }
-            r = requests.post("http://localhost:11434/api/chat", json=payload, timeout=60)
-            r.raise_for_status()
-            data = r.json()
-            return (data.get("message", {}).get("content") or data.get("response") or "").strip()
+            return ollama_chat(ollama or ollama_settings(None), model, [
+                {"role": "system", "content": prompt or ""},
+                {"role": "user", "content": question},
+            ])
         except Exception as e:
             return f"[ollama error] {e}"
     # Dummy heuristic fallback
@@ -108,7 +102,7 @@ def ask(req: AskReq):
             joined = "\n---\n".join(d["text"][:1000] for d in docs)
             context = f"\n\n[Contexte]\n{joined}\n\n"
     sys_prompt = (prompt or "") + context
-    answer = call_llm(sys_prompt, req.question, cfg.get("provider", "dummy"), cfg.get("model", ""))
+    answer = call_llm(sys_prompt, req.question, cfg.get("provider", "dummy"), cfg.get("model", ""), ollama=ollama_settings(cfg))
     return {"answer": answer}
 
 # -----------------------------------------------------------------------------
@@ -222,7 +216,7 @@ DASH_HTML = """
             if (data.eval?.length){
         html += '<h3>Évaluations</h3><table><tr><th>Fichier</th><th>Score moyen</th></tr>';
         for(const row of data.eval){
-          html += `<tr><td><a href="/api/file?path=${encodeURIComponent(row.path)}" target="_blank">${row.name}</a></td><td>${row.avg ?? ''}</td></tr>`;
+          html += `<tr><td><a href="${row.url}" target="_blank">${row.name}</a></td><td>${row.avg ?? ''}</td></tr>`;
         }
         html += '</table>';
                                 if (data.more_eval>0){ html += `<small class="muted">+ ${data.more_eval} de plus… <a href="#" onclick="showMore('eval')">voir tout</a></small>`; }
@@ -230,7 +224,7 @@ DASH_HTML = """
             if (data.ab?.length){
         html += '<h3>A/B tests</h3><table><tr><th>Fichier</th></tr>';
         for(const row of data.ab){
-          html += `<tr><td><a href="/api/file?path=${encodeURIComponent(row.path)}" target="_blank">${row.name}</a></td></tr>`;
+          html += `<tr><td><a href="${row.url}" target="_blank">${row.name}</a></td></tr>`;
         }
         html += '</table>';
                                 if (data.more_ab>0){ html += `<small class="muted">+ ${data.more_ab} de plus… <a href="#" onclick="showMore('ab')">voir tout</a></small>`; }
@@ -244,14 +238,14 @@ DASH_HTML = """
                         if (data.eval?.length){
                 html += '<h3>Évaluations</h3><table><tr><th>Fichier</th><th>Score moyen</th></tr>';
                 for(const row of data.eval){
-                    html += `<tr><td><a href="/api/file?path=${encodeURIComponent(row.path)}" target="_blank">${row.name}</a></td><td>${row.avg ?? ''}</td></tr>`;
+                    html += `<tr><td><a href="${row.url}" target="_blank">${row.name}</a></td><td>${row.avg ?? ''}</td></tr>`;
                 }
                 html += '</table>';
             }
                         if (data.ab?.length){
                 html += '<h3>A/B tests</h3><table><tr><th>Fichier</th></tr>';
                 for(const row of data.ab){
-                    html += `<tr><td><a href="/api/file?path=${encodeURIComponent(row.path)}" target="_blank">${row.name}</a></td></tr>`;
+                    html += `<tr><td><a href="${row.url}" target="_blank">${row.name}</a></td></tr>`;
                 }
                 html += '</table>';
             }
@@ -340,9 +334,38 @@ def api_logs(tail: int = 500):
     except Exception as e:
         return f"(erreur lecture log: {e})"
 
+def _run_row(r):
+    # lien vers le CSV exporté s'il existe, sinon export à la volée depuis la base
+    path = r.get("csv_path") or ""
+    stamp = datetime.fromtimestamp(r["started_at"]).strftime("%Y%m%d-%H%M%S")
+    if path and os.path.exists(path if os.path.isabs(path) else _abs(path)):
+        path = path if os.path.isabs(path) else _abs(path)
+        url = f"/api/file?path={quote(path)}"
+        name = os.path.basename(path)
+    else:
+        url = f"/api/results/{r['id']}.csv"
+        name = f"{r['kind']}_{stamp} (#{r['id']})"
+    avg = r.get("avg_score")
+    return {"name": name, "path": path, "url": url, "run_id": r["id"], "avg": None if avg is None else str(avg),
+            "winner": r.get("winner")}
+
 @app.get("/api/files")
 def api_files(limit: int = 5):
     os.makedirs(_abs("logs"), exist_ok=True)
+    db = ResultsDB.from_cfg(load_config(), str(BASE_DIR))
+    try:
+        n_eval, n_ab = db.count("eval"), db.count("abtest")
+        if n_eval or n_ab:
+            return {
+                "eval": [_run_row(r) for r in db.runs("eval", limit)],
+                "ab": [_run_row(r) for r in db.runs("abtest", limit)],
+                "more_eval": max(0, n_eval - limit),
+                "more_ab": max(0, n_ab - limit),
+            }
+    finally:
+        db.close()
+
+    # base encore vide: anciens CSV de logs/
     eval_files = sorted(glob.glob(str(Path(_abs("logs")) / "eval_*.csv")))
     ab_files   = sorted(glob.glob(str(Path(_abs("logs")) / "abtest_*.csv")))
 
@@ -359,8 +382,8 @@ def api_files(limit: int = 5):
             pass
         return avg
 
-    eval_rows_all = [{"name": os.path.basename(p), "path": p, "avg": parse_avg(p)} for p in reversed(eval_files)]
-    ab_rows_all   = [{"name": os.path.basename(p), "path": p} for p in reversed(ab_files)]
+    eval_rows_all = [{"name": os.path.basename(p), "path": p, "url": f"/api/file?path={quote(p)}", "avg": parse_avg(p)} for p in reversed(eval_files)]
+    ab_rows_all   = [{"name": os.path.basename(p), "path": p, "url": f"/api/file?path={quote(p)}"} for p in reversed(ab_files)]
     return {
         "eval": eval_rows_all[:limit],
         "ab": ab_rows_all[:limit],
@@ -368,6 +391,17 @@ def api_files(limit: int = 5):
         "more_ab": max(0, len(ab_rows_all) - limit),
     }
 
+@app.get("/api/results/{run_id}.csv")
+def api_results_csv(run_id: int):
+    db = ResultsDB.from_cfg(load_config(), str(BASE_DIR))
+    try:
+        data = db.export_csv(run_id)
+    finally:
+        db.close()
+    if not data:
+        return PlainTextResponse("(run introuvable)", status_code=404)
+    return Response(content=data, media_type="text/plain")
+
 @app.get("/api/file")
 def api_file(path: str):
     if not os.path.exists(path):
@@ -402,10 +436,13 @@ def venv_python():
             return exe
     return sys.executable
 
-def run_script(pyfile):
+_log_lock = threading.Lock()  # étapes du cycle en parallèle: une sortie de script à la fois dans cron.log
+
+def run_script(pyfile, timeout_s=None):
     t0 = datetime.now()
     script_path = str((BASE_DIR / pyfile).resolve()) if not os.path.isabs(pyfile) else pyfile
-    timeout_s = int(load_config().get("scheduler", {}).get("script_timeout_seconds", 180))
+    if timeout_s is None:
+        timeout_s = int(load_config().get("scheduler", {}).get("script_timeout_seconds", 180))
     try:
         proc = subprocess.run(
             [venv_python(), script_path],
@@ -422,7 +459,7 @@ def run_script(pyfile):
     seconds = (datetime.now() - t0).total_seconds()
     # Append output to cron.log (utile si lancé depuis le dashboard / scheduler)
     os.makedirs(_abs("logs"), exist_ok=True)
-    with open(os.path.join(_abs("logs"),"cron.log"), "a", encoding="utf-8") as log:
+    with _log_lock, open(os.path.join(_abs("logs"),"cron.log"), "a", encoding="utf-8") as log:
         stamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         log.write(f"[WEB][{stamp}] RUN {pyfile}\n")
         log.write(out)
@@ -472,26 +509,43 @@ def api_learn(req: LearnReq):
 _scheduler_task = None
 _scheduler_lock = asyncio.Lock()
 _turbo = False
+_last_cycle = None
 
-async def _cycle_once():
-    # une itération: évaluer -> A/B -> promouvoir
+# Étapes d'un cycle et ce qu'elles lisent / produisent; ordre d'exécution déduit (app/tools/cycle.py):
+# ingest, grow et evaluate démarrent ensemble; l'A/B attend les candidats et le tirage du cycle
+CYCLE_STAGES = [
     # Apprentissage web (si activé via config RAG; le script est no-op si rien à faire)
-    await asyncio.to_thread(run_script, "scripts/ingest.py")
-    # Générer de nouveaux candidats à partir du prompt actif
-    await asyncio.to_thread(run_script, "scripts/grow.py")
-    # Évaluer
-    await asyncio.to_thread(run_script, "scripts/evaluate.py")
-    await asyncio.to_thread(run_script, "scripts/ab_test.py")
-    await asyncio.to_thread(run_script, "scripts/promote.py")
-    # Auto-update si activé dans la config (à la fin du cycle)
-    try:
-        cfg = load_config()
-        if cfg.get("self_update", {}).get("enabled", False):
-            await asyncio.to_thread(run_script, "scripts/self_update.py")
-    except Exception as e:
-        with open(os.path.join(_abs("logs"),"cron.log"), "a", encoding="utf-8") as log:
-            stamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            log.write(f"[WEB][{stamp}] [self_update] ERREUR: {e}\n")
+    Stage("ingest", "scripts/ingest.py", outputs=("rag",)),
+    # Nouveaux candidats depuis le prompt actif et ses scores des cycles précédents
+    Stage("grow", "scripts/grow.py", inputs=("active_prompt",), outputs=("candidates",)),
+    # Évaluer le prompt actif (et tirer l'échantillon du cycle)
+    Stage("evaluate", "scripts/evaluate.py", inputs=("active_prompt", "tests"), outputs=("eval_run", "cycle_sample")),
+    Stage("ab_test", "scripts/ab_test.py", inputs=("candidates", "cycle_sample", "tests"), outputs=("ab_winner",)),
+    Stage("promote", "scripts/promote.py", inputs=("ab_winner", "eval_run", "cycle_sample"), outputs=("active_prompt",)),
+    # Auto-update si activé dans la config (à la fin du cycle: il évalue l'arbre vivant)
+    Stage("self_update", "scripts/self_update.py", inputs=("active_prompt", "rag", "candidates"), outputs=("code",),
+          when=lambda cfg: bool(cfg.get("self_update", {}).get("enabled", False))),
+]
+
+def _stage_timeout(cfg, name):
+    sched = cfg.get("scheduler", {})
+    default = int(sched.get("script_timeout_seconds", 180))
+    return int((sched.get("stage_timeouts") or {}).get(name, default))
+
+async def _cycle_once():
+    # une itération: graphe d'étapes, les indépendantes en parallèle
+    global _last_cycle
+    cfg = load_config()
+    sched = cfg.get("scheduler", {})
+    run = lambda st: run_script(st.script, _stage_timeout(cfg, st.name))
+    out = await run_stages(CYCLE_STAGES, run, cfg, int(sched.get("max_parallel_stages", 0) or 0))
+    out["finished_at"] = datetime.now().isoformat(timespec="seconds")
+    _last_cycle = out
+    with _log_lock, open(os.path.join(_abs("logs"),"cron.log"), "a", encoding="utf-8") as log:
+        stamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        parts = ", ".join(f"{n} {r['status']} {r['seconds']}s" for n, r in out["stages"].items())
+        log.write(f"[WEB][{stamp}] [cycle] {out['wall_seconds']}s (chemin critique {out['critical_path_seconds']}s: "
+                  f"{' -> '.join(out['critical_path'])}) | {parts}\n")
 
 async def _scheduler_loop():
     # recharge la config à chaque itération pour prendre en compte les réglages dynamiques
@@ -522,6 +576,13 @@ async def _start_scheduler():
         if _scheduler_task is None or _scheduler_task.done():
             _scheduler_task = asyncio.create_task(_scheduler_loop())
 
+@app.on_event("startup")
+async def _warm_up_llm():
+    # Ollama: charger le modèle dès le démarrage (en tâche de fond, sans bloquer le serveur)
+    cfg = load_config()
+    if (cfg.get("provider") or "").lower() == "ollama":
+        asyncio.create_task(asyncio.to_thread(warm_up, ollama_settings(cfg), cfg.get("model", "")))
+
 @app.on_event("shutdown")
 async def _stop_scheduler():
     global _scheduler_task
@@ -543,6 +604,8 @@ def scheduler_status():
         "burst": cfg.get("scheduler", {}).get("burst", False),
         "interval_seconds": cfg.get("scheduler", {}).get("interval_seconds", 5),
         "turbo": _turbo,
+        "last_cycle": _last_cycle,
+        "ollama": residency(ollama_settings(cfg), cfg.get("model", "")) if (cfg.get("provider") or "").lower() == "ollama" else None,
     }
 
 @app.post("/api/scheduler/start")
@@ -570,7 +633,7 @@ async def api_cycle_now():
     async with _scheduler_lock:
         try:
             await _cycle_once()
-            return {"ok": True}
+            return {"ok": True, "cycle": _last_cycle}
         except Exception as e:
             return {"ok": False, "error": str(e)}
 
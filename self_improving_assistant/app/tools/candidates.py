@@ -0,0 +1,194 @@
+import os, glob, time, shutil, sqlite3, threading
+from typing import Dict, Iterable, List, Optional
+from .results_db import prompt_hash
+
+"""
+Registre des prompts candidats (table candidates de results_db), pour grow / ab_test / promote:
+- un candidat = un contenu (hash): une mutation identique à un candidat connu, archivé
+  ou au prompt actif n'est pas réécrite
+- lignée (hash du parent, mutation appliquée) et scores A/B cumulés (runs, moyenne, meilleur, victoires)
+- au plus max_live candidats vivants: au-delà, les plus faibles sont archivés (fichier déplacé
+  dans archive_dir, hors du dossier lu par l'A/B); un candidat battu retire_after_runs fois est archivé
+- les candidats déclarés dans paths.candidates ne sont jamais archivés, ni le gagnant de l'A/B en cours
+  (keep: promote le relit ensuite depuis last_winner.txt)
+"""
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS candidates (
+    hash TEXT PRIMARY KEY,
+    path TEXT NOT NULL,
+    parent_hash TEXT,
+    mutation TEXT,
+    status TEXT NOT NULL DEFAULT 'live',
+    created_at REAL NOT NULL,
+    runs INTEGER NOT NULL DEFAULT 0,
+    wins INTEGER NOT NULL DEFAULT 0,
+    score_sum REAL NOT NULL DEFAULT 0,
+    last_score REAL,
+    best_score REAL,
+    archived_at REAL
+);
+CREATE INDEX IF NOT EXISTS candidates_status ON candidates(status);
+"""
+
+
+def _read(path: str) -> str:
+    with open(path, "r", encoding="utf-8") as f:
+        return f.read()
+
+
+class CandidateRegistry:
+    def __init__(self, path: str, prompts_dir: str, active_path: str, pinned: Iterable[str] = (),
+                 max_live: int = 8, retire_after_runs: int = 3, archive_dir: str = ""):
+        self.prompts_dir = prompts_dir
+        self.active_path = active_path
+        self.pinned = {os.path.abspath(p) for p in pinned}
+        self.max_live = max(1, int(max_live))
+        self.retire_after = int(retire_after_runs)
+        self.archive_dir = archive_dir or os.path.join(prompts_dir, "archive")
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(SCHEMA)
+        self._db.commit()
+
+    @classmethod
+    def from_cfg(cls, cfg: dict, root: str = ""):
+        paths = cfg.get("paths", {}) or {}
+        c = cfg.get("candidates", {}) or {}
+        db = (cfg.get("evaluation", {}) or {}).get("results_db", "data/results.sqlite")
+        active = paths.get("active_prompt", "prompts/active_prompt.txt")
+        archive = c.get("archive_dir", "")
+        pinned = list(paths.get("candidates", []) or [])
+        if root:
+            j = lambda p: p if not p or os.path.isabs(p) else os.path.join(root, p)
+            db, active, archive, pinned = j(db), j(active), j(archive), [j(p) for p in pinned]
+        return cls(db, os.path.dirname(active), active, pinned,
+                   max_live=int(c.get("max_live", 8)), retire_after_runs=int(c.get("retire_after_runs", 3)),
+                   archive_dir=archive)
+
+    def active_hash(self) -> str:
+        try:
+            return prompt_hash(_read(self.active_path))
+        except OSError:
+            return ""
+
+    def _row(self, h: str) -> Optional[Dict]:
+        with self._lock:
+            row = self._db.execute("SELECT * FROM candidates WHERE hash=?", (h,)).fetchone()
+        return dict(row) if row else None
+
+    # -- enregistrement -----------------------------------------------------------
+
+    def known(self, text: str) -> bool:
+        h = prompt_hash(text)
+        return h == self.active_hash() or self._row(h) is not None
+
+    def register(self, path: str, text: str, parent: str = "", mutation: str = "") -> bool:
+        """Écrit et enregistre un nouveau candidat; False (rien d'écrit) si ce contenu est déjà connu."""
+        if self.known(text):
+            return False
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text)
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO candidates (hash, path, parent_hash, mutation, created_at) VALUES (?,?,?,?,?)",
+                (prompt_hash(text), path, prompt_hash(parent) if parent else None, mutation, time.time()))
+            self._db.commit()
+        return True
+
+    def sync(self) -> Dict[str, int]:
+        """Prend en compte les .txt du dossier des prompts (déclarés, ajoutés à la main, anciens auto_*):
+        nouveaux contenus enregistrés, copies d'un contenu déjà connu archivées."""
+        active = os.path.abspath(self.active_path)
+        out = {"added": 0, "duplicates": 0}
+        for p in sorted(glob.glob(os.path.join(self.prompts_dir, "*.txt"))):
+            if os.path.abspath(p) == active:
+                continue
+            h = prompt_hash(_read(p))
+            row = self._row(h)
+            if row is None:
+                with self._lock:
+                    self._db.execute("INSERT INTO candidates (hash, path, created_at) VALUES (?,?,?)",
+                                     (h, p, os.path.getmtime(p)))
+                    self._db.commit()
+                out["added"] += 1
+            elif os.path.abspath(row["path"]) != os.path.abspath(p) and os.path.exists(row["path"]):
+                if os.path.abspath(p) not in self.pinned:
+                    self._move(p)
+                    out["duplicates"] += 1
+            elif row["path"] != p:
+                with self._lock:
+                    self._db.execute("UPDATE candidates SET path=?, status='live', archived_at=NULL WHERE hash=?", (p, h))
+                    self._db.commit()
+        return out
+
+    # -- candidats vivants -----------------------------------------------------------
+
+    def live(self) -> List[Dict]:
+        """Candidats vivants dont le fichier existe, hors contenu du prompt actif."""
+        active = self.active_hash()
+        with self._lock:
+            rows = [dict(r) for r in self._db.execute("SELECT * FROM candidates WHERE status='live' ORDER BY created_at")]
+        return [r for r in rows if r["hash"] != active and os.path.exists(r["path"])]
+
+    def record_ab(self, scores: Dict[str, float], texts: Dict[str, str], winner: str):
+        """scores / texts par chemin de candidat, après un A/B."""
+        with self._lock:
+            for path, s in scores.items():
+                h = prompt_hash(texts[path])
+                self._db.execute(
+                    "UPDATE candidates SET runs=runs+1, wins=wins+?, score_sum=score_sum+?, last_score=?, "
+                    "best_score=MAX(COALESCE(best_score, ?), ?) WHERE hash=?",
+                    (1 if path == winner else 0, s, s, s, s, h))
+            self._db.commit()
+
+    def _move(self, path: str) -> str:
+        os.makedirs(self.archive_dir, exist_ok=True)
+        dst = os.path.join(self.archive_dir, os.path.basename(path))
+        if os.path.exists(dst):
+            base, ext = os.path.splitext(dst)
+            dst = f"{base}_{int(time.time())}{ext}"
+        shutil.move(path, dst)
+        return dst
+
+    def archive(self, h: str):
+        row = self._row(h)
+        if not row or row["status"] != "live":
+            return
+        path = row["path"]
+        if os.path.exists(path):
+            path = self._move(path)
+        with self._lock:
+            self._db.execute("UPDATE candidates SET status='archived', path=?, archived_at=? WHERE hash=?",
+                             (path, time.time(), h))
+            self._db.commit()
+
+    def enforce(self, keep: Iterable[str] = ()) -> List[str]:
+        """Archive les perdants répétés puis les plus faibles au-delà de max_live; -> chemins archivés.
+        keep: chemins protégés pour cette fois (gagnant de l'A/B), ils occupent une place."""
+        protected = self.pinned | {os.path.abspath(p) for p in keep}
+        live = [r for r in self.live() if os.path.abspath(r["path"]) not in protected]
+        retired = []
+        if self.retire_after > 0:
+            for r in live:
+                if r["runs"] >= self.retire_after and r["wins"] == 0:
+                    retired.append(r)
+        rest = [r for r in live if r not in retired]
+        slots = self.max_live - (len(self.live()) - len(live))  # les candidats protégés occupent des places
+        if len(rest) > max(0, slots):
+            # jamais évalués d'abord (à laisser tenter leur chance), puis par moyenne, puis par date
+            rest.sort(key=lambda r: (r["runs"] == 0, r["score_sum"] / r["runs"] if r["runs"] else 0, r["created_at"]),
+                      reverse=True)
+            retired += rest[max(0, slots):]
+        for r in retired:
+            self.archive(r["hash"])
+        return [r["path"] for r in retired]
+
+    def close(self):
+        with self._lock:
+            self._db.close()
@@ -0,0 +1,109 @@
+import time
+import concurrent.futures
+from collections import deque, OrderedDict
+from typing import Callable, Dict, Iterable, Iterator, Tuple
+from urllib.parse import urlparse
+from .netpolicy import DNS, PinnedAdapter
+
+"""
+Crawler poli et concurrent:
+- une file par domaine, au plus une requête en vol par domaine
+- `rate_limit_per_domain` (req/min) et `max_pages_per_domain` appliqués domaine par domaine
+- les domaines différents sont récupérés en parallèle (plafond global `max_concurrency`)
+- une session HTTP partagée (pool de connexions keep-alive, DNS résolu d'avance et épinglé)
+Les résultats sont rendus au thread appelant, qui reste le seul à écrire dans le store.
+"""
+
+
+def make_session(sec: dict):
+    import requests
+    size = max(4, int(sec.get("max_concurrency", 8)))
+    DNS.configure(sec)
+    s = requests.Session()
+    # connexions ouvertes sur les IP déjà validées par le cache DNS
+    adapter = PinnedAdapter(sec.get("disallow_private_ips", True), pool_connections=size * 2, pool_maxsize=size)
+    s.mount("http://", adapter)
+    s.mount("https://", adapter)
+    s.headers["User-Agent"] = sec.get("user_agent", "SelfImprover/1.0")
+    return s
+
+
+def _domain(url: str) -> str:
+    try:
+        return urlparse(url).hostname or ""
+    except Exception:
+        return ""
+
+
+class PoliteCrawler:
+    def __init__(self, sec: dict, fetch: Callable[[str], Tuple[str, str]]):
+        # fetch(url) -> (texte, raison) ; texte vide = échec (ne compte pas dans le quota du domaine)
+        self.fetch = fetch
+        self.max_pages = int(sec.get("max_pages_per_domain", 5))
+        self.spacing = 60.0 / max(1, int(sec.get("rate_limit_per_domain", 6)))
+        self.max_workers = max(1, int(sec.get("max_concurrency", 8)))
+        self.stats = {"fetched": 0, "failed": 0, "skipped_quota": 0, "domains": 0, "reasons": {}}
+
+    def crawl(self, items: Iterable[Dict]) -> Iterator[Tuple[Dict, str, str]]:
+        """items: dicts avec au moins 'url'. Rend (item, texte, raison) au fil de l'eau."""
+        queues: "OrderedDict[str, deque]" = OrderedDict()
+        seen = set()
+        for it in items:
+            url = it.get("url")
+            if not url or url in seen:
+                continue
+            seen.add(url)
+            queues.setdefault(_domain(url), deque()).append(it)
+        self.stats["domains"] = len(queues)
+        DNS.prefetch(queues.keys())
+        done_count: Dict[str, int] = {}
+        next_at: Dict[str, float] = {}
+        busy = set()
+        inflight: Dict[concurrent.futures.Future, Tuple[str, Dict]] = {}
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers) as ex:
+            while queues or inflight:
+                now = time.time()
+                for domain in list(queues):
+                    if len(inflight) >= self.max_workers:
+                        break
+                    if domain in busy or next_at.get(domain, 0.0) > now:
+                        continue
+                    q = queues[domain]
+                    if done_count.get(domain, 0) >= self.max_pages:
+                        self.stats["skipped_quota"] += len(q)
+                        del queues[domain]
+                        continue
+                    it = q.popleft()
+                    if not q:
+                        del queues[domain]
+                    busy.add(domain)
+                    next_at[domain] = now + self.spacing
+                    inflight[ex.submit(self.fetch, it["url"])] = (domain, it)
+
+                if inflight:
+                    # se réveiller soit à la fin d'un fetch, soit quand un domaine redevient éligible
+                    waiting = [next_at.get(d, 0.0) for d in queues if d not in busy]
+                    if waiting and len(inflight) < self.max_workers:
+                        timeout = max(0.0, min(waiting) - time.time())
+                    else:
+                        timeout = None
+                    done, _ = concurrent.futures.wait(list(inflight), timeout=timeout, return_when=concurrent.futures.FIRST_COMPLETED)
+                    for fut in done:
+                        domain, it = inflight.pop(fut)
+                        busy.discard(domain)
+                        try:
+                            text, reason = fut.result()
+                        except Exception as e:
+                            text, reason = "", f"fetch_error:{e}"
+                        if text:
+                            done_count[domain] = done_count.get(domain, 0) + 1
+                            self.stats["fetched"] += 1
+                        else:
+                            self.stats["failed"] += 1
+                            key = reason.split(":", 1)[0]
+                            self.stats["reasons"][key] = self.stats["reasons"].get(key, 0) + 1
+                        yield it, text, reason
+                elif queues:
+                    wake = min(next_at.get(d, 0.0) for d in queues)
+                    time.sleep(max(0.0, min(wake - time.time(), self.spacing)))
@@ -0,0 +1,90 @@
+import time, asyncio
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Tuple
+
+"""
+Cycle du scheduler en graphe d'étapes (DAG) plutôt qu'en chaîne:
+- une étape déclare ce qu'elle lit (inputs) et ce qu'elle produit (outputs); elle dépend des étapes
+  placées avant elle qui produisent ses entrées (produite plus loin ou nulle part: état du cycle précédent,
+  ex. grow lit le prompt actif que promote réécrira)
+- les étapes prêtes tournent en même temps (au plus max_parallel), chacune avec son délai
+- une étape en échec ne bloque pas la suite (état du cycle précédent encore valable), c'est noté
+- résultat par étape (ok, durée, début relatif) + durée totale et chemin critique du cycle
+"""
+
+
+@dataclass
+class Stage:
+    name: str
+    script: str
+    inputs: Tuple[str, ...] = ()
+    outputs: Tuple[str, ...] = ()
+    when: Optional[Callable[[dict], bool]] = None  # condition sur la config (étape optionnelle)
+
+
+def dependencies(stages: List[Stage]) -> Dict[str, List[str]]:
+    """{étape: étapes précédentes dont elle lit une sortie} (arêtes vers l'arrière: jamais de cycle)."""
+    producers: Dict[str, List[str]] = {}
+    deps: Dict[str, List[str]] = {}
+    for s in stages:
+        if s.name in deps:
+            raise ValueError(f"étape en double: {s.name}")
+        deps[s.name] = sorted({p for i in s.inputs for p in producers.get(i, [])})
+        for o in s.outputs:
+            producers.setdefault(o, []).append(s.name)
+    return deps
+
+
+def critical_path(deps: Dict[str, List[str]], seconds: Dict[str, float]) -> Tuple[float, List[str]]:
+    """Plus long chemin (en durée) du graphe: borne basse de la durée d'un cycle."""
+    memo: Dict[str, Tuple[float, List[str]]] = {}
+
+    def longest(n):
+        if n not in memo:
+            best = max((longest(d) for d in deps[n]), default=(0.0, []), key=lambda x: x[0])
+            memo[n] = (best[0] + seconds.get(n, 0.0), best[1] + [n])
+        return memo[n]
+
+    return max((longest(n) for n in deps), default=(0.0, []), key=lambda x: x[0])
+
+
+async def run_stages(stages: List[Stage], run: Callable[[Stage], Tuple[bool, float, str]], cfg: dict,
+                     max_parallel: int = 0) -> Dict:
+    """Exécute le graphe; run(stage) -> (ok, secondes, sortie), appelé dans un thread."""
+    deps = dependencies(stages)
+    by_name = {s.name: s for s in stages}
+    results: Dict[str, Dict] = {}
+    sem = asyncio.Semaphore(max_parallel) if max_parallel and max_parallel > 0 else None
+    tasks: Dict[str, asyncio.Task] = {}
+    t0 = time.perf_counter()
+
+    async def one(name):
+        if deps[name]:
+            await asyncio.gather(*(tasks[d] for d in deps[name]))
+        stage = by_name[name]
+        failed = [d for d in deps[name] if not results[d]["ok"]]
+        if stage.when is not None and not stage.when(cfg):
+            results[name] = {"ok": True, "status": "skipped", "seconds": 0.0,
+                             "start": round(time.perf_counter() - t0, 2), "deps_failed": failed}
+            return
+        if sem is not None:
+            await sem.acquire()
+        start = time.perf_counter() - t0
+        try:
+            ok, seconds, out = await asyncio.to_thread(run, stage)
+            status = "ok" if ok else ("timeout" if out.startswith("[timeout]") else "failed")
+        except Exception as e:
+            ok, seconds, status = False, time.perf_counter() - t0 - start, f"error: {e}"
+        finally:
+            if sem is not None:
+                sem.release()
+        results[name] = {"ok": ok, "status": status, "seconds": round(seconds, 2), "start": round(start, 2),
+                         "deps_failed": failed}
+
+    for s in stages:
+        tasks[s.name] = asyncio.ensure_future(one(s.name))
+    await asyncio.gather(*tasks.values())
+    wall = time.perf_counter() - t0
+    cp, path = critical_path(deps, {n: r["seconds"] for n, r in results.items()})
+    return {"stages": {s.name: results[s.name] for s in stages}, "wall_seconds": round(wall, 2),
+            "critical_path_seconds": round(cp, 2), "critical_path": path}
@@ -0,0 +1,54 @@
+import os, concurrent.futures
+from .ratelimit import RateLimiter
+
+"""
+Réglages d'exécution partagés par evaluate.py et ab_test.py:
+nombre de workers (evaluation.parallel_workers), plafond de débit vers le provider
+et exécuteur des appels (pool local, ou file partagée avec scripts/eval_worker.py).
+Avec la file, le plafond est tenu dans la file elle-même (global à tous les processus).
+"""
+
+
+def parallel_workers(cfg: dict) -> int:
+    pw = (cfg.get("evaluation", {}) or {}).get("parallel_workers", "auto")
+    if isinstance(pw, str) and pw.lower() == "auto":
+        cpu = os.cpu_count() or 4
+        return max(1, min(cpu - 1, 24))
+    try:
+        return max(1, int(pw))
+    except (TypeError, ValueError):
+        return 4
+
+
+def llm_limiter(cfg: dict, root: str = "", queue=None):
+    """RateLimiter du processus, ou SharedRateLimiter (file) si evaluation.executor = queue
+    ou si queue est donnée (worker): rate_limit_rpm est alors un plafond global."""
+    # le provider dummy est local: pas de plafond
+    if (cfg.get("provider") or "dummy").lower() == "dummy":
+        return RateLimiter(0)
+    ev = cfg.get("evaluation", {}) or {}
+    rpm = float(ev.get("rate_limit_rpm", 0) or 0)
+    if rpm <= 0:
+        return RateLimiter(0)
+    if queue is None and (ev.get("executor") or "local").lower() != "queue":
+        return RateLimiter(rpm)
+    from .jobqueue import JobQueue, SharedRateLimiter
+    return SharedRateLimiter(queue or JobQueue.from_cfg(cfg, root), rpm)
+
+
+def evaluation_pool(cfg: dict, root: str, cell):
+    """Exécuteur pour ex.map(work, items): ThreadPoolExecutor local, ou QueueExecutor si
+    evaluation.executor = queue (cell(item) -> (prompt, test) décrit le travail pour les workers)."""
+    ev = cfg.get("evaluation", {}) or {}
+    if (ev.get("executor") or "local").lower() != "queue":
+        return concurrent.futures.ThreadPoolExecutor(max_workers=parallel_workers(cfg))
+    from .jobqueue import JobQueue, QueueExecutor
+    q = ev.get("queue", {}) or {}
+    local = q.get("local_workers", "auto")
+    return QueueExecutor(
+        JobQueue.from_cfg(cfg, root), cell, cfg.get("provider") or "dummy", cfg.get("model") or "",
+        local_workers=parallel_workers(cfg) if str(local).lower() == "auto" else int(local),
+        lease_seconds=float(q.get("lease_seconds", 120)),
+        poll_seconds=float(q.get("poll_seconds", 0.5)),
+        timeout_seconds=float(q.get("timeout_seconds", 0)),
+    )
@@ -0,0 +1,138 @@
+import re, codecs
+from typing import List, Optional
+from lxml import etree
+
+"""
+Extraction de texte HTML en flux (lxml HTMLPullParser):
+- le HTML est donné par morceaux pendant le téléchargement, décodé côté Python (décodeur incrémental,
+  octets invalides remplacés) -> libxml2 ne voit que de l'unicode
+- scripts/styles et blocs de navigation (nav, header, footer, aside, form...) sont ignorés
+- le texte est émis bloc par bloc (p, li, h1..., td...) puis l'élément est libéré
+- s'arrête dès que max_chars caractères ont été collectés -> le fetch peut couper le flux
+- charset inconnu (en-tête HTTP ou <meta> faux, codec non textuel): repli sur le suivant, puis utf-8
+"""
+
+SKIP_TAGS = {
+    "script", "style", "noscript", "template", "svg", "canvas", "iframe", "object",
+    "nav", "header", "footer", "aside", "form", "button", "select", "textarea",
+}
+BLOCK_TAGS = {
+    "title", "p", "div", "section", "article", "main", "body", "li", "dt", "dd",
+    "h1", "h2", "h3", "h4", "h5", "h6", "pre", "blockquote", "td", "th", "tr",
+    "table", "ul", "ol", "dl", "figcaption", "caption", "summary", "details",
+}
+
+_CHARSET = re.compile(rb"""<meta[^>]+charset\s*=\s*["']?\s*([A-Za-z0-9_.:-]+)""", re.I)
+
+
+def known_encoding(name: Optional[str]) -> Optional[str]:
+    """name si c'est un codec texte connu de Python, sinon None."""
+    if not name:
+        return None
+    try:
+        info = codecs.lookup(name)
+    except LookupError:
+        return None
+    # codecs octets -> octets (base64, hex...) écartés
+    return name if getattr(info, "_is_text_encoding", True) else None
+
+
+def sniff_encoding(head: bytes, declared: Optional[str] = None) -> str:
+    # charset HTTP explicite, sinon <meta charset>, sinon utf-8 (noms inconnus ignorés)
+    if known_encoding(declared):
+        return declared
+    m = _CHARSET.search(head[:4096])
+    return known_encoding(m.group(1).decode("ascii", "ignore") if m else None) or "utf-8"
+
+
+class TextExtractor:
+    def __init__(self, max_chars: int, encoding: str = "utf-8"):
+        self.max_chars = int(max_chars)
+        self.lines: List[str] = []
+        self.size = 0
+        self.done = False
+        self._skip = 0
+        self._decoder = codecs.getincrementaldecoder(known_encoding(encoding) or "utf-8")(errors="replace")
+        self._parser = etree.HTMLPullParser(
+            events=("start", "end"), remove_comments=True, remove_pis=True, no_network=True
+        )
+
+    def _emit(self, text: str):
+        for line in text.splitlines():
+            line = " ".join(line.split())
+            if line:
+                self.lines.append(line)
+                self.size += len(line) + 1
+        if self.size >= self.max_chars:
+            self.done = True
+
+    def _flush_before(self, el):
+        # texte du parent situé avant ce bloc: l'émettre maintenant pour garder l'ordre du document
+        parent = el.getparent()
+        if parent is None:
+            return
+        parts = [parent.text or ""]
+        before = []
+        for c in parent:
+            if c is el:
+                break
+            parts.append("".join(c.itertext()) + (c.tail or ""))
+            before.append(c)
+        parent.text = None
+        for c in before:
+            parent.remove(c)
+        self._emit("".join(parts))
+
+    def _drain(self):
+        for ev, el in self._parser.read_events():
+            if self.done:
+                return
+            tag = el.tag.lower() if isinstance(el.tag, str) else ""
+            if ev == "start":
+                if tag in SKIP_TAGS:
+                    self._skip += 1
+                elif tag in BLOCK_TAGS and self._skip == 0:
+                    self._flush_before(el)
+                continue
+            if tag in SKIP_TAGS:
+                self._skip = max(0, self._skip - 1)
+                el.clear(keep_tail=True)
+            elif tag in BLOCK_TAGS:
+                if self._skip == 0:
+                    self._emit("".join(el.itertext()))
+                # libère le sous-arbre; la queue (texte après le bloc) reste au parent
+                el.clear(keep_tail=True)
+
+    def feed(self, data: bytes) -> bool:
+        """Ajoute un morceau; renvoie True quand assez de texte a été collecté."""
+        if not self.done and data:
+            text = self._decoder.decode(data)
+            if text:
+                self._parser.feed(text)
+                self._drain()
+        return self.done
+
+    def close(self) -> str:
+        if not self.done:
+            try:
+                tail = self._decoder.decode(b"", final=True)
+                if tail:
+                    self._parser.feed(tail)
+                self._parser.close()
+            except Exception:
+                pass
+            self._drain()
+        return "\n".join(self.lines)[: self.max_chars]
+
+
+def extract_text(data: bytes, max_chars: int, encoding: Optional[str] = None, chunk_size: int = 65536) -> str:
+    ex = TextExtractor(max_chars, sniff_encoding(data, encoding))
+    for i in range(0, len(data), chunk_size):
+        if ex.feed(data[i:i + chunk_size]):
+            break
+    return ex.close()
+
+
+def plain_text(data: bytes, max_chars: int, encoding: Optional[str] = None) -> str:
+    text = data.decode(known_encoding(encoding) or "utf-8", errors="replace")
+    return "\n".join(t.strip() for t in text.splitlines() if t.strip())[:max_chars]
@@ -0,0 +1,137 @@
+import os, time, concurrent.futures
+from typing import Dict, List, Optional, Tuple
+import feedparser
+from .state_store import StateStore
+
+"""
+Suivi incrémental des flux RSS/Atom:
+- état par flux (table "feeds"): ETag / Last-Modified + identifiants d'entrées déjà vus
+- requête conditionnelle -> 304 = rien à parser
+- seules les entrées nouvelles sont renvoyées; les flux sont interrogés en parallèle
+- l'état n'est enregistré qu'après l'ingestion (commit), un cycle interrompu ne perd pas d'entrées
+- une entrée ne devient "vue" qu'une fois son URL traitée (done: stockée, refus définitif au fetch,
+  vue récemment par la frontière, page sans texte ou illisible);
+  quota de domaine, erreur passagère -> entrée reprise au passage suivant (validateurs du flux non
+  mis à jour, sinon un 304 la cacherait)
+"""
+
+
+def entry_id(entry) -> str:
+    return entry.get("id") or entry.get("guid") or entry.get("link") or ""
+
+
+class FeedPoller:
+    def __init__(self, store: StateStore, max_seen: int = 2000, workers: int = 8):
+        self.store = store
+        self.max_seen = int(max_seen)
+        self.workers = max(1, int(workers))
+        self._pending: Dict[str, Dict] = {}
+        self._fresh: Dict[str, Dict[str, str]] = {}  # flux -> {url de l'entrée: id}
+        self._done = set()
+        self.stats = {"feeds": 0, "not_modified": 0, "errors": 0, "entries": 0, "new_entries": 0}
+
+    @classmethod
+    def from_cfg(cls, cfg: dict, root: str = ""):
+        rag = cfg.get("rag", {}) or {}
+        rss = rag.get("rss", {}) or {}
+        path = rag.get("state_path", "data/ingest_state.sqlite")
+        if root and not os.path.isabs(path):
+            path = os.path.join(root, path)
+        return cls(StateStore(path, "feeds"), rss.get("max_seen_per_feed", 2000), rss.get("poll_workers", 8))
+
+    def _download(self, feed: str, st: Dict, sec: dict, session) -> Tuple[int, Optional[bytes], Dict]:
+        headers = {}
+        if st.get("etag"):
+            headers["If-None-Match"] = st["etag"]
+        if st.get("last_modified"):
+            headers["If-Modified-Since"] = st["last_modified"]
+        max_bytes = int(sec.get("max_bytes_per_page", 2000000))
+        r = session.get(feed, timeout=int(sec.get("timeout_seconds", 20)), headers=headers, stream=True)
+        try:
+            if r.status_code != 200:
+                return r.status_code, None, {}
+            body = bytearray()
+            for chunk in r.iter_content(65536):
+                body += chunk
+                if len(body) >= max_bytes:
+                    break
+            return 200, bytes(body), {k.lower(): v for k, v in r.headers.items()}
+        finally:
+            r.close()
+
+    def _poll_one(self, feed: str, st: Dict, sec: dict, session, limit: int) -> Tuple[str, List, Optional[Dict]]:
+        try:
+            status, body, headers = self._download(feed, st, sec, session)
+        except Exception:
+            return "error", [], None
+        if status == 304:
+            return "not_modified", [], None
+        if status != 200 or body is None:
+            return "error", [], None
+        d = feedparser.parse(body, response_headers={"content-location": feed, "content-type": headers.get("content-type", "")})
+        seen = st.get("seen") or []
+        seen_set = set(seen)
+        fresh = []
+        for entry in d.entries[:limit]:
+            eid = entry_id(entry)
+            if eid and eid not in seen_set and entry.get("link"):
+                fresh.append(entry)
+                seen_set.add(eid)
+        state = {
+            "etag": headers.get("etag") or "",
+            "last_modified": headers.get("last-modified") or "",
+            "seen": seen,  # nouvelles entrées ajoutées au commit, une fois traitées
+            "checked_at": time.time(),
+            "entries": len(d.entries),
+            "prev": {"etag": st.get("etag") or "", "last_modified": st.get("last_modified") or ""},
+        }
+        return "ok", fresh, state
+
+    def poll(self, feeds: List[str], limit_per_feed: int, sec: dict, session) -> List[Dict]:
+        """-> items {"url", "meta"} des entrées jamais vues (dans les limit_per_feed premières de chaque flux)."""
+        feeds = list(dict.fromkeys(feeds))
+        states = self.store.get_many(feeds)
+        items: List[Dict] = []
+        self.stats["feeds"] += len(feeds)
+        if not feeds:
+            return items
+        with concurrent.futures.ThreadPoolExecutor(max_workers=min(self.workers, len(feeds))) as ex:
+            futs = {ex.submit(self._poll_one, f, states.get(f) or {}, sec, session, limit_per_feed): f for f in feeds}
+            for fut in concurrent.futures.as_completed(futs):
+                feed = futs[fut]
+                status, entries, state = fut.result()
+                if status == "not_modified":
+                    self.stats["not_modified"] += 1
+                elif status == "error":
+                    self.stats["errors"] += 1
+                if state is not None:
+                    self.stats["entries"] += state["entries"]
+                    self._pending[feed] = state
+                    self._fresh[feed] = {e["link"]: entry_id(e) for e in entries}
+                self.stats["new_entries"] += len(entries)
+                for entry in entries:
+                    items.append({"url": entry["link"], "meta": {"title": entry.get("title"), "feed": feed}})
+        return items
+
+    def done(self, url: str):
+        """URL d'entrée traitée pour de bon (stockée, ou refus définitif): son entrée sera marquée vue."""
+        self._done.add(url)
+
+    def commit(self):
+        # après ingestion: ETag et entrées traitées deviennent l'état de référence
+        out = {}
+        for feed, state in self._pending.items():
+            state = dict(state)
+            prev = state.pop("prev")
+            fresh = self._fresh.get(feed, {})
+            handled = [eid for url, eid in fresh.items() if url in self._done]
+            state["seen"] = (handled + state["seen"])[: self.max_seen]
+            if len(handled) < len(fresh):
+                # entrées en attente: garder les anciens validateurs pour qu'elles soient reproposées
+                state.update(prev)
+            out[feed] = state
+        self.store.put_many(out)
+        self._pending, self._fresh, self._done = {}, {}, set()
+
+    def close(self):
+        self.store.close()
@@ -0,0 +1,167 @@
+import re
+from typing import Dict, Optional, Tuple
+from urllib.parse import urlparse
+import requests
+from .extract import TextExtractor, sniff_encoding, plain_text
+from .frontier import content_hash
+from .netpolicy import DNS, RobotsCache
+
+"""
+Récupération d'une page web sous politique de sécurité (schémas, allow/block list,
+IP privées via le cache DNS, robots.txt via le cache persistant), partagée par le
+serveur (learn_from_web) et scripts/ingest.py.
+Le corps est lu en flux (type vérifié avant, budget d'octets, arrêt dès que le
+texte utile est collecté). Avec une frontière (UrlFrontier), les requêtes sont
+conditionnelles et une page inchangée n'est ni résumée ni stockée; une page changée
+n'est mémorisée qu'après son stockage (frontier.confirm côté appelant).
+"""
+
+
+def _get_domain(url: str) -> str:
+    try:
+        return urlparse(url).hostname or ""
+    except:
+        return ""
+
+def _is_private_ip(host: str) -> bool:
+    # résolution via le cache DNS partagé (les mêmes IP servent ensuite à la connexion)
+    return DNS.has_private(host)
+
+def _is_allowed_url(sec: dict, url: str) -> Tuple[bool, str]:
+    parsed = urlparse(url)
+    scheme = (parsed.scheme or '').lower()
+    host = (parsed.hostname or '').lower()
+    if scheme not in (sec.get("allowed_schemes") or ["http","https"]):
+        return False, f"scheme_not_allowed:{scheme}"
+    if not host:
+        return False, "no_host"
+    # block list
+    for bd in (sec.get("block_domains") or []):
+        if host == bd.lower() or host.endswith("."+bd.lower()):
+            return False, f"blocked_domain:{host}"
+    # allow list (if non-empty)
+    allow = [d.lower() for d in (sec.get("allow_domains") or [])]
+    if allow:
+        if not any(host == d or host.endswith("."+d) for d in allow):
+            return False, f"not_in_allowlist:{host}"
+    # private IPs
+    if sec.get("disallow_private_ips", True) and _is_private_ip(host):
+        return False, f"private_ip:{host}"
+    return True, "ok"
+
+_default_robots = RobotsCache()
+
+def _robots_allowed(sec: dict, url: str, ua: str, session=None, robots: RobotsCache = None) -> bool:
+    if not sec.get("respect_robots", True):
+        return True
+    return (robots or _default_robots).allowed(url, ua, session, timeout=int(sec.get("timeout_seconds", 20)))
+
+def _content_type(r) -> Tuple[str, str]:
+    raw = r.headers.get("Content-Type") or ""
+    ctype = raw.split(";")[0].strip().lower()
+    m = re.search(r"charset=([\w.:-]+)", raw, re.I)
+    return ctype, (m.group(1) if m else None)
+
+def _open(url: str, sec: dict, session, frontier, robots):
+    """Contrôles de politique + requête (conditionnelle) en flux.
+    Renvoie (réponse, ctype, charset, raison); réponse None si rien à lire."""
+    ok, reason = _is_allowed_url(sec, url)
+    if not ok:
+        return None, "", None, reason
+    ua = sec.get("user_agent", "SelfImprover/1.0")
+    if not _robots_allowed(sec, url, ua, session, robots):
+        return None, "", None, "robots_disallow"
+    headers = {"User-Agent": ua}
+    if frontier is not None:
+        headers.update(frontier.conditional_headers(url))
+    r = (session or requests).get(url, timeout=int(sec.get("timeout_seconds", 20)), headers=headers, stream=True)
+    if r.status_code == 304:
+        r.close()
+        if frontier is not None:
+            frontier.record(url, "not_modified")
+        return None, "", None, "not_modified"
+    try:
+        r.raise_for_status()
+    except Exception:
+        r.close()
+        raise
+    # type vérifié avant de lire le corps
+    ctype, charset = _content_type(r)
+    allowed = sec.get("allowed_content_types") or ["text/html", "application/xhtml+xml", "text/plain"]
+    if ctype and ctype not in allowed:
+        r.close()
+        return None, ctype, charset, f"content_type:{ctype}"
+    return r, ctype, charset, "ok"
+
+def _finish(url: str, r, chash: str, frontier, kind: str) -> bool:
+    # True si le contenu est identique au dernier passage (pas de 304 côté serveur);
+    # kind: "text" (fetch_page) ou "raw" (fetch_raw), chaque chemin compare à son propre hash
+    etag, last_modified = r.headers.get("ETag"), r.headers.get("Last-Modified")
+    if frontier is None:
+        return False
+    if frontier.is_same_content(url, chash, kind):
+        frontier.record(url, "unchanged", etag, last_modified, chash, kind)
+        return True
+    frontier.stage(url, etag, last_modified, chash, kind)
+    return False
+
+def fetch_page(url: str, sec: dict, session=None, frontier=None, robots=None) -> Tuple[str, str]:
+    # returns (text_or_error, reason_or_ok)
+    max_chars = int(sec.get("max_chars_per_page", 20000))
+    max_bytes = int(sec.get("max_bytes_per_page", 2000000))
+    try:
+        r, ctype, charset, reason = _open(url, sec, session, frontier, robots)
+        if r is None:
+            return "", reason
+        with r:
+            # lecture en flux: on s'arrête au budget d'octets ou dès qu'il y a assez de texte
+            size = 0
+            if ctype == "text/plain":
+                buf = bytearray()
+                for chunk in r.iter_content(65536):
+                    buf += chunk
+                    size += len(chunk)
+                    if size >= max_bytes or len(buf) >= max_chars * 4:
+                        break
+                text = plain_text(bytes(buf), max_chars, charset)
+            else:
+                ex = None
+                for chunk in r.iter_content(65536):
+                    if ex is None:
+                        ex = TextExtractor(max_chars, sniff_encoding(chunk, charset))
+                    size += len(chunk)
+                    if ex.feed(chunk) or size >= max_bytes:
+                        break
+                text = ex.close() if ex is not None else ""
+            # hash du texte extrait (ce qui est stocké), pas du préfixe lu avant l'arrêt anticipé
+            if _finish(url, r, content_hash(text.encode("utf-8")), frontier, "text"):
+                return "", "unchanged"
+        return text, "ok"
+    except Exception as e:
+        if frontier is not None:
+            frontier.record(url, "error")
+        return "", f"fetch_error:{e}"
+
+def fetch_raw(url: str, sec: dict, session=None, frontier=None, robots=None) -> Tuple[Optional[Dict], str]:
+    """Variante I/O seule pour le pipeline d'ingestion: corps brut (plafonné à max_bytes_per_page),
+    le parsing est fait ailleurs. Une page inchangée n'est pas renvoyée (ni parsée ni résumée)."""
+    max_bytes = int(sec.get("max_bytes_per_page", 2000000))
+    try:
+        r, ctype, charset, reason = _open(url, sec, session, frontier, robots)
+        if r is None:
+            return None, reason
+        with r:
+            buf = bytearray()
+            for chunk in r.iter_content(65536):
+                buf += chunk
+                if len(buf) >= max_bytes:
+                    del buf[max_bytes:]
+                    break
+            body = bytes(buf)
+            if _finish(url, r, content_hash(body), frontier, "raw"):
+                return None, "unchanged"
+        return {"body": body, "ctype": ctype, "charset": charset}, "ok"
+    except Exception as e:
+        if frontier is not None:
+            frontier.record(url, "error")
+        return None, f"fetch_error:{e}"
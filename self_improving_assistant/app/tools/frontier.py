@@ -0,0 +1,113 @@
+import os, time, hashlib, threading
+from typing import Dict, List, Tuple
+from .state_store import StateStore
+
+"""
+Frontière d'URL persistante: ce que l'on sait de chaque URL déjà visitée
+(ETag, Last-Modified, hash du contenu, date du dernier fetch).
+- les fetchs envoient If-None-Match / If-Modified-Since
+- une URL vue récemment inchangée n'est pas re-téléchargée; l'intervalle de
+  re-vérification double à chaque passage inchangé (plafonné à max_recheck_hours)
+- un contenu nouveau n'est mémorisé (validateurs, hash) qu'une fois la page stockée (stage puis confirm):
+  un stockage raté -> pas de 304 / "unchanged" au passage suivant, la page est reprise
+- deux hash par URL, jamais comparés entre eux: "raw" (corps brut, scripts/ingest.py) et "text"
+  (texte extrait, fetch_page du serveur, qui coupe le flux avant la fin du corps)
+"""
+
+# champ de l'état d'une URL pour chaque sorte de hash
+HASH_FIELDS = {"raw": "content_hash", "text": "text_hash"}
+
+
+def content_hash(body: bytes) -> str:
+    return hashlib.sha1(body or b"").hexdigest()
+
+
+class UrlFrontier:
+    def __init__(self, path: str, recheck_minutes: float = 360, max_recheck_hours: float = 72):
+        self.store = StateStore(path, "url_frontier")
+        self.recheck = float(recheck_minutes) * 60
+        self.max_recheck = float(max_recheck_hours) * 3600
+        self.stats = {"skipped_fresh": 0, "not_modified": 0, "unchanged": 0, "changed": 0}
+        self._pending: Dict[str, Tuple] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_cfg(cls, cfg: dict, root: str = ""):
+        rag = cfg.get("rag", {}) or {}
+        fr = rag.get("frontier", {}) or {}
+        if not fr.get("enabled", True):
+            return None
+        path = rag.get("state_path", "data/ingest_state.sqlite")
+        if root and not os.path.isabs(path):
+            path = os.path.join(root, path)
+        return cls(path, fr.get("recheck_minutes", 360), fr.get("max_recheck_hours", 72))
+
+    def _due_in(self, st: Dict) -> float:
+        streak = int(st.get("unchanged_streak", 0))
+        return min(self.recheck * (2 ** min(streak, 10)), self.max_recheck)
+
+    def partition(self, items: List[Dict]) -> Tuple[List[Dict], List[Dict]]:
+        """Sépare les items à (re)visiter de ceux vus récemment sans changement."""
+        known = self.store.get_many(it["url"] for it in items if it.get("url"))
+        now = time.time()
+        due, fresh = [], []
+        for it in items:
+            st = known.get(it.get("url"))
+            if st and st.get("status") in ("changed", "unchanged") and now - float(st.get("checked_at", 0)) < self._due_in(st):
+                fresh.append(it)
+            else:
+                due.append(it)
+        self.stats["skipped_fresh"] += len(fresh)
+        return due, fresh
+
+    def conditional_headers(self, url: str) -> Dict[str, str]:
+        st = self.store.get(url) or {}
+        h = {}
+        if st.get("etag"):
+            h["If-None-Match"] = st["etag"]
+        if st.get("last_modified"):
+            h["If-Modified-Since"] = st["last_modified"]
+        return h
+
+    def record(self, url: str, status: str, etag: str = None, last_modified: str = None, chash: str = None,
+               kind: str = "raw") -> None:
+        # status: changed | unchanged | not_modified | error; kind: sorte de chash (HASH_FIELDS)
+        st = self.store.get(url) or {}
+        now = time.time()
+        st["checked_at"] = now
+        if status == "error":
+            st["status"] = "error"
+            st["errors"] = int(st.get("errors", 0)) + 1
+        else:
+            if status == "changed":
+                st["unchanged_streak"] = 0
+                st["fetched_at"] = now
+                st[HASH_FIELDS[kind]] = chash
+            else:
+                st["unchanged_streak"] = int(st.get("unchanged_streak", 0)) + 1
+            st["status"] = "changed" if status == "changed" else "unchanged"
+            st["errors"] = 0
+            if etag:
+                st["etag"] = etag
+            if last_modified:
+                st["last_modified"] = last_modified
+        if status in self.stats:
+            self.stats[status] += 1
+        self.store.put(url, st)
+
+    def stage(self, url: str, etag: str = None, last_modified: str = None, chash: str = None,
+              kind: str = "raw") -> None:
+        """Contenu nouveau téléchargé, pas encore stocké: rien n'est écrit avant confirm(url)."""
+        with self._lock:
+            self._pending[url] = (etag, last_modified, chash, kind)
+
+    def confirm(self, url: str) -> None:
+        """Page stockée: ses validateurs et son hash deviennent la référence."""
+        with self._lock:
+            pending = self._pending.pop(url, None)
+        if pending is not None:
+            self.record(url, "changed", *pending)
+
+    def is_same_content(self, url: str, chash: str, kind: str = "raw") -> bool:
+        st = self.store.get(url) or {}
+        return bool(chash) and st.get(HASH_FIELDS[kind]) == chash
@@ -0,0 +1,282 @@
+import os, json, time, uuid, hashlib, sqlite3, threading, concurrent.futures
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+"""
+File de travaux d'évaluation (SQLite, WAL) partagée entre un coordinateur et des workers
+(scripts/eval_worker.py) sur la même machine:
+- une seule machine: le WAL passe par une mémoire partagée (fichier -shm) et les verrous SQLite
+  ne sont pas fiables sur un partage réseau (NFS, SMB); jamais de file sur un disque réseau
+- un travail = une cellule (prompt, test) d'un lot; le prompt est stocké une fois (table prompts)
+- un worker réserve des travaux avec un bail (lease); bail expiré (worker planté) -> le travail
+  redevient disponible, au plus max_attempts fois, puis il est marqué failed
+- le premier résultat écrit gagne; le coordinateur lit les réponses puis purge le lot
+- plafond de débit global (table rate): un créneau par appel LLM réservé dans la file, partagé
+  par le coordinateur et tous les workers (rate_limit_rpm vaut pour l'ensemble, pas par processus)
+"""
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    batch TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    worker TEXT,
+    lease_until REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    result TEXT,
+    error TEXT,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs(status, lease_until);
+CREATE INDEX IF NOT EXISTS jobs_batch ON jobs(batch, status);
+CREATE TABLE IF NOT EXISTS prompts (hash TEXT PRIMARY KEY, text TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS rate (name TEXT PRIMARY KEY, next_at REAL NOT NULL);
+"""
+
+
+class JobQueue:
+    def __init__(self, path: str, max_attempts: int = 3):
+        self.path = path
+        self.max_attempts = max(1, int(max_attempts))
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(SCHEMA)
+
+    @classmethod
+    def from_cfg(cls, cfg: dict, root: str = ""):
+        q = (cfg.get("evaluation", {}) or {}).get("queue", {}) or {}
+        path = q.get("path", "data/eval_queue.sqlite")
+        if root and not os.path.isabs(path):
+            path = os.path.join(root, path)
+        return cls(path, int(q.get("max_attempts", 3)))
+
+    def _tx(self, fn):
+        # BEGIN IMMEDIATE: un seul écrivain à la fois entre processus (réservation atomique)
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                out = fn(self._db)
+                self._db.execute("COMMIT")
+                return out
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+
+    # -- coordinateur -------------------------------------------------------------
+
+    def add_prompt(self, text: str) -> str:
+        h = hashlib.sha256(text.encode("utf-8", errors="ignore")).hexdigest()[:20]
+        self._tx(lambda db: db.execute("INSERT OR IGNORE INTO prompts (hash, text) VALUES (?,?)", (h, text)))
+        return h
+
+    def submit(self, batch: str, payloads: Iterable[Dict]) -> List[int]:
+        now = time.time()
+
+        def fn(db):
+            ids = []
+            for p in payloads:
+                cur = db.execute("INSERT INTO jobs (batch, payload, updated_at) VALUES (?,?,?)",
+                                 (batch, json.dumps(p, ensure_ascii=False), now))
+                ids.append(cur.lastrowid)
+            return ids
+        return self._tx(fn)
+
+    def progress(self, batch: Optional[str] = None) -> Dict[str, int]:
+        sql = "SELECT status, COUNT(*) FROM jobs" + (" WHERE batch=?" if batch else "") + " GROUP BY status"
+        with self._lock:
+            rows = self._db.execute(sql, (batch,) if batch else ()).fetchall()
+        out = {"pending": 0, "leased": 0, "done": 0, "failed": 0}
+        out.update(dict(rows))
+        return out
+
+    def results(self, batch: str) -> Dict[int, Tuple[str, Optional[Dict], str]]:
+        """{job_id: (status, résultat, erreur)} pour les travaux terminés (done / failed)."""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT id, status, result, error FROM jobs WHERE batch=? AND status IN ('done','failed')", (batch,)
+            ).fetchall()
+        return {i: (s, json.loads(r) if r else None, e or "") for i, s, r, e in rows}
+
+    def cancel(self, ids: Sequence[int]):
+        self._tx(lambda db: db.executemany(
+            "UPDATE jobs SET status='failed', error='cancelled', updated_at=? WHERE id=? AND status IN ('pending','leased')",
+            [(time.time(), i) for i in ids]))
+
+    def purge(self, batch: str):
+        self._tx(lambda db: db.execute("DELETE FROM jobs WHERE batch=?", (batch,)))
+
+    def reserve_slot(self, name: str, spacing: float) -> float:
+        """Réserve le prochain créneau d'appel de name (horloge murale, commune aux processus de la machine)."""
+        now = time.time()
+
+        def fn(db):
+            row = db.execute("SELECT next_at FROM rate WHERE name=?", (name,)).fetchone()
+            slot = max(now, row[0]) if row else now
+            db.execute("INSERT OR REPLACE INTO rate (name, next_at) VALUES (?,?)", (name, slot + spacing))
+            return slot
+        return self._tx(fn)
+
+    # -- workers ------------------------------------------------------------------
+
+    def prompt(self, h: str) -> str:
+        with self._lock:
+            row = self._db.execute("SELECT text FROM prompts WHERE hash=?", (h,)).fetchone()
+        return row[0] if row else ""
+
+    def claim(self, worker: str, n: int = 1, lease_seconds: float = 120, batch: Optional[str] = None) -> List[Tuple[int, Dict]]:
+        """Réserve jusqu'à n travaux (en attente, ou bail expiré) pour worker."""
+        now = time.time()
+
+        def fn(db):
+            # bail expiré trop souvent: abandon
+            db.execute("UPDATE jobs SET status='failed', error='lease expired', updated_at=? "
+                       "WHERE status='leased' AND lease_until < ? AND attempts >= ?", (now, now, self.max_attempts))
+            sql = ("SELECT id, payload FROM jobs WHERE (status='pending' OR (status='leased' AND lease_until < ?))"
+                   + (" AND batch=?" if batch else "") + " ORDER BY id LIMIT ?")
+            args = (now, batch, n) if batch else (now, n)
+            rows = db.execute(sql, args).fetchall()
+            db.executemany(
+                "UPDATE jobs SET status='leased', worker=?, lease_until=?, attempts=attempts+1, updated_at=? WHERE id=?",
+                [(worker, now + lease_seconds, now, i) for i, _ in rows])
+            return [(i, json.loads(p)) for i, p in rows]
+        return self._tx(fn)
+
+    def extend(self, ids: Sequence[int], worker: str, lease_seconds: float = 120):
+        until = time.time() + lease_seconds
+        self._tx(lambda db: db.executemany(
+            "UPDATE jobs SET lease_until=? WHERE id=? AND worker=? AND status='leased'",
+            [(until, i, worker) for i in ids]))
+
+    def complete(self, job_id: int, worker: str, result: Dict):
+        # premier résultat gagnant (un worker dont le bail a expiré peut encore finir)
+        self._tx(lambda db: db.execute(
+            "UPDATE jobs SET status='done', worker=?, result=?, updated_at=? WHERE id=? AND status!='done'",
+            (worker, json.dumps(result, ensure_ascii=False), time.time(), job_id)))
+
+    def fail(self, job_id: int, worker: str, error: str):
+        def fn(db):
+            db.execute(
+                "UPDATE jobs SET status=CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, "
+                "error=?, lease_until=NULL, updated_at=? WHERE id=? AND worker=? AND status='leased'",
+                (self.max_attempts, error[:500], time.time(), job_id, worker))
+        self._tx(fn)
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+class SharedRateLimiter:
+    """Même usage que RateLimiter (wait()), créneaux réservés dans la file: plafond commun
+    au coordinateur et à tous les workers."""
+
+    def __init__(self, queue: JobQueue, rpm: float, name: str = "llm"):
+        self.queue = queue
+        self.name = name
+        self.spacing = 60.0 / float(rpm) if rpm and float(rpm) > 0 else 0.0
+
+    def wait(self):
+        if not self.spacing:
+            return
+        delay = self.queue.reserve_slot(self.name, self.spacing) - time.time()
+        if delay > 0:
+            time.sleep(delay)
+
+
+def worker_id() -> str:
+    return f"{os.uname().nodename if hasattr(os, 'uname') else 'host'}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+
+
+class QueueExecutor:
+    """Même usage qu'un ThreadPoolExecutor pour evaluate / ab_test / promote: map(fn, items).
+    Chaque item devient un travail (cell(item) -> (prompt, test)); les workers externes appellent
+    le LLM, et local_workers threads du coordinateur prennent aussi des travaux du lot (fn(item)).
+    Après timeout_seconds, les travaux restants sont annulés et faits localement."""
+
+    def __init__(self, queue: JobQueue, cell: Callable, provider: str, model: str, local_workers: int = 0,
+                 lease_seconds: float = 120, poll_seconds: float = 0.5, timeout_seconds: float = 0):
+        self.queue = queue
+        self.cell = cell
+        self.provider = provider
+        self.model = model
+        self.local_workers = max(0, int(local_workers))
+        self.lease = float(lease_seconds)
+        self.poll = float(poll_seconds)
+        self.timeout = float(timeout_seconds)
+        self.worker = worker_id()
+        self.stats = {"jobs": 0, "remote": 0, "local": 0, "failed": 0}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.queue.close()
+
+    def map(self, fn: Callable, items: Iterable) -> List:
+        items = list(items)
+        if not items:
+            return []
+        batch = uuid.uuid4().hex
+        payloads, hashes = [], {}
+        for k, it in enumerate(items):
+            prompt, test = self.cell(it)
+            if prompt not in hashes:
+                hashes[prompt] = self.queue.add_prompt(prompt)
+            payloads.append({"index": k, "prompt": hashes[prompt], "test": test,
+                             "provider": self.provider, "model": self.model})
+        ids = self.queue.submit(batch, payloads)
+        index = {i: k for k, i in enumerate(ids)}
+        out: Dict[int, str] = {}
+        stop = threading.Event()
+
+        def helper():
+            while not stop.is_set():
+                jobs = self.queue.claim(self.worker, 1, self.lease, batch=batch)
+                if not jobs:
+                    stop.wait(self.poll)  # travaux en cours ailleurs: un bail peut encore expirer
+                    continue
+                for job_id, _ in jobs:
+                    try:
+                        self.queue.complete(job_id, self.worker, {"answer": fn(items[index[job_id]]), "local": True})
+                    except Exception as e:
+                        self.queue.fail(job_id, self.worker, str(e))
+
+        helpers = [threading.Thread(target=helper, daemon=True) for _ in range(self.local_workers)]
+        for h in helpers:
+            h.start()
+        deadline = time.time() + self.timeout if self.timeout else 0
+        try:
+            while len(out) < len(ids):
+                for job_id, (status, result, error) in self.queue.results(batch).items():
+                    k = index[job_id]
+                    if k in out:
+                        continue
+                    if status == "done":
+                        out[k] = (result or {}).get("answer", "")
+                        self.stats["local" if (result or {}).get("local") else "remote"] += 1
+                    else:
+                        out[k] = None  # refait localement ci-dessous
+                if len(out) >= len(ids):
+                    break
+                if deadline and time.time() > deadline:
+                    self.queue.cancel([i for i in ids if index[i] not in out])
+                    break
+                time.sleep(self.poll)
+        finally:
+            stop.set()
+            for h in helpers:
+                h.join()
+        # travaux en échec ou non terminés à temps: faits ici
+        missing = [k for k in range(len(items)) if out.get(k) is None]
+        self.stats["jobs"] += len(items)
+        self.stats["failed"] += len(missing)
+        if missing:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, self.local_workers)) as ex:
+                for k, ans in zip(missing, ex.map(fn, [items[k] for k in missing])):
+                    out[k] = ans
+        self.queue.purge(batch)
+        return [out[k] for k in range(len(items))]
@@ -0,0 +1,212 @@
+import os, re, json, hashlib, threading, concurrent.futures
+from typing import Dict, List, Optional, Sequence, Tuple
+import yaml
+from .state_store import StateStore
+from .ratelimit import RateLimiter
+from .ollama import ollama_settings, ollama_chat
+
+"""
+Notation LLM-as-judge selon tests/rubric.yaml (evaluation.judge_llm):
+- chaque critère noté 0-10 par le juge, score = moyenne pondérée par les poids de la rubrique, dans [0, 1]
+- plusieurs réponses par requête ('=== ITEM n ==='), réponse attendue en objets JSON par item
+- verdicts en cache (table "judge") par hash de (question, réponse, rubrique, modèle du juge)
+- requêtes en parallèle sous le rpm du juge
+- pas d'accès au juge (pas de clé) dès le départ: juge désactivé pour tout le run (mots-clés partout)
+- juge qui lâche en cours de run (erreurs répétées, item non noté): tout le run repasse aux mots-clés
+  (RunScorer: notes déjà données refaites par l'appelant), enregistré sous la signature sans juge;
+  jamais de mélange notes du juge / scores mots-clés dans une même matrice A/B ou paire du SPRT
+"""
+
+_OBJ = re.compile(r"\{[^{}]*\}")
+
+INSTRUCTIONS = (
+    "Tu es un évaluateur strict et impartial. Pour chaque item (question, mots-clés attendus, réponse), "
+    "note la réponse de 0 à 10 sur chaque critère:\n{criteria}\n"
+    "Réponds uniquement avec un objet JSON par item, sans texte autour, par exemple:\n"
+    '{{"item": 1, {example}}}'
+)
+
+MAX_FAILURES = 3  # requêtes en échec d'affilée avant de déclarer le juge hors service pour le run
+
+
+def load_rubric(path: str) -> Dict:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = yaml.safe_load(f) or {}
+    except OSError:
+        data = {}
+    weights = {k: float(v) for k, v in (data.get("weights") or {}).items() if float(v) > 0}
+    rules = data.get("rules") or {}
+    return {"weights": weights or {"accuracy": 1.0},
+            "rules": {k: (rules.get(k) or {}).get("description", "") for k in weights}}
+
+
+class LlmJudge:
+    def __init__(self, cfg: dict, rubric: Dict, store: Optional[StateStore] = None):
+        ev = cfg.get("evaluation", {}) or {}
+        j = ev.get("judge", {}) or {}
+        self.provider = (j.get("provider") or "openai").lower()
+        self.model = j.get("model") or ("gpt-4o-mini" if self.provider == "openai" else cfg.get("model") or "")
+        self.batch_size = max(1, int(j.get("batch_size", 8)))
+        self.max_answer = int(j.get("max_answer_chars", 2000))
+        self.concurrency = max(1, int(j.get("concurrency", 4)))
+        self.limiter = RateLimiter(float(j.get("rate_limit_rpm", 60)))
+        self.ollama = ollama_settings(cfg)
+        self.rubric = rubric
+        self.signature = hashlib.sha256(json.dumps([self.provider, self.model, rubric], sort_keys=True).encode("utf-8")).hexdigest()[:16]
+        self.store = store if j.get("cache", True) else None
+        self.stats = {"answers": 0, "cache_hits": 0, "llm_calls": 0, "judged": 0, "fallback": 0}
+        self._client = None
+        self._lock = threading.Lock()
+        self._failures = 0
+
+    @classmethod
+    def from_cfg(cls, cfg: dict, root: str = "") -> Optional["LlmJudge"]:
+        """None si evaluation.judge_llm est faux ou si le juge n'a pas d'accès (clé OpenAI)."""
+        ev = cfg.get("evaluation", {}) or {}
+        if not ev.get("judge_llm", False):
+            return None
+        provider = ((ev.get("judge", {}) or {}).get("provider") or "openai").lower()
+        if provider not in ("openai", "ollama") or (provider == "openai" and not os.getenv("OPENAI_API_KEY")):
+            print(f"Juge LLM indisponible ({provider}): tout le run est noté aux mots-clés.")
+            return None
+        paths = cfg.get("paths", {}) or {}
+        rubric_path = paths.get("rubric_file", "tests/rubric.yaml")
+        path = ev.get("score_cache_path", "data/eval_state.sqlite")
+        if root:
+            rubric_path = rubric_path if os.path.isabs(rubric_path) else os.path.join(root, rubric_path)
+            path = path if os.path.isabs(path) else os.path.join(root, path)
+        return cls(cfg, load_rubric(rubric_path), StateStore(path, "judge"))
+
+    def key(self, test: Dict, answer: str) -> str:
+        h = hashlib.sha256()
+        for part in (self.signature, test.get("question", ""), json.dumps(test.get("expected_keywords", []), ensure_ascii=False), answer):
+            h.update(part.encode("utf-8", errors="ignore"))
+            h.update(b"\0")
+        return h.hexdigest()
+
+    @property
+    def down(self) -> bool:
+        return self._failures >= MAX_FAILURES
+
+    def _system(self) -> str:
+        w = self.rubric["weights"]
+        criteria = "\n".join(f"- {k} (poids {w[k]}): {self.rubric['rules'].get(k, '')}" for k in w)
+        example = ", ".join(f'"{k}": 7' for k in w)
+        return INSTRUCTIONS.format(criteria=criteria, example=example)
+
+    def _chat(self, user: str) -> str:
+        with self._lock:
+            self.stats["llm_calls"] += 1
+            if self.provider == "openai" and self._client is None:
+                from openai import OpenAI
+                self._client = OpenAI()
+        self.limiter.wait()
+        messages = [{"role": "system", "content": self._system()}, {"role": "user", "content": user}]
+        if self.provider == "ollama":
+            return ollama_chat(self.ollama, self.model, messages, temperature=0)
+        resp = self._client.chat.completions.create(
+            model=self.model, messages=messages, temperature=0, max_tokens=60 + 40 * self.batch_size,
+        )
+        return (resp.choices[0].message.content or "").strip()
+
+    def _score(self, verdict: Dict) -> Optional[float]:
+        w = self.rubric["weights"]
+        try:
+            notes = {k: min(10.0, max(0.0, float(verdict[k]))) for k in w}
+        except (KeyError, TypeError, ValueError):
+            return None
+        return sum(w[k] * notes[k] for k in w) / (10.0 * sum(w.values()))
+
+    def _batch(self, items: List[Tuple[Dict, str]]) -> List[Optional[float]]:
+        if self.down:
+            return [None] * len(items)
+        body = "\n\n".join(
+            f"=== ITEM {i + 1} ===\nQuestion: {t.get('question', '')}\n"
+            f"Mots-clés attendus: {', '.join(t.get('expected_keywords', []))}\nRéponse: {a[: self.max_answer]}"
+            for i, (t, a) in enumerate(items)
+        )
+        try:
+            out = self._chat(body)
+        except Exception:
+            with self._lock:
+                self._failures += 1
+            return [None] * len(items)
+        with self._lock:
+            self._failures = 0
+        scores: Dict[int, float] = {}
+        for m in _OBJ.finditer(out):
+            try:
+                v = json.loads(m.group(0))
+                s = self._score(v)
+                if s is not None:
+                    scores[int(v.get("item", 0))] = s
+            except (ValueError, TypeError):
+                continue
+        res = [scores.get(i + 1) for i in range(len(items))]
+        # item absent ou mal formé dans une réponse groupée: on le refait seul
+        if len(items) > 1:
+            res = [r if r is not None else self._batch([it])[0] for r, it in zip(res, items)]
+        return res
+
+    def grade(self, tests: Sequence[Dict], answers: Sequence[str]) -> List[Optional[float]]:
+        """Scores [0, 1] alignés sur answers (None = pas de verdict)."""
+        keys = [self.key(t, a) for t, a in zip(tests, answers)]
+        cached = self.store.get_many(set(keys)) if self.store is not None else {}
+        self.stats["answers"] += len(keys)
+        results = {k: float(v["score"]) for k, v in cached.items()}
+        self.stats["cache_hits"] += sum(1 for k in keys if k in results)
+        todo: Dict[str, Tuple[Dict, str]] = {}
+        for k, t, a in zip(keys, tests, answers):
+            if k not in results:
+                todo.setdefault(k, (t, a))
+        if todo:
+            miss = list(todo)
+            groups = [miss[i:i + self.batch_size] for i in range(0, len(miss), self.batch_size)]
+            with concurrent.futures.ThreadPoolExecutor(max_workers=self.concurrency) as ex:
+                futs = {ex.submit(self._batch, [todo[k] for k in g]): g for g in groups}
+                for fut in concurrent.futures.as_completed(futs):
+                    for k, s in zip(futs[fut], fut.result()):
+                        if s is not None:
+                            results[k] = s
+            fresh = {k: {"score": results[k], "model": self.model} for k in miss if k in results}
+            if self.store is not None:
+                self.store.put_many(fresh)
+        out = [results.get(k) for k in keys]
+        self.stats["judged"] += sum(1 for s in out if s is not None)
+        self.stats["fallback"] += sum(1 for s in out if s is None)
+        return out
+
+    def close(self):
+        if self.store is not None:
+            self.store.close()
+
+
+class RunScorer:
+    """Notation d'un run entier à une seule échelle: verdicts du juge tant qu'il note toutes les réponses;
+    au premier trou, mots-clés pour tout le reste du run (fallen_back), et l'appelant refait aux mots-clés
+    (keywords) les notes du juge déjà données, cache des scores compris."""
+
+    def __init__(self, scorer, judge: Optional[LlmJudge]):
+        self.scorer = scorer
+        self.judge = judge
+        self.fallen_back = False
+
+    def keywords(self, tests: Sequence[Dict], answers: Sequence[str]) -> List[float]:
+        return [s for s, _ in self.scorer.score_many(answers, [t.get("expected_keywords", []) for t in tests])]
+
+    def score(self, tests: Sequence[Dict], answers: Sequence[str]) -> List[float]:
+        """Score par réponse: verdict du juge s'il est actif, sinon score mots-clés.
+        Un mot interdit met 0 dans tous les cas."""
+        kw = self.scorer.score_many(answers, [t.get("expected_keywords", []) for t in tests])
+        if self.judge is None:
+            return [s for s, _ in kw]
+        verdicts = self.judge.grade(tests, answers)
+        missing = sum(1 for (_, info), v in zip(kw, verdicts) if v is None and not info.get("fail"))
+        if missing:
+            print(f"ATTENTION: juge LLM indisponible en cours de run ({missing}/{len(answers)} réponses non notées): "
+                  "tout le run est noté aux mots-clés.")
+            self.judge = None
+            self.fallen_back = True
+            return [s for s, _ in kw]
+        return [0.0 if info.get("fail") else v for (_, info), v in zip(kw, verdicts)]
@@ -0,0 +1,231 @@
+import os, time, socket, asyncio, ipaddress, threading
+from typing import Dict, Iterable, List, Optional, Tuple
+from urllib.parse import urlparse
+from urllib import robotparser
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.exceptions import NewConnectionError, ConnectTimeoutError
+from urllib3.util import connection as u3conn
+from .state_store import StateStore
+
+"""
+Cache de politique réseau partagé par les fetchs d'ingestion:
+- DnsCache: résolutions mises en cache avec TTL; les IP validées (non privées) sont
+  celles utilisées pour ouvrir la connexion (PinnedAdapter) -> plus de fenêtre TOCTOU
+  entre la vérification et le connect, y compris sur les redirections
+- prefetch asynchrone des domaines avant un crawl
+- RobotsCache: règles robots.txt persistées sur disque avec expiration
+"""
+
+
+def is_private(ip: str) -> bool:
+    try:
+        return ipaddress.ip_address(ip).is_private
+    except ValueError:
+        return False
+
+
+class DnsCache:
+    def __init__(self, ttl_seconds: float = 300, negative_ttl_seconds: float = 30):
+        self.ttl = float(ttl_seconds)
+        self.negative_ttl = float(negative_ttl_seconds)
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Tuple[float, List[str]]] = {}
+        self._static: Dict[str, List[str]] = {}
+
+    def configure(self, sec: dict):
+        self.ttl = float(sec.get("dns_ttl_seconds", self.ttl))
+
+    def add_static(self, host: str, ips: List[str]):
+        # entrées fixes (ex: benchmarks hors-ligne) qui ne passent jamais par le DNS
+        self._static[host.lower()] = list(ips)
+
+    def _cached(self, host: str) -> Optional[List[str]]:
+        if host in self._static:
+            return self._static[host]
+        with self._lock:
+            hit = self._entries.get(host)
+        if hit and hit[0] > time.time():
+            return hit[1]
+        return None
+
+    def _store(self, host: str, ips: List[str]):
+        ttl = self.ttl if ips else self.negative_ttl
+        with self._lock:
+            self._entries[host] = (time.time() + ttl, ips)
+
+    @staticmethod
+    def _ips(infos) -> List[str]:
+        out = []
+        for _, _, _, _, sockaddr in infos:
+            if sockaddr[0] not in out:
+                out.append(sockaddr[0])
+        return out
+
+    def resolve(self, host: str) -> List[str]:
+        host = (host or "").lower().rstrip(".")
+        ips = self._cached(host)
+        if ips is not None:
+            return ips
+        try:
+            ips = self._ips(socket.getaddrinfo(host, None, proto=socket.IPPROTO_TCP))
+        except Exception:
+            ips = []
+        self._store(host, ips)
+        return ips
+
+    def prefetch(self, hosts: Iterable[str]):
+        """Résout en parallèle (asyncio) les hôtes absents du cache."""
+        todo = sorted({(h or "").lower().rstrip(".") for h in hosts} - {""})
+        todo = [h for h in todo if self._cached(h) is None]
+        if not todo:
+            return
+
+        async def _all():
+            loop = asyncio.get_running_loop()
+            res = await asyncio.gather(*(loop.getaddrinfo(h, None, proto=socket.IPPROTO_TCP) for h in todo), return_exceptions=True)
+            for h, r in zip(todo, res):
+                self._store(h, [] if isinstance(r, BaseException) else self._ips(r))
+
+        try:
+            asyncio.run(_all())
+        except RuntimeError:
+            # déjà dans une boucle asyncio: résolution simple
+            for h in todo:
+                self.resolve(h)
+
+    def has_private(self, host: str) -> bool:
+        return any(is_private(ip) for ip in self.resolve(host))
+
+
+DNS = DnsCache()
+
+
+class _PinnedMixin:
+    disallow_private = True
+
+    def _new_conn(self):
+        ips = DNS.resolve(self.host)
+        if not ips:
+            raise NewConnectionError(self, f"Failed to resolve {self.host}")
+        if self.disallow_private and any(is_private(ip) for ip in ips):
+            raise NewConnectionError(self, f"private_ip:{self.host}")
+        last = None
+        for ip in ips:
+            try:
+                return u3conn.create_connection(
+                    (ip, self.port),
+                    self.timeout,
+                    source_address=self.source_address,
+                    socket_options=self.socket_options,
+                )
+            except socket.timeout:
+                last = ConnectTimeoutError(self, f"Connection to {self.host} ({ip}) timed out. (connect timeout={self.timeout})")
+            except OSError as e:
+                last = NewConnectionError(self, f"Failed to establish a new connection: {e}")
+        raise last
+
+
+def _pinned_pools(disallow_private: bool) -> Dict[str, type]:
+    flag = {"disallow_private": bool(disallow_private)}
+    http_conn = type("PinnedHTTPConnection", (_PinnedMixin, HTTPConnection), flag)
+    https_conn = type("PinnedHTTPSConnection", (_PinnedMixin, HTTPSConnection), flag)
+    return {
+        "http": type("PinnedHTTPConnectionPool", (HTTPConnectionPool,), {"ConnectionCls": http_conn}),
+        "https": type("PinnedHTTPSConnectionPool", (HTTPSConnectionPool,), {"ConnectionCls": https_conn}),
+    }
+
+
+_POOLS = {True: _pinned_pools(True), False: _pinned_pools(False)}
+
+
+class PinnedAdapter(HTTPAdapter):
+    """Adapter requests qui connecte sur les IP du DnsCache (et refuse les IP privées si demandé)."""
+
+    def __init__(self, disallow_private: bool = True, **kw):
+        self.disallow_private = bool(disallow_private)
+        super().__init__(**kw)
+
+    def init_poolmanager(self, *args, **kw):
+        super().init_poolmanager(*args, **kw)
+        self.poolmanager.pool_classes_by_scheme = _POOLS[self.disallow_private]
+
+
+class RobotsCache:
+    def __init__(self, store: Optional[StateStore] = None, ttl_hours: float = 24, error_ttl_minutes: float = 30):
+        self.store = store
+        self.ttl = float(ttl_hours) * 3600
+        self.error_ttl = float(error_ttl_minutes) * 60
+        self._lock = threading.Lock()
+        self._mem: Dict[str, Tuple[float, Optional[robotparser.RobotFileParser]]] = {}
+        self.stats = {"memory": 0, "disk": 0, "fetched": 0}
+
+    @classmethod
+    def from_cfg(cls, cfg: dict, root: str = ""):
+        rag = cfg.get("rag", {}) or {}
+        sec = rag.get("security", {}) or {}
+        path = rag.get("state_path", "data/ingest_state.sqlite")
+        if root and not os.path.isabs(path):
+            path = os.path.join(root, path)
+        return cls(StateStore(path, "robots"), sec.get("robots_ttl_hours", 24), sec.get("robots_error_ttl_minutes", 30))
+
+    @staticmethod
+    def _parser(entry: Dict) -> Optional[robotparser.RobotFileParser]:
+        # None = pas de règles exploitables (robots absent ou erreur): autoriser
+        rp = robotparser.RobotFileParser()
+        if entry.get("status") == "disallow_all":
+            rp.disallow_all = True
+            return rp
+        if entry.get("status") != "ok":
+            return None
+        rp.parse((entry.get("body") or "").splitlines())
+        return rp
+
+    def _fetch(self, base: str, ua: str, session, timeout: float) -> Dict:
+        import requests
+        try:
+            r = (session or requests).get(base + "/robots.txt", timeout=timeout, headers={"User-Agent": ua})
+            if r.status_code in (401, 403):
+                return {"status": "disallow_all"}
+            if 400 <= r.status_code < 500:
+                return {"status": "missing"}
+            r.raise_for_status()
+            return {"status": "ok", "body": r.text[:500000]}
+        except Exception as e:
+            # si robots introuvable: prudence mais autoriser (réessayé après error_ttl)
+            return {"status": "error", "error": str(e)[:200]}
+
+    def _get(self, base: str, ua: str, session, timeout: float) -> Optional[robotparser.RobotFileParser]:
+        now = time.time()
+        with self._lock:
+            hit = self._mem.get(base)
+        if hit and hit[0] > now:
+            self.stats["memory"] += 1
+            return hit[1]
+        entry = self.store.get(base) if self.store is not None else None
+        if entry and float(entry.get("expires_at", 0)) > now:
+            self.stats["disk"] += 1
+        else:
+            entry = self._fetch(base, ua, session, timeout)
+            entry["fetched_at"] = now
+            entry["expires_at"] = now + (self.error_ttl if entry["status"] == "error" else self.ttl)
+            self.stats["fetched"] += 1
+            if self.store is not None:
+                self.store.put(base, entry)
+        rp = self._parser(entry)
+        with self._lock:
+            self._mem[base] = (float(entry["expires_at"]), rp)
+        return rp
+
+    def allowed(self, url: str, ua: str, session=None, timeout: float = 20) -> bool:
+        parsed = urlparse(url)
+        if not parsed.hostname:
+            return False
+        rp = self._get(f"{parsed.scheme}://{parsed.netloc}", ua, session, timeout)
+        if not rp:
+            return True
+        try:
+            return rp.can_fetch(ua, url)
+        except Exception:
+            return True
@@ -0,0 +1,95 @@
+import time
+from typing import Dict, List, Optional
+
+"""
+Accès partagé à Ollama (serveur, scripts d'évaluation/A-B):
+- base_url / keep_alive / num_ctx lus dans la section `ollama` de la config
+- warm-up: charge le modèle en mémoire avant une rafale d'appels
+- residency: indique si le modèle est encore chargé (GET /api/ps)
+"""
+
+DEFAULTS = {
+    "base_url": "http://localhost:11434",
+    "keep_alive": "30m",
+    "num_ctx": None,
+    "timeout_seconds": 60,
+    "warmup_timeout_seconds": 120,
+    "warmup": True,
+}
+
+
+def ollama_settings(cfg: Optional[dict]) -> Dict:
+    out = dict(DEFAULTS)
+    out.update({k: v for k, v in ((cfg or {}).get("ollama") or {}).items() if v is not None})
+    out["base_url"] = str(out["base_url"]).rstrip("/")
+    return out
+
+
+def _options(settings: Dict, temperature: float) -> Dict:
+    opts = {"temperature": temperature}
+    if settings.get("num_ctx"):
+        opts["num_ctx"] = int(settings["num_ctx"])
+    return opts
+
+
+def ollama_chat(settings: Dict, model: str, messages: List[Dict], temperature: float = 0.2) -> str:
+    import requests
+    payload = {
+        "model": model or "llama3",
+        "messages": messages,
+        "stream": False,
+        "keep_alive": settings.get("keep_alive"),
+        "options": _options(settings, temperature),
+    }
+    r = requests.post(f"{settings['base_url']}/api/chat", json=payload, timeout=int(settings.get("timeout_seconds", 60)))
+    r.raise_for_status()
+    data = r.json()
+    return (data.get("message", {}).get("content") or data.get("response") or "").strip()
+
+
+def warm_up(settings: Dict, model: str) -> Dict:
+    """Charge le modèle (requête vide) pour que le premier vrai appel ne paie pas le chargement."""
+    if not settings.get("warmup", True):
+        return {"ok": False, "skipped": True}
+    import requests
+    t0 = time.time()
+    try:
+        r = requests.post(
+            f"{settings['base_url']}/api/generate",
+            json={
+                "model": model or "llama3",
+                "prompt": "",
+                "stream": False,
+                "keep_alive": settings.get("keep_alive"),
+                "options": _options(settings, 0.0),
+            },
+            timeout=int(settings.get("warmup_timeout_seconds", 120)),
+        )
+        r.raise_for_status()
+        return {"ok": True, "seconds": round(time.time() - t0, 2)}
+    except Exception as e:
+        return {"ok": False, "error": str(e), "seconds": round(time.time() - t0, 2)}
+
+
+def residency(settings: Dict, model: str) -> Dict:
+    """État du modèle côté Ollama: chargé ou non, expiration du keep_alive, VRAM utilisée."""
+    import requests
+    model = model or "llama3"
+    try:
+        r = requests.get(f"{settings['base_url']}/api/ps", timeout=3)
+        r.raise_for_status()
+        loaded = r.json().get("models") or []
+    except Exception as e:
+        return {"reachable": False, "model": model, "loaded": False, "error": str(e)}
+    # Ollama renvoie "llama3:latest" quand la config dit "llama3"
+    wanted = {model, model if ":" in model else f"{model}:latest"}
+    for m in loaded:
+        if m.get("name") in wanted or m.get("model") in wanted:
+            return {
+                "reachable": True,
+                "model": model,
+                "loaded": True,
+                "expires_at": m.get("expires_at"),
+                "size_vram": m.get("size_vram"),
+            }
+    return {"reachable": True, "model": model, "loaded": False, "others": [m.get("name") for m in loaded]}
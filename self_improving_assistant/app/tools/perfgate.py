@@ -0,0 +1,99 @@
+import os, time
+from typing import Dict, List, Optional, Tuple
+from .state_store import StateStore
+
+"""
+Barrière de performance de self_update, à côté de la barrière de qualité (avg_score):
+- mesures: latence /ask, débit RAG (upsert / requêtes) via scripts/bench_perf.py, durée d'évaluation
+- référence: mesures de la base prises au même moment (bac à sable base), sinon dernière base mémorisée
+  (table perf de data/eval_state.sqlite)
+- mesure présente en référence mais absente côté patch (benchmark planté) -> patch rejeté
+- régression relative (ralentissement, ou débit perdu) au-delà de max_regression -> patch rejeté;
+  seuil propre à une mesure dans limits (la durée d'évaluation dépend du réseau du LLM)
+"""
+
+# sens de chaque mesure: "low" = plus petit est mieux (durées), "high" = débits
+METRICS = {
+    "ask_ms": "low",
+    "ask_rag_ms": "low",
+    "rag_upsert_per_s": "high",
+    "rag_query_per_s": "high",
+    "eval_wall_s": "low",
+}
+
+
+def regression(metric: str, ref: float, new: float) -> float:
+    """Ralentissement relatif de new par rapport à ref (> 0 = pire, 0.25 = 25 % plus lent)."""
+    if not ref or not new:
+        return 0.0
+    return new / ref - 1 if METRICS.get(metric) == "low" else ref / new - 1
+
+
+def best(runs: List[Dict[str, float]]) -> Dict[str, float]:
+    """Meilleure valeur de chaque mesure sur plusieurs tours (la moins bruitée)."""
+    out: Dict[str, float] = {}
+    for r in runs:
+        for k, v in r.items():
+            if v is None:
+                continue
+            better = min if METRICS.get(k) == "low" else max
+            out[k] = better(out[k], v) if k in out else v
+    return out
+
+
+class PerfGate:
+    def __init__(self, store: StateStore, max_regression: float = 0.25, limits: Optional[Dict[str, float]] = None):
+        self.store = store
+        self.max_regression = float(max_regression)
+        self.limits = {k: float(v) for k, v in (limits or {}).items()}
+
+    @classmethod
+    def from_cfg(cls, cfg: dict, root: str = "") -> Optional["PerfGate"]:
+        pg = (cfg.get("self_update", {}) or {}).get("perf_gate", {}) or {}
+        if not pg.get("enabled", True):
+            return None
+        path = (cfg.get("evaluation", {}) or {}).get("score_cache_path", "data/eval_state.sqlite")
+        if root and not os.path.isabs(path):
+            path = os.path.join(root, path)
+        return cls(StateStore(path, "perf"), pg.get("max_regression", 0.25), pg.get("limits"))
+
+    def baseline(self) -> Dict[str, float]:
+        return (self.store.get("baseline") or {}).get("metrics", {})
+
+    def record(self, metrics: Dict[str, float]):
+        """Mémorise les mesures de l'arbre vivant (base, ou patch accepté)."""
+        merged = dict(self.baseline(), **{k: v for k, v in metrics.items() if v is not None})
+        self.store.put("baseline", {"metrics": merged, "ts": time.time()})
+
+    def check(self, base: Dict[str, float], patch: Dict[str, float]) -> Tuple[bool, List[Dict]]:
+        """-> (accepté, lignes {metric, ref, source, new, delta, limit, ok}) pour chaque mesure connue.
+        Mesure de référence sans valeur côté patch: ligne en échec (new et delta None)."""
+        stored = self.baseline()
+        rows = []
+        for m in METRICS:
+            new = patch.get(m)
+            ref, source = (base[m], "base") if base.get(m) else (stored.get(m), "mémorisée")
+            if not ref:
+                continue
+            limit = self.limits.get(m, self.max_regression)
+            delta = regression(m, ref, new) if new else None
+            rows.append({"metric": m, "ref": ref, "source": source, "new": new, "delta": delta,
+                         "limit": limit, "ok": delta is not None and delta <= limit, "stored": stored.get(m)})
+        return all(r["ok"] for r in rows), rows
+
+    def close(self):
+        self.store.close()
+
+
+def report(rows: List[Dict]) -> str:
+    lines = []
+    for r in rows:
+        if r["new"] is None:
+            lines.append(f"{r['metric']:<17} réf {r['ref']:>10.3f} ({r['source']})  patch   manquante  RÉGRESSION")
+            continue
+        drift = ""
+        if r["stored"] and r["source"] == "base":
+            drift = f"  (mémorisée {r['stored']:.3f}, {regression(r['metric'], r['stored'], r['new']):+.1%})"
+        lines.append(f"{r['metric']:<17} réf {r['ref']:>10.3f} ({r['source']})  patch {r['new']:>10.3f}  "
+                     f"{r['delta']:+.1%} / max {r['limit']:.0%}  {'ok' if r['ok'] else 'RÉGRESSION'}{drift}")
+    return "\n".join(lines)
@@ -0,0 +1,177 @@
+import os, re, time, concurrent.futures
+from typing import Callable, Dict, Iterable, List, Optional
+from .extract import extract_text, plain_text
+
+"""
+Pipeline d'ingestion en 3 étages:
+1. fetch (I/O, threads du crawler) -> corps bruts
+2. parse + redact + chunk (CPU) dans un pool de processus; les motifs de
+   redaction sont compilés une seule fois par worker, en une seule regex
+3. un unique écrivain qui applique les résultats au store par lots
+Une page en erreur au parsing (ou sans texte) n'arrête pas le lot: elle est comptée
+et signalée à l'appelant (on_skip), les autres continuent.
+"""
+
+
+class Redactor:
+    """Toutes les redact_patterns en une regex (drapeaux globaux -> drapeaux locaux)."""
+
+    def __init__(self, patterns: List[str]):
+        valid = []
+        for p in patterns or []:
+            try:
+                re.compile(p)
+                valid.append(p)
+            except re.error:
+                continue
+        self.rx = None
+        self.each = []
+        if not valid:
+            return
+        parts = []
+        for p in valid:
+            m = re.match(r"^\(\?([aiLmsux]+)\)", p)
+            flags, body = (m.group(1), p[m.end():]) if m else ("", p)
+            local = "".join(c for c in flags if c in "imsx")
+            parts.append(f"(?{local}:{body})" if local else f"(?:{body})")
+        try:
+            self.rx = re.compile("|".join(parts))
+        except re.error:
+            # motifs non combinables (références arrière...): compilés séparément
+            self.each = [re.compile(p) for p in valid]
+
+    def __call__(self, text: str) -> str:
+        if self.rx is not None:
+            return self.rx.sub("[REDACTED]", text)
+        for rx in self.each:
+            text = rx.sub("[REDACTED]", text)
+        return text
+
+
+def split_chunks(text: str, max_tokens: int = 800) -> List[str]:
+    # split naive par paragraphes/phrases, approx tokens=words
+    words = text.split()
+    chunks = []
+    for i in range(0, len(words), max_tokens):
+        chunk = " ".join(words[i:i+max_tokens])
+        if chunk:
+            chunks.append(chunk)
+    return chunks
+
+
+_worker: Dict = {}
+
+
+def init_worker(patterns: List[str], max_chars: int, chunk_tokens: int = 800):
+    _worker["redact"] = Redactor(patterns)
+    _worker["max_chars"] = int(max_chars)
+    _worker["chunk_tokens"] = int(chunk_tokens)
+
+
+def process_page(job: Dict) -> Dict:
+    """Étage CPU: job = {url, meta, body, ctype, charset} -> {url, meta, text, chunks, parse_ms}."""
+    t0 = time.perf_counter()
+    max_chars = _worker["max_chars"]
+    if job.get("ctype") == "text/plain":
+        text = plain_text(job["body"], max_chars, job.get("charset"))
+    else:
+        text = extract_text(job["body"], max_chars, job.get("charset"))
+    text = _worker["redact"](text)
+    return {
+        "url": job["url"],
+        "meta": job.get("meta") or {},
+        "text": text,
+        "chunks": split_chunks(text, _worker["chunk_tokens"]),
+        "parse_ms": (time.perf_counter() - t0) * 1000,
+    }
+
+
+def cpu_workers(cfg: dict) -> int:
+    pw = ((cfg.get("rag", {}) or {}).get("pipeline", {}) or {}).get("cpu_workers", "auto")
+    if isinstance(pw, str) and pw.lower() == "auto":
+        return max(1, min((os.cpu_count() or 2) - 1, 8))
+    try:
+        return max(0, int(pw))
+    except (TypeError, ValueError):
+        return 0
+
+
+def run_pipeline(sec: dict, jobs: Iterable[Dict], on_batch: Callable[[List[Dict]], None],
+                 workers: int = 0, batch_size: int = 32,
+                 on_skip: Optional[Callable[[str, str], None]] = None) -> Dict:
+    """jobs: itérable (en général alimenté par le crawler) de pages brutes.
+    on_batch(results): étage écrivain, appelé dans le thread courant uniquement.
+    on_skip(url, raison): page non écrite, raison "empty" (pas de texte) ou "parse_error:..."
+    (même thread que on_batch)."""
+    init = (sec.get("redact_patterns") or [], int(sec.get("max_chars_per_page", 20000)))
+    stats = {"pages": 0, "parse_ms": 0.0, "write_batches": 0, "write_ms": 0.0, "cpu_workers": workers,
+             "empty": 0, "errors": 0}
+    batch: List[Dict] = []
+
+    def flush():
+        if batch:
+            t0 = time.perf_counter()
+            on_batch(list(batch))
+            stats["write_ms"] += (time.perf_counter() - t0) * 1000
+            stats["write_batches"] += 1
+            batch.clear()
+
+    def collect(res: Dict):
+        stats["pages"] += 1
+        stats["parse_ms"] += res["parse_ms"]
+        if res["text"]:
+            batch.append(res)
+        else:
+            stats["empty"] += 1
+            if on_skip is not None:
+                on_skip(res["url"], "empty")
+        if len(batch) >= batch_size:
+            flush()
+
+    def failed(url: str, e: Exception):
+        stats["errors"] += 1
+        if on_skip is not None:
+            on_skip(url, f"parse_error:{type(e).__name__}: {e}")
+
+    if workers <= 0:
+        init_worker(*init)
+        for job in jobs:
+            try:
+                res = process_page(job)
+            except Exception as e:
+                failed(job["url"], e)
+                continue
+            collect(res)
+    else:
+        max_pending = workers * 4
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=init) as pool:
+            pending = set()
+            urls = {}
+
+            def finished(f):
+                url = urls.pop(f)
+                try:
+                    res = f.result()
+                except Exception as e:
+                    failed(url, e)
+                    return
+                collect(res)
+
+            for job in jobs:
+                f = pool.submit(process_page, job)
+                urls[f] = job["url"]
+                pending.add(f)
+                if len(pending) >= max_pending:
+                    # contre-pression: ne pas accumuler les corps bruts en mémoire
+                    done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                else:
+                    done = {f for f in pending if f.done()}
+                    pending -= done
+                for f in done:
+                    finished(f)
+            for f in concurrent.futures.as_completed(pending):
+                finished(f)
+    flush()
+    stats["parse_ms"] = round(stats["parse_ms"], 1)
+    stats["write_ms"] = round(stats["write_ms"], 1)
+    return stats
@@ -0,0 +1,23 @@
+import time, threading
+
+"""
+Limiteur de débit partagé entre threads (requêtes/minute vers un provider LLM).
+rpm <= 0 = illimité.
+"""
+
+
+class RateLimiter:
+    def __init__(self, rpm: float = 0):
+        self.spacing = 60.0 / float(rpm) if rpm and float(rpm) > 0 else 0.0
+        self._lock = threading.Lock()
+        self._next = 0.0
+
+    def wait(self):
+        if not self.spacing:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next)
+            self._next = slot + self.spacing
+        if slot > now:
+            time.sleep(slot - now)
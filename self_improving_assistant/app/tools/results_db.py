@@ -0,0 +1,202 @@
+import os, io, csv, time, sqlite3, hashlib, threading
+from typing import Dict, List, Optional, Tuple
+
+"""
+Base des résultats d'évaluation (SQLite, WAL), à la place du parcours des logs/eval_*.csv:
+- runs: une ligne par évaluation / A/B (type, date, prompt, provider, modèle, score moyen, gagnant)
+- scores: score et réponse par test (et par candidat pour les A/B)
+- ab_results: résumé par candidat d'un A/B (moyenne, IC, statut)
+Index par (type, date), (prompt, test) et test: les lecteurs (promote, self_update, grow, /api/files)
+font une recherche indexée au lieu de lire des milliers de fichiers. L'export CSV reste optionnel.
+"""
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    started_at REAL NOT NULL,
+    prompt_hash TEXT,
+    prompt_path TEXT,
+    provider TEXT,
+    model TEXT,
+    n_tests INTEGER,
+    avg_score REAL,
+    winner TEXT,
+    csv_path TEXT,
+    scorer TEXT
+);
+CREATE INDEX IF NOT EXISTS runs_kind_time ON runs(kind, started_at);
+CREATE INDEX IF NOT EXISTS runs_prompt ON runs(prompt_hash, started_at);
+CREATE TABLE IF NOT EXISTS scores (
+    run_id INTEGER NOT NULL,
+    candidate TEXT,
+    prompt_hash TEXT,
+    test_id TEXT NOT NULL,
+    score REAL NOT NULL,
+    answer TEXT
+);
+CREATE INDEX IF NOT EXISTS scores_run ON scores(run_id, candidate);
+CREATE INDEX IF NOT EXISTS scores_prompt_test ON scores(prompt_hash, test_id);
+CREATE INDEX IF NOT EXISTS scores_test ON scores(test_id);
+CREATE TABLE IF NOT EXISTS ab_results (
+    run_id INTEGER NOT NULL,
+    candidate TEXT NOT NULL,
+    prompt_hash TEXT,
+    avg_score REAL,
+    n_tests INTEGER,
+    ci_low REAL,
+    ci_high REAL,
+    status TEXT
+);
+CREATE INDEX IF NOT EXISTS ab_results_run ON ab_results(run_id);
+"""
+
+
+def csv_export(cfg: dict) -> bool:
+    return bool((cfg.get("evaluation", {}) or {}).get("csv_export", True))
+
+
+def prompt_hash(text: str) -> str:
+    return hashlib.sha256((text or "").encode("utf-8", errors="ignore")).hexdigest()[:20]
+
+
+class ResultsDB:
+    def __init__(self, path: str):
+        self.path = path
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(SCHEMA)
+        # bases antérieures à la colonne scorer (signature de l'échelle des scores du run)
+        if "scorer" not in {r[1] for r in self._db.execute("PRAGMA table_info(runs)")}:
+            self._db.execute("ALTER TABLE runs ADD COLUMN scorer TEXT")
+        self._db.commit()
+
+    @classmethod
+    def from_cfg(cls, cfg: dict, root: str = ""):
+        path = (cfg.get("evaluation", {}) or {}).get("results_db", "data/results.sqlite")
+        if root and not os.path.isabs(path):
+            path = os.path.join(root, path)
+        return cls(path)
+
+    # -- écriture ---------------------------------------------------------------
+
+    def record_eval(self, prompt: str, prompt_path: str, provider: str, model: str,
+                    rows: List[Tuple[str, float, str]], avg: float, csv_path: str = "", scorer: str = "") -> int:
+        """rows: (test_id, score, answer); scorer: signature de la notation (score_cache.scorer_signature)"""
+        ph = prompt_hash(prompt)
+        with self._lock:
+            cur = self._db.execute(
+                "INSERT INTO runs (kind, started_at, prompt_hash, prompt_path, provider, model, n_tests, avg_score, csv_path, scorer) "
+                "VALUES ('eval',?,?,?,?,?,?,?,?,?)",
+                (time.time(), ph, prompt_path, provider, model, len(rows), avg, csv_path, scorer or None),
+            )
+            run_id = cur.lastrowid
+            self._db.executemany(
+                "INSERT INTO scores (run_id, candidate, prompt_hash, test_id, score, answer) VALUES (?,?,?,?,?,?)",
+                [(run_id, prompt_path, ph, tid, s, a) for tid, s, a in rows],
+            )
+            self._db.commit()
+        return run_id
+
+    def record_ab(self, provider: str, model: str, summary: List[Dict], detail: List[Tuple[str, str, float, str]],
+                  prompts: Dict[str, str], winner: str, winner_score: float, csv_path: str = "", scorer: str = "") -> int:
+        """summary: {candidate, avg_score, n_tests, ci_low, ci_high, status}; detail: (candidate, test_id, score, answer)"""
+        hashes = {c: prompt_hash(p) for c, p in prompts.items()}
+        with self._lock:
+            cur = self._db.execute(
+                "INSERT INTO runs (kind, started_at, prompt_hash, prompt_path, provider, model, n_tests, avg_score, winner, csv_path, scorer) "
+                "VALUES ('abtest',?,?,?,?,?,?,?,?,?,?)",
+                (time.time(), hashes.get(winner), winner, provider, model, len(detail), winner_score, winner, csv_path,
+                 scorer or None),
+            )
+            run_id = cur.lastrowid
+            self._db.executemany(
+                "INSERT INTO ab_results (run_id, candidate, prompt_hash, avg_score, n_tests, ci_low, ci_high, status) "
+                "VALUES (?,?,?,?,?,?,?,?)",
+                [(run_id, r["candidate"], hashes.get(r["candidate"]), r["avg_score"], r["n_tests"],
+                  r["ci_low"], r["ci_high"], r["status"]) for r in summary],
+            )
+            self._db.executemany(
+                "INSERT INTO scores (run_id, candidate, prompt_hash, test_id, score, answer) VALUES (?,?,?,?,?,?)",
+                [(run_id, c, hashes.get(c), tid, s, a) for c, tid, s, a in detail],
+            )
+            self._db.commit()
+        return run_id
+
+    # -- lecture ----------------------------------------------------------------
+
+    def last_run(self, kind: str) -> Optional[Dict]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT * FROM runs WHERE kind=? ORDER BY started_at DESC LIMIT 1", (kind,)
+            ).fetchone()
+        return dict(row) if row else None
+
+    def runs(self, kind: str, limit: int = 20, offset: int = 0) -> List[Dict]:
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT * FROM runs WHERE kind=? ORDER BY started_at DESC LIMIT ? OFFSET ?", (kind, limit, offset)
+            ).fetchall()
+        return [dict(r) for r in rows]
+
+    def count(self, kind: str) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM runs WHERE kind=?", (kind,)).fetchone()[0]
+
+    def run_scores(self, run_id: int, candidate: Optional[str] = None) -> Dict[str, float]:
+        sql = "SELECT test_id, score FROM scores WHERE run_id=?"
+        args: Tuple = (run_id,)
+        if candidate is not None:
+            sql += " AND candidate=?"
+            args = (run_id, candidate)
+        with self._lock:
+            return {r["test_id"]: r["score"] for r in self._db.execute(sql, args)}
+
+    def recent_scores(self, kind: str = "eval", runs: int = 5) -> List[Dict]:
+        """Scores par test des derniers runs d'un type (le plus récent d'abord)."""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT s.run_id, s.candidate, s.test_id, s.score, s.answer FROM scores s "
+                "JOIN (SELECT id FROM runs WHERE kind=? ORDER BY started_at DESC LIMIT ?) r ON s.run_id = r.id "
+                "ORDER BY s.run_id DESC",
+                (kind, runs),
+            ).fetchall()
+        return [dict(r) for r in rows]
+
+    def prompt_scores(self, ph: str, limit: int = 5000) -> List[Dict]:
+        """Scores par test d'un prompt (hash) dans tous les runs, eval et A/B (le plus récent d'abord)."""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT run_id, test_id, score, answer FROM scores WHERE prompt_hash=? ORDER BY run_id DESC LIMIT ?",
+                (ph, limit),
+            ).fetchall()
+        return [dict(r) for r in rows]
+
+    def export_csv(self, run_id: int) -> str:
+        """Même format que les CSV historiques (eval_*.csv / abtest_*.csv)."""
+        with self._lock:
+            run = self._db.execute("SELECT * FROM runs WHERE id=?", (run_id,)).fetchone()
+            if run is None:
+                return ""
+            buf = io.StringIO()
+            w = csv.writer(buf)
+            if run["kind"] == "eval":
+                w.writerow(["test_id", "score", "answer"])
+                for r in self._db.execute("SELECT test_id, score, answer FROM scores WHERE run_id=? ORDER BY rowid", (run_id,)):
+                    w.writerow([r["test_id"], r["score"], r["answer"]])
+                w.writerow([])
+                w.writerow(["avg_score", run["avg_score"]])
+            else:
+                w.writerow(["candidate", "avg_score", "n_tests", "ci_low", "ci_high", "status"])
+                for r in self._db.execute("SELECT * FROM ab_results WHERE run_id=? ORDER BY rowid", (run_id,)):
+                    w.writerow([r["candidate"], r["avg_score"], r["n_tests"], r["ci_low"], r["ci_high"], r["status"]])
+        return buf.getvalue()
+
+    def close(self):
+        with self._lock:
+            self._db.close()
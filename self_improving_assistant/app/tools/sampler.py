@@ -0,0 +1,225 @@
+import os, math, time, heapq, random, hashlib
+from typing import Dict, Iterable, List, Optional, Tuple
+from .state_store import StateStore
+from .results_db import ResultsDB
+
+"""
+Échantillonnage des tests pour evaluate / ab_test / promote:
+- strates = premier tag du test (sinon préfixe de l'id: git_001 -> git)
+- tirage graine par cycle (nombres aléatoires communs): evaluate ouvre le cycle et mémorise
+  les tests tirés, ab_test et promote réutilisent exactement le même tirage
+- réservoir stratifié par priorités: chaque id reçoit une priorité hash(graine, id), une strate
+  garde ses k plus petites (tas borné, pas de permutation complète); les tirages sont emboîtés
+- variance par strate suivie sur les derniers runs (results_db): une observation par test (moyenne de
+  ses scores, qui viennent de plusieurs runs et candidats), rétrécie vers la variance globale, avec un plancher
+- taille auto: plus petit n dont l'IC visé (evaluation.target_ci) est atteint avec une
+  allocation de Neyman (n_h proportionnel à N_h * S_h), borné par min_sample / max_sample
+- moyenne et IC stratifiés (poids N_h / N), pas de correction de population finie
+"""
+
+PRIOR_VAR = 0.25   # variance max d'un score dans [0, 1], tant qu'aucun run n'est connu
+PRIOR_WEIGHT = 4   # observations "virtuelles" de la variance globale dans chaque strate
+VAR_FLOOR = 0.01   # variance minimale (écart-type 0.1): des scores identiques ne donnent pas un IC nul
+
+
+def stratum(test: Dict) -> str:
+    if test.get("stratum"):
+        return str(test["stratum"])  # catalogue de testbank.py
+    tags = test.get("tags") or []
+    if tags:
+        return str(tags[0])
+    tid = str(test.get("id", ""))
+    return tid.split("_", 1)[0] if "_" in tid else "default"
+
+
+class TestSampler:
+    def __init__(self, tests: Iterable[Dict], seed: str, target_ci: float = 0.05, min_n: int = 20,
+                 max_n: int = 200, z: float = 1.96):
+        self.tests = {t["id"]: t for t in tests}
+        self.seed = str(seed)
+        self.target_ci = float(target_ci)
+        self.min_n = int(min_n)
+        self.max_n = int(max_n)
+        self.z = float(z)
+        self.strata: Dict[str, List[str]] = {}
+        for tid, t in self.tests.items():
+            self.strata.setdefault(stratum(t), []).append(tid)
+        self._obs: Dict[str, List[float]] = {}  # test_id -> [nombre de scores, somme]
+
+    def priority(self, tid: str) -> int:
+        return int.from_bytes(hashlib.blake2b(f"{self.seed}:{tid}".encode("utf-8"), digest_size=8).digest(), "big")
+
+    # -- variance par strate ----------------------------------------------------
+
+    def observe(self, rows: Iterable[Tuple[str, float]]):
+        """(test_id, score) des runs passés; les tests inconnus sont ignorés. Les scores répétés
+        d'un même test ne sont pas indépendants: ils sont ramenés à leur moyenne (variances())."""
+        for tid, s in rows:
+            if tid not in self.tests:
+                continue
+            o = self._obs.setdefault(tid, [0, 0.0])
+            o[0] += 1
+            o[1] += float(s)
+
+    def _strata_stats(self) -> Dict[str, Tuple[int, float]]:
+        """{strate: (tests observés, M2 des moyennes par test)}."""
+        out = {h: [0, 0.0, 0.0] for h in self.strata}  # k, moyenne, M2 (Welford)
+        for tid, (c, total) in self._obs.items():
+            o = out[stratum(self.tests[tid])]
+            x = total / c
+            o[0] += 1
+            d = x - o[1]
+            o[1] += d / o[0]
+            o[2] += d * (x - o[1])
+        return {h: (int(k), m2) for h, (k, _, m2) in out.items()}
+
+    def variances(self) -> Dict[str, float]:
+        stats = self._strata_stats()
+        n = sum(k for k, _ in stats.values())
+        pooled = max(VAR_FLOOR, sum(m2 for _, m2 in stats.values()) / (n - 1)) if n > 1 else PRIOR_VAR
+        out = {}
+        for h, (k, m2) in stats.items():
+            # M2 / (k - 1) avec PRIOR_WEIGHT observations de la variance globale en plus
+            out[h] = max(VAR_FLOOR, (m2 + PRIOR_WEIGHT * pooled) / (max(0, k - 1) + PRIOR_WEIGHT))
+        return out
+
+    # -- plan et tirage ---------------------------------------------------------
+
+    def sample_size(self) -> int:
+        big_n = len(self.tests)
+        if big_n == 0:
+            return 0
+        var = self.variances()
+        # Neyman: Var(moyenne) = (somme W_h S_h)^2 / n
+        ws = sum(len(ids) / big_n * math.sqrt(var[h]) for h, ids in self.strata.items())
+        half = max(1e-6, self.target_ci) / self.z
+        n = math.ceil(ws ** 2 / half ** 2)
+        return min(big_n, max(self.min_n, min(self.max_n, n)))
+
+    def allocate(self, n: int) -> Dict[str, int]:
+        """Allocation entière de Neyman (plus forte réduction de variance d'abord), une strate
+        reçoit au moins un test avant qu'une autre en reçoive deux."""
+        var = self.variances()
+        alloc = {h: 0 for h in self.strata}
+        heap = [(-math.inf, h) for h in sorted(self.strata)]
+        left = min(n, len(self.tests))
+        while left > 0 and heap:
+            _, h = heapq.heappop(heap)
+            alloc[h] += 1
+            left -= 1
+            a = alloc[h]
+            if a < len(self.strata[h]):
+                w = len(self.strata[h]) * math.sqrt(max(var[h], 1e-6))
+                heapq.heappush(heap, (-w / math.sqrt(a * (a + 1)), h))
+        return alloc
+
+    def sample(self, n: Optional[int] = None) -> List[Dict]:
+        n = self.sample_size() if n is None else n
+        picked = set()
+        for h, k in self.allocate(n).items():
+            picked.update(heapq.nsmallest(k, self.strata[h], key=self.priority))
+        return self.order(self.tests[tid] for tid in picked)
+
+    def order(self, tests: Iterable[Dict]) -> List[Dict]:
+        """Ordre entrelacé par strate (chaque préfixe reste à peu près proportionnel),
+        dans l'ordre du tirage à l'intérieur d'une strate."""
+        groups: Dict[str, List[Dict]] = {}
+        for t in tests:
+            groups.setdefault(stratum(t), []).append(t)
+        keyed = []
+        rnd = random.Random(f"{self.seed}:order")
+        for h in sorted(groups):
+            ts = sorted(groups[h], key=lambda t: self.priority(t["id"]))
+            u = rnd.random()
+            keyed.extend(((i + u) / len(ts), h, t["id"], t) for i, t in enumerate(ts))
+        keyed.sort(key=lambda x: x[:3])
+        return [x[3] for x in keyed]
+
+    # -- estimation -------------------------------------------------------------
+
+    def estimate(self, scores: Dict[str, float]) -> Tuple[float, float, float]:
+        """(moyenne, borne basse, borne haute) stratifiées sur les strates présentes."""
+        groups: Dict[str, List[float]] = {}
+        for tid, s in scores.items():
+            t = self.tests.get(tid)
+            groups.setdefault(stratum(t) if t else "default", []).append(float(s))
+        if not groups:
+            return 0.0, 0.0, 0.0
+        tracked = self.variances()
+        sizes = {h: max(len(self.strata.get(h, [])), len(v)) for h, v in groups.items()}
+        total = sum(sizes.values())
+        m = var = 0.0
+        for h, v in groups.items():
+            w = sizes[h] / total
+            mh = sum(v) / len(v)
+            s2 = sum((x - mh) ** 2 for x in v) / (len(v) - 1) if len(v) > 1 else tracked.get(h, PRIOR_VAR)
+            s2 = max(s2, VAR_FLOOR)
+            m += w * mh
+            var += w * w * s2 / len(v)
+        half = self.z * math.sqrt(var)
+        return m, m - half, m + half
+
+    def report(self, sample: List[Dict]) -> Dict:
+        var = self.variances()
+        observed = self._strata_stats()
+        counts: Dict[str, int] = {}
+        for t in sample:
+            counts[stratum(t)] = counts.get(stratum(t), 0) + 1
+        return {
+            "seed": self.seed, "n": len(sample), "population": len(self.tests),
+            "target_ci": self.target_ci,
+            "strata": {h: {"size": len(ids), "drawn": counts.get(h, 0), "var": round(var[h], 4),
+                           "observed": observed[h][0]} for h, ids in sorted(self.strata.items())},
+        }
+
+
+def _state(cfg: dict, root: str) -> StateStore:
+    path = (cfg.get("evaluation", {}) or {}).get("score_cache_path", "data/eval_state.sqlite")
+    if root and not os.path.isabs(path):
+        path = os.path.join(root, path)
+    return StateStore(path, "sampler")
+
+
+def cycle_sample(cfg: dict, tests: List[Dict], root: str = "", new_cycle: bool = False) -> Tuple[TestSampler, List[Dict]]:
+    """Tirage du cycle courant. new_cycle (evaluate): nouvelle graine et nouveau tirage mémorisé;
+    sinon (ab_test, promote) le tirage mémorisé est repris tel quel. EVAL_SEED fixe la graine."""
+    ev = cfg.get("evaluation", {}) or {}
+    store = _state(cfg, root)
+    try:
+        cycle = None if new_cycle else store.get("cycle")
+        seed = os.environ.get("EVAL_SEED") or (cycle or {}).get("seed") or f"{time.time_ns():x}"
+        sampler = TestSampler(
+            tests, seed,
+            target_ci=float(ev.get("target_ci", 0.05)),
+            min_n=int(ev.get("min_sample", 20)),
+            max_n=int(ev.get("max_sample", 200)),
+        )
+        if cycle and cycle.get("seed") == seed:
+            ids = set(cycle.get("ids") or [])
+            sample = sampler.order(t for t in tests if t["id"] in ids)
+            if sample:
+                _observe_recent(cfg, sampler, root, ev)
+                return sampler, sample
+        _observe_recent(cfg, sampler, root, ev)
+        mode = (ev.get("sampling") or "auto").lower()
+        if mode == "fixed":
+            n = int(cfg.get("scheduler", {}).get("sample_tests", 0) or ev.get("daily_sample_size", 0) or 0)
+            sample = sampler.sample(n or len(tests))
+        else:
+            sample = sampler.sample()
+        store.put("cycle", {"seed": seed, "ts": time.time(), "ids": [t["id"] for t in sample]})
+        return sampler, sample
+    finally:
+        store.close()
+
+
+def _observe_recent(cfg: dict, sampler: TestSampler, root: str, ev: dict):
+    runs = int(ev.get("variance_runs", 20))
+    if runs <= 0:
+        return
+    db = ResultsDB.from_cfg(cfg, root)
+    try:
+        for kind in ("eval", "abtest"):
+            sampler.observe((r["test_id"], r["score"]) for r in db.recent_scores(kind, runs))
+    finally:
+        db.close()
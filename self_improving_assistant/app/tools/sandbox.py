@@ -0,0 +1,144 @@
+import os, shutil, tempfile
+from typing import Dict, Iterable, List, Optional
+import yaml
+
+"""
+Arbre de travail jetable pour self_update (copie sur écriture, sans copier le projet):
+- dossiers modifiables (allow_paths): vrais dossiers, sources .py copiées, autres fichiers en liens vers
+  l'arbre vivant; un fichier patché remplace son lien par un vrai fichier -> l'arbre vivant n'est jamais touché
+- configs/config.yaml: copie avec surcharges (cache des scores coupé, échantillon fixe...)
+- data/: vide sauf le fichier de tests (lien); logs/: vide -> bases et journaux propres au bac à sable
+- le reste (venv, docs...) en liens; repli sur une copie quand les liens sont refusés (Windows)
+Promotion: swap() prépare d'abord tous les fichiers (temporaires voisins + copie des anciens), puis les
+renomme à la suite (os.replace); un renommage en échec remet les fichiers déjà remplacés.
+Limite: pas atomique pour l'ensemble; un arrêt brutal entre deux renommages laisse un arbre mélangé
+(fichiers .swap_* / .swapold_* restants à côté des fichiers vivants pour réparer à la main).
+"""
+
+SKIP = {".git", "__pycache__", "logs", "data", "configs"}
+
+
+def _link(src: str, dst: str):
+    try:
+        os.symlink(src, dst, target_is_directory=os.path.isdir(src))
+    except (OSError, NotImplementedError):
+        if os.path.isdir(src):
+            shutil.copytree(src, dst, ignore=shutil.ignore_patterns("__pycache__"))
+        else:
+            shutil.copy2(src, dst)
+
+
+def _merge(base: Dict, over: Dict) -> Dict:
+    out = dict(base)
+    for k, v in over.items():
+        out[k] = _merge(out.get(k) or {}, v) if isinstance(v, dict) else v
+    return out
+
+
+class Sandbox:
+    def __init__(self, root: str, writable: Iterable[str], cfg: dict, overrides: Optional[Dict] = None,
+                 parent: Optional[str] = None, name: str = "sandbox"):
+        self.root = os.path.abspath(root)
+        self.writable = [p.strip("/\\") for p in writable]
+        self.path = tempfile.mkdtemp(prefix=f"{name}_", dir=parent)
+        self.changed: List[str] = []
+        for entry in os.listdir(self.root):
+            src = os.path.join(self.root, entry)
+            if entry in SKIP:
+                continue
+            if entry in self.writable and os.path.isdir(src):
+                self._mirror(src, os.path.join(self.path, entry))
+            else:
+                _link(src, os.path.join(self.path, entry))
+        for d in ("logs", "data", "configs"):
+            os.makedirs(os.path.join(self.path, d), exist_ok=True)
+        tests = (cfg.get("paths", {}) or {}).get("tests_file", "data/tests.jsonl")
+        if not os.path.isabs(tests):
+            os.makedirs(os.path.dirname(os.path.join(self.path, tests)), exist_ok=True)
+            _link(os.path.join(self.root, tests), os.path.join(self.path, tests))
+        with open(os.path.join(self.path, "configs", "config.yaml"), "w", encoding="utf-8") as f:
+            yaml.safe_dump(_merge(cfg, overrides or {}), f, allow_unicode=True, sort_keys=False)
+
+    def _mirror(self, src: str, dst: str):
+        for dirpath, dirnames, filenames in os.walk(src):
+            dirnames[:] = [d for d in dirnames if d != "__pycache__"]
+            rel = os.path.relpath(dirpath, src)
+            target = os.path.normpath(os.path.join(dst, rel))
+            os.makedirs(target, exist_ok=True)
+            for fn in filenames:
+                if fn.endswith(".py"):
+                    # copie: Python résout le lien du script lancé pour sys.path[0], les imports
+                    # voisins (from evaluate import ...) iraient sinon chercher l'arbre vivant
+                    shutil.copy2(os.path.join(dirpath, fn), os.path.join(target, fn))
+                else:
+                    _link(os.path.join(dirpath, fn), os.path.join(target, fn))
+
+    def resolve(self, rel: str) -> Optional[str]:
+        """Chemin dans le bac à sable, None si rel sort des dossiers modifiables."""
+        rel = os.path.normpath(rel.strip()).replace("\\", "/")
+        if rel.startswith("../") or os.path.isabs(rel):
+            return None
+        if not any(rel == w or rel.startswith(w + "/") for w in self.writable):
+            return None
+        return os.path.join(self.path, rel)
+
+    def write(self, rel: str, content: str) -> bool:
+        path = self.resolve(rel)
+        if path is None:
+            return False
+        if os.path.islink(path):
+            os.unlink(path)  # ne jamais écrire à travers le lien (fichier vivant)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(content)
+        self.changed.append(os.path.normpath(rel).replace("\\", "/"))
+        return True
+
+    def swap(self) -> List[str]:
+        """Copie les fichiers patchés dans l'arbre vivant: tout est préparé avant le premier os.replace."""
+        staged = []  # (rel, live, temporaire, ancienne version ou None)
+        try:
+            for rel in dict.fromkeys(self.changed):
+                live = os.path.join(self.root, rel)
+                os.makedirs(os.path.dirname(live), exist_ok=True)
+                fd, tmp = tempfile.mkstemp(prefix=".swap_", dir=os.path.dirname(live))
+                staged.append((rel, live, tmp, None))
+                with os.fdopen(fd, "wb") as out, open(os.path.join(self.path, rel), "rb") as src:
+                    shutil.copyfileobj(src, out)
+                if os.path.exists(live):
+                    shutil.copymode(live, tmp)
+                    fd, old = tempfile.mkstemp(prefix=".swapold_", dir=os.path.dirname(live))
+                    os.close(fd)
+                    staged[-1] = (rel, live, tmp, old)
+                    shutil.copy2(live, old)
+                else:
+                    os.chmod(tmp, 0o644)
+        except Exception:
+            for _, _, tmp, old in staged:
+                for p in (tmp, old):
+                    if p and os.path.exists(p):
+                        os.remove(p)
+            raise
+        done = []
+        try:
+            for rel, live, tmp, _ in staged:
+                os.replace(tmp, live)
+                done.append(rel)
+        except Exception:
+            # retour à l'état d'avant pour les fichiers déjà remplacés
+            for rel, live, tmp, old in staged:
+                if rel in done and old:
+                    os.replace(old, live)
+                elif rel in done:
+                    os.remove(live)
+                for p in (tmp, old):
+                    if p and os.path.exists(p):
+                        os.remove(p)
+            raise
+        for _, _, _, old in staged:
+            if old:
+                os.remove(old)
+        return done
+
+    def cleanup(self):
+        shutil.rmtree(self.path, ignore_errors=True)
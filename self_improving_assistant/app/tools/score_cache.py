@@ -0,0 +1,89 @@
+import os, re, json, time, hashlib
+from typing import Dict, Iterable, List, Optional, Tuple
+from .state_store import StateStore
+from .scoring import SCORER_VERSION
+
+"""
+Cache persistant des scores d'évaluation (table "scores"):
+clé = (hash du prompt, id + hash du test, provider, modèle, version du scorer / du juge).
+Seules les cellules absentes sont recalculées par evaluate / ab_test / promote.
+Provider non déterministe: réutilisation limitée à score_cache_ttl_hours.
+Réponses d'erreur du provider ('[openai error] ...'): jamais mises en cache (une panne ne fige pas un 0).
+"""
+
+DETERMINISTIC_PROVIDERS = {"dummy"}
+
+_PROVIDER_ERROR = re.compile(r"^\s*\[\w+ error\]")
+
+
+def is_provider_error(answer: str) -> bool:
+    return bool(_PROVIDER_ERROR.match(answer or ""))
+
+
+def _h(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8", errors="ignore")).hexdigest()[:20]
+
+
+def scorer_signature(cfg: dict, judge=None) -> str:
+    """Version du scorer mots-clés + mots interdits (+ juge: modèle et rubrique) - une échelle de scores."""
+    ev = cfg.get("evaluation", {}) or {}
+    # les mots interdits font partie de la notation
+    scorer = f"{SCORER_VERSION}:{_h(json.dumps(sorted(ev.get('fail_keywords') or [])))}"
+    if judge is not None:
+        # notes du juge (judge.py): modèle et rubrique dans la clé
+        scorer += f":judge-{judge.signature}"
+    return scorer
+
+
+class ScoreCache:
+    def __init__(self, store: StateStore, provider: str, model: str, scorer: str, ttl_seconds: float = 0):
+        self.store = store
+        self.prefix = f"{provider}|{model}|{scorer}"
+        self.ttl = float(ttl_seconds)
+        self.stats = {"hits": 0, "misses": 0}
+
+    @classmethod
+    def from_cfg(cls, cfg: dict, root: str = "", judge=None) -> Optional["ScoreCache"]:
+        ev = cfg.get("evaluation", {}) or {}
+        provider = (cfg.get("provider") or "dummy").lower()
+        mode = ev.get("score_cache", "auto")
+        if isinstance(mode, str) and mode.lower() == "auto":
+            enabled, ttl = provider in DETERMINISTIC_PROVIDERS, 0
+        else:
+            enabled = bool(mode)
+            ttl = 0 if provider in DETERMINISTIC_PROVIDERS else float(ev.get("score_cache_ttl_hours", 24)) * 3600
+        if not enabled:
+            return None
+        path = ev.get("score_cache_path", "data/eval_state.sqlite")
+        if root and not os.path.isabs(path):
+            path = os.path.join(root, path)
+        model = "" if provider == "dummy" else (cfg.get("model") or "")
+        return cls(StateStore(path, "scores"), provider, model, scorer_signature(cfg, judge), ttl)
+
+    def key(self, prompt_hash: str, test: Dict) -> str:
+        content = json.dumps({k: test.get(k) for k in ("question", "expected_keywords")}, sort_keys=True, ensure_ascii=False)
+        return f"{prompt_hash}|{test['id']}|{_h(content)}|{self.prefix}"
+
+    def lookup(self, prompt: str, tests: Iterable[Dict]) -> Dict[str, Tuple[float, str]]:
+        """-> {test_id: (score, answer)} pour les cellules connues."""
+        ph = _h(prompt)
+        keys = {self.key(ph, t): t["id"] for t in tests}
+        found = self.store.get_many(keys.keys())
+        now = time.time()
+        out = {}
+        for k, v in found.items():
+            if self.ttl and now - v.get("ts", 0) > self.ttl:
+                continue
+            out[keys[k]] = (float(v["score"]), v.get("answer", ""))
+        self.stats["hits"] += len(out)
+        self.stats["misses"] += len(keys) - len(out)
+        return out
+
+    def save(self, prompt: str, rows: List[Tuple[Dict, float, str]]):
+        ph = _h(prompt)
+        now = time.time()
+        self.store.put_many({self.key(ph, t): {"score": s, "answer": a, "ts": now}
+                             for t, s, a in rows if not is_provider_error(a)})
+
+    def close(self):
+        self.store.close()
@@ -0,0 +1,142 @@
+import threading, unicodedata
+from collections import deque
+from functools import lru_cache
+from typing import Dict, Iterable, List, Sequence, Tuple
+
+"""
+Notation par mots-clés partagée (evaluate, ab_test, promote):
+- texte et mots-clés normalisés (accents retirés, casse, espaces) -> "memoire vive" == "Mémoire  vive"
+- un automate Aho-Corasick sur tout le vocabulaire (attendus + interdits), compilé une fois
+  par jeu de tests; chaque réponse est parcourue une seule fois
+- frontières de mots: début de mot obligatoire; fin de mot obligatoire pour les mots courts
+  et les nombres (ls != lsof, 60 != 600), suffixes autorisés sinon (permanent -> permanente)
+- score = mots attendus trouvés / nombre attendu, 0 si un mot interdit apparaît
+"""
+
+# à changer quand la notation change: invalide le cache des scores (score_cache.py)
+SCORER_VERSION = "ac-1"
+
+
+def normalize(text: str) -> str:
+    text = unicodedata.normalize("NFKD", text or "")
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return " ".join(text.casefold().split())
+
+
+def _word(c: str) -> bool:
+    return c.isalnum() or c == "_"
+
+
+class Automaton:
+    def __init__(self, patterns: Sequence[str]):
+        self.patterns = list(patterns)
+        self.goto: List[Dict[str, int]] = [{}]
+        self.fail = [0]
+        self.out: List[List[int]] = [[]]
+        for pid, p in enumerate(self.patterns):
+            node = 0
+            for ch in p:
+                nxt = self.goto[node].get(ch)
+                if nxt is None:
+                    nxt = len(self.goto)
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.out.append([])
+                    self.goto[node][ch] = nxt
+                node = nxt
+            self.out[node].append(pid)
+        queue = deque(self.goto[0].values())
+        while queue:
+            r = queue.popleft()
+            for ch, s in self.goto[r].items():
+                queue.append(s)
+                f = self.fail[r]
+                while f and ch not in self.goto[f]:
+                    f = self.fail[f]
+                self.fail[s] = self.goto[f].get(ch, 0)
+                self.out[s] = self.out[s] + self.out[self.fail[s]]
+
+    def matches(self, text: str) -> Iterable[Tuple[int, int]]:
+        """(index de fin, id du motif) pour chaque occurrence."""
+        goto, fail, out = self.goto, self.fail, self.out
+        node = 0
+        for i, ch in enumerate(text):
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            for pid in out[node]:
+                yield i, pid
+
+
+class KeywordScorer:
+    def __init__(self, fail_keywords: Iterable[str] = (), tests: Iterable[Dict] = ()):
+        self.fail = [k for k in dict.fromkeys(normalize(k) for k in fail_keywords or []) if k]
+        self._vocab: Dict[str, int] = {}
+        self._compiled = None
+        self._lock = threading.Lock()
+        self.add_keywords(self.fail)
+        self.add_keywords(k for t in tests for k in t.get("expected_keywords", []))
+
+    def add_keywords(self, keywords: Iterable[str]):
+        new = [k for k in (normalize(k) for k in keywords) if k and k not in self._vocab]
+        if not new:
+            return
+        with self._lock:
+            for k in new:
+                if k not in self._vocab:
+                    self._vocab[k] = len(self._vocab)
+                    self._compiled = None
+
+    def _automaton(self) -> Tuple[Automaton, List[bool]]:
+        compiled = self._compiled
+        if compiled is None:
+            with self._lock:
+                if self._compiled is None:
+                    words = list(self._vocab)
+                    self._compiled = (Automaton(words), [len(w) <= 3 or w[-1].isdigit() for w in words])
+                compiled = self._compiled
+        return compiled
+
+    def found(self, answer: str) -> set:
+        """Mots-clés (normalisés) présents dans la réponse, frontières de mots respectées."""
+        auto, strict_end = self._automaton()
+        text = normalize(answer)
+        n = len(text)
+        hits = set()
+        for end, pid in auto.matches(text):
+            w = auto.patterns[pid]
+            if w in hits:
+                continue
+            start = end - len(w) + 1
+            if _word(w[0]) and start > 0 and _word(text[start - 1]):
+                continue
+            if strict_end[pid] and _word(w[-1]) and end + 1 < n and _word(text[end + 1]):
+                continue
+            hits.add(w)
+        return hits
+
+    def score(self, answer: str, expected_keywords: Iterable[str]) -> Tuple[float, Dict]:
+        expected = [normalize(k) for k in expected_keywords or []]
+        self.add_keywords(expected)
+        hits_set = self.found(answer)
+        hits = sum(1 for k in expected if k in hits_set)
+        for fk in self.fail:
+            if fk in hits_set:
+                return 0.0, {"hits": hits, "fail": fk}
+        return hits / max(1, len(expected)), {"hits": hits}
+
+    def score_many(self, answers: Sequence[str], expected_lists: Sequence[Iterable[str]]) -> List[Tuple[float, Dict]]:
+        """Note un lot de réponses: vocabulaire complété puis automate compilé une seule fois."""
+        expected_lists = [list(e or []) for e in expected_lists]
+        self.add_keywords(k for e in expected_lists for k in e)
+        return [self.score(a, e) for a, e in zip(answers, expected_lists)]
+
+
+@lru_cache(maxsize=16)
+def _scorer(fail: Tuple[str, ...]) -> KeywordScorer:
+    return KeywordScorer(fail)
+
+
+def score_answer(answer, expected_keywords, fail_keywords):
+    # compatibilité: un scorer par liste de mots interdits, vocabulaire complété au fil des appels
+    return _scorer(tuple(fail_keywords or ())).score(answer, expected_keywords)
@@ -0,0 +1,143 @@
+import os, json, time, threading
+from abc import ABC, abstractmethod
+from typing import Dict, List, Optional
+from .state_store import StateStore
+
+"""
+Recherche web derrière un backend interchangeable + cache persistant:
+- backends: "ddg" (DuckDuckGo) ou "fixture" (résultats locaux JSON, tests et benchs)
+- cache (table "search") par (backend, requête, max_results)
+- frais (< ttl): servi sans requête
+- périmé mais < stale: servi immédiatement, rafraîchi en arrière-plan (stale-while-revalidate)
+- au-delà: requête synchrone; en cas d'échec, l'ancienne réponse est servie si elle existe
+"""
+
+
+class SearchBackend(ABC):
+    name = "base"
+
+    @abstractmethod
+    def search(self, query: str, max_results: int) -> List[Dict]:
+        """-> [{title, href, body}] pour la requête."""
+
+
+class DdgBackend(SearchBackend):
+    name = "ddg"
+
+    def search(self, query: str, max_results: int) -> List[Dict]:
+        from duckduckgo_search import DDGS
+        out = []
+        with DDGS() as ddgs:
+            for r in ddgs.text(query, max_results=max_results):
+                out.append({"title": r.get("title"), "href": r.get("href"), "body": r.get("body")})
+        return out
+
+
+class FixtureBackend(SearchBackend):
+    """Résultats fixes: {requête: [{title, href, body}], "*": [...] (défaut)}, depuis un fichier ou un dict."""
+    name = "fixture"
+
+    def __init__(self, path: str = "", results: Optional[Dict[str, List[Dict]]] = None):
+        self.results = dict(results or {})
+        if path:
+            with open(path, "r", encoding="utf-8") as f:
+                self.results.update(json.load(f))
+
+    def search(self, query: str, max_results: int) -> List[Dict]:
+        rows = self.results.get(query, self.results.get("*", []))
+        return [dict(r) for r in rows[:max_results]]
+
+
+BACKENDS = {"ddg": DdgBackend, "fixture": FixtureBackend}
+
+
+def make_backend(cfg: dict, root: str = "") -> SearchBackend:
+    s = (cfg.get("rag", {}) or {}).get("search", {}) or {}
+    name = (s.get("backend") or "ddg").lower()
+    if name not in BACKENDS:
+        raise ValueError(f"backend de recherche inconnu: {name}")
+    if name == "fixture":
+        path = s.get("fixture_path") or ""
+        if path and root and not os.path.isabs(path):
+            path = os.path.join(root, path)
+        return FixtureBackend(path)
+    return BACKENDS[name]()
+
+
+class SearchCache:
+    def __init__(self, backend: SearchBackend, store: Optional[StateStore] = None,
+                 ttl_seconds: float = 3600, stale_seconds: float = 86400):
+        self.backend = backend
+        self.store = store
+        self.ttl = float(ttl_seconds)
+        self.stale = float(stale_seconds)
+        self._lock = threading.Lock()
+        self._refreshing: Dict[str, threading.Thread] = {}
+        self.stats = {"hits": 0, "stale": 0, "misses": 0, "errors": 0, "refreshed": 0}
+
+    @classmethod
+    def from_cfg(cls, cfg: dict, root: str = ""):
+        rag = cfg.get("rag", {}) or {}
+        s = rag.get("search", {}) or {}
+        store = None
+        if float(s.get("cache_ttl_minutes", 60)) > 0:
+            path = rag.get("state_path", "data/ingest_state.sqlite")
+            if root and not os.path.isabs(path):
+                path = os.path.join(root, path)
+            store = StateStore(path, "search")
+        return cls(make_backend(cfg, root), store,
+                   float(s.get("cache_ttl_minutes", 60)) * 60, float(s.get("stale_hours", 24)) * 3600)
+
+    def key(self, query: str, max_results: int) -> str:
+        return f"{self.backend.name}|{int(max_results)}|{' '.join(query.split())}"
+
+    def _fetch(self, key: str, query: str, max_results: int) -> List[Dict]:
+        results = self.backend.search(query, max_results)
+        if self.store is not None:
+            self.store.put(key, {"results": results, "fetched_at": time.time()})
+        return results
+
+    def _refresh(self, key: str, query: str, max_results: int):
+        try:
+            self._fetch(key, query, max_results)
+            with self._lock:
+                self.stats["refreshed"] += 1
+        except Exception:
+            with self._lock:
+                self.stats["errors"] += 1
+        finally:
+            with self._lock:
+                self._refreshing.pop(key, None)
+
+    def search(self, query: str, max_results: int = 5) -> List[Dict]:
+        key = self.key(query, max_results)
+        cached = self.store.get(key) if self.store is not None else None
+        age = time.time() - cached["fetched_at"] if cached else None
+        if cached and age < self.ttl:
+            with self._lock:
+                self.stats["hits"] += 1
+            return cached["results"]
+        if cached and age < self.ttl + self.stale:
+            with self._lock:
+                self.stats["stale"] += 1
+                if key not in self._refreshing:
+                    t = threading.Thread(target=self._refresh, args=(key, query, max_results), daemon=True)
+                    self._refreshing[key] = t
+                    t.start()
+            return cached["results"]
+        with self._lock:
+            self.stats["misses"] += 1
+        try:
+            return self._fetch(key, query, max_results)
+        except Exception:
+            with self._lock:
+                self.stats["errors"] += 1
+            # backend indisponible ou limité: mieux vaut une vieille réponse que rien
+            return cached["results"] if cached else []
+
+    def close(self, wait: float = 30):
+        # laisse les rafraîchissements en cours se terminer avant de fermer le store
+        for t in list(self._refreshing.values()):
+            t.join(wait)
+        if self.store is not None:
+            self.store.close()
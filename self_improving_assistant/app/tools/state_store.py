@@ -0,0 +1,77 @@
+import os, re, json, time, sqlite3, threading
+from typing import Dict, Iterable, Optional
+
+"""
+Petit magasin clé -> JSON persistant (SQLite, WAL) pour les états d'ingestion
+(frontière d'URL, robots.txt, résumés, flux RSS, recherches...).
+Une table par usage, un seul fichier partagé; utilisable depuis plusieurs threads
+et par plusieurs processus (serveur + scripts).
+"""
+
+_IDENT = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+
+class StateStore:
+    def __init__(self, path: str, table: str):
+        if not _IDENT.match(table):
+            raise ValueError(f"nom de table invalide: {table}")
+        self.path = path
+        self.table = table
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} (key TEXT PRIMARY KEY, value TEXT NOT NULL, updated_at REAL NOT NULL)"
+        )
+        self._db.execute(f"CREATE INDEX IF NOT EXISTS {table}_updated ON {table}(updated_at)")
+        self._db.commit()
+
+    def get(self, key: str) -> Optional[Dict]:
+        with self._lock:
+            row = self._db.execute(f"SELECT value FROM {self.table} WHERE key=?", (key,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, Dict]:
+        keys = list(keys)
+        out: Dict[str, Dict] = {}
+        with self._lock:
+            for i in range(0, len(keys), 500):
+                part = keys[i:i + 500]
+                marks = ",".join("?" * len(part))
+                for k, v in self._db.execute(f"SELECT key, value FROM {self.table} WHERE key IN ({marks})", part):
+                    out[k] = json.loads(v)
+        return out
+
+    def put(self, key: str, value: Dict):
+        self.put_many({key: value})
+
+    def put_many(self, items: Dict[str, Dict]):
+        if not items:
+            return
+        now = time.time()
+        rows = [(k, json.dumps(v, ensure_ascii=False), now) for k, v in items.items()]
+        with self._lock:
+            self._db.executemany(f"INSERT OR REPLACE INTO {self.table} (key, value, updated_at) VALUES (?,?,?)", rows)
+            self._db.commit()
+
+    def delete(self, key: str):
+        with self._lock:
+            self._db.execute(f"DELETE FROM {self.table} WHERE key=?", (key,))
+            self._db.commit()
+
+    def prune(self, older_than_seconds: float) -> int:
+        with self._lock:
+            cur = self._db.execute(f"DELETE FROM {self.table} WHERE updated_at < ?", (time.time() - older_than_seconds,))
+            self._db.commit()
+            return cur.rowcount
+
+    def count(self) -> int:
+        with self._lock:
+            return self._db.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._db.close()
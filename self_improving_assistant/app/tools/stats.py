@@ -0,0 +1,66 @@
+import math
+from typing import Iterable, Tuple
+
+"""
+Petits outils statistiques pour les évaluations (scores par test dans [0, 1]).
+"""
+
+
+def mean(values: Iterable[float]) -> float:
+    values = list(values)
+    return sum(values) / len(values) if values else 0.0
+
+
+def mean_ci(values: Iterable[float], z: float = 1.96) -> Tuple[float, float, float]:
+    """(moyenne, borne basse, borne haute) - approximation normale, écart-type d'échantillon."""
+    values = list(values)
+    n = len(values)
+    if n == 0:
+        return 0.0, 0.0, 0.0
+    m = sum(values) / n
+    if n == 1:
+        return m, m, m
+    var = sum((v - m) ** 2 for v in values) / (n - 1)
+    half = z * math.sqrt(var / n)
+    return m, m - half, m + half
+
+
+class PairedSprt:
+    """SPRT de Wald sur des différences appariées d = score_candidat - score_actif.
+    H0: gain moyen 0, H1: gain moyen = effect; variance estimée au fil de l'eau (plancher var_floor)."""
+
+    def __init__(self, effect: float = 0.05, alpha: float = 0.05, beta: float = 0.2,
+                 min_n: int = 10, var_floor: float = 0.01):
+        self.effect = float(effect)
+        self.upper = math.log((1 - beta) / alpha)
+        self.lower = math.log(beta / (1 - alpha))
+        self.min_n = int(min_n)
+        self.var_floor = float(var_floor)
+        self.diffs = []
+
+    def add(self, d: float):
+        self.diffs.append(float(d))
+
+    @property
+    def n(self) -> int:
+        return len(self.diffs)
+
+    def llr(self) -> float:
+        n = len(self.diffs)
+        if n == 0:
+            return 0.0
+        m = sum(self.diffs) / n
+        var = sum((d - m) ** 2 for d in self.diffs) / (n - 1) if n > 1 else 0.0
+        var = max(var, self.var_floor)
+        return (self.effect * sum(self.diffs) - n * self.effect ** 2 / 2) / var
+
+    def decision(self) -> str:
+        """'accept' (gain établi), 'reject' (pas de gain) ou '' (continuer)."""
+        if len(self.diffs) < self.min_n:
+            return ""
+        llr = self.llr()
+        if llr >= self.upper:
+            return "accept"
+        if llr <= self.lower:
+            return "reject"
+        return ""
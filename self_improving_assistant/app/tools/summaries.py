@@ -0,0 +1,157 @@
+import os, re, hashlib, secrets, threading, concurrent.futures
+from typing import Dict, List, Optional
+from .state_store import StateStore
+from .ratelimit import RateLimiter
+
+"""
+Résumés LLM des pages ingérées:
+- cache persistant par hash de (texte, prompt, modèle): un texte déjà résumé ne coûte plus d'appel
+- les pages courtes sont regroupées dans une même requête (séparateurs '=== DOC <jeton>-n ===', jeton
+  aléatoire par requête: une page qui contient un séparateur ne peut pas découper la réponse)
+- les requêtes partent en parallèle sous le rpm du provider
+"""
+
+PACK_INSTRUCTIONS = (
+    "\n\nPlusieurs documents te sont fournis, chacun précédé d'une ligne '=== DOC {tag}-n ==='. "
+    "Résume chacun séparément. Réponds uniquement avec, pour chaque document, la ligne "
+    "'=== DOC {tag}-n ===' (même numéro) suivie de son résumé."
+)
+
+# séparateurs (quel que soit le jeton) retirés des textes avant regroupement
+_ANY_SEP = re.compile(r"^\s*=== DOC [\w-]+ ===\s*$", re.M)
+
+
+class Summarizer:
+    def __init__(self, cfg: dict, store: Optional[StateStore] = None):
+        rag = cfg.get("rag", {}) or {}
+        s = rag.get("summarize", {}) or {}
+        self.enabled = bool(s.get("enabled", False)) and (s.get("provider") or "openai").lower() == "openai" and bool(os.getenv("OPENAI_API_KEY"))
+        self.prompt = s.get("prompt") or "Résumé"
+        self.model = s.get("model") or cfg.get("model") or "gpt-4o-mini"
+        self.max_tokens = int(s.get("max_tokens", 600))
+        self.max_input = int(s.get("max_input_chars", 8000))
+        self.pack_below = int(s.get("pack_below_chars", 2000))
+        self.pack_max_chars = int(s.get("pack_max_chars", self.max_input))
+        self.pack_max_docs = max(1, int(s.get("pack_max_docs", 6)))
+        self.concurrency = max(1, int(s.get("concurrency", 4)))
+        self.limiter = RateLimiter(float(s.get("rate_limit_rpm", 60)))
+        self.store = store if s.get("cache", True) else None
+        self.stats = {"pages": 0, "cache_hits": 0, "cache_misses": 0, "llm_calls": 0, "packed_pages": 0, "failed": 0}
+        self._client = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_cfg(cls, cfg: dict, root: str = ""):
+        path = (cfg.get("rag", {}) or {}).get("state_path", "data/ingest_state.sqlite")
+        if root and not os.path.isabs(path):
+            path = os.path.join(root, path)
+        return cls(cfg, StateStore(path, "summaries"))
+
+    def key(self, text: str) -> str:
+        h = hashlib.sha256()
+        for part in (self.model, self.prompt, str(self.max_tokens), text):
+            h.update(part.encode("utf-8", errors="ignore"))
+            h.update(b"\0")
+        return h.hexdigest()
+
+    def _chat(self, system: str, user: str, max_tokens: int) -> str:
+        with self._lock:
+            if self._client is None:
+                from openai import OpenAI
+                self._client = OpenAI()
+            self.stats["llm_calls"] += 1
+        self.limiter.wait()
+        resp = self._client.chat.completions.create(
+            model=self.model,
+            messages=[
+                {"role": "system", "content": system},
+                {"role": "user", "content": user},
+            ],
+            temperature=0,
+            max_tokens=max_tokens,
+        )
+        return (resp.choices[0].message.content or "").strip()
+
+    def _one(self, text: str) -> str:
+        try:
+            return self._chat(self.prompt, text, self.max_tokens)
+        except Exception:
+            return ""
+
+    def _pack(self, texts: List[str]) -> List[str]:
+        if len(texts) == 1:
+            return [self._one(texts[0])]
+        tag = secrets.token_hex(4)
+        sep = re.compile(rf"^\s*=== DOC {tag}-(\d+) ===\s*$", re.M)
+        body = "\n\n".join(f"=== DOC {tag}-{i + 1} ===\n{_ANY_SEP.sub('', t)}" for i, t in enumerate(texts))
+        try:
+            out = self._chat(self.prompt + PACK_INSTRUCTIONS.format(tag=tag), body, min(4000, self.max_tokens * len(texts)))
+        except Exception:
+            out = ""
+        parts = sep.split(out)
+        found = {}
+        for n, s in zip(parts[1::2], parts[2::2]):
+            found.setdefault(int(n), s.strip())
+        # réponse mal formée pour un document: on le refait seul
+        return [found.get(i + 1) or self._one(t) for i, t in enumerate(texts)]
+
+    def _groups(self, texts: List[str]) -> List[List[int]]:
+        groups, cur, size = [], [], 0
+        for i in sorted(range(len(texts)), key=lambda i: len(texts[i])):
+            t = texts[i]
+            if len(t) >= self.pack_below:
+                groups.append([i])
+                continue
+            if cur and (size + len(t) > self.pack_max_chars or len(cur) >= self.pack_max_docs):
+                groups.append(cur)
+                cur, size = [], 0
+            cur.append(i)
+            size += len(t)
+        if cur:
+            groups.append(cur)
+        return groups
+
+    def summarize_many(self, texts: List[str]) -> List[str]:
+        """Résumés alignés sur texts ('' si indisponible -> l'appelant stocke le brut)."""
+        if not self.enabled or not texts:
+            return ["" for _ in texts]
+        inputs = [t[: self.max_input] for t in texts]
+        keys = [self.key(t) for t in inputs]
+        cached = self.store.get_many(set(keys)) if self.store is not None else {}
+        self.stats["pages"] += len(inputs)
+        todo: Dict[str, str] = {}
+        for k, t in zip(keys, inputs):
+            if k in cached:
+                self.stats["cache_hits"] += 1
+            elif t.strip():
+                todo.setdefault(k, t)
+        self.stats["cache_misses"] += len(todo)
+        results = {k: v.get("summary", "") for k, v in cached.items()}
+        if todo:
+            miss_keys = list(todo)
+            miss_texts = [todo[k] for k in miss_keys]
+            groups = self._groups(miss_texts)
+            self.stats["packed_pages"] += sum(len(g) for g in groups if len(g) > 1)
+            with concurrent.futures.ThreadPoolExecutor(max_workers=self.concurrency) as ex:
+                futs = {ex.submit(self._pack, [miss_texts[i] for i in g]): g for g in groups}
+                for fut in concurrent.futures.as_completed(futs):
+                    for i, summary in zip(futs[fut], fut.result()):
+                        results[miss_keys[i]] = summary
+            fresh = {k: {"summary": results[k], "model": self.model} for k in miss_keys if results.get(k)}
+            self.stats["failed"] += len(miss_keys) - len(fresh)
+            if self.store is not None:
+                self.store.put_many(fresh)
+        return [results.get(k, "") for k in keys]
+
+    def summarize(self, text: str) -> str:
+        return self.summarize_many([text])[0]
+
+    def report(self) -> Dict:
+        out = dict(self.stats)
+        looked = out["cache_hits"] + out["cache_misses"]
+        out["hit_rate"] = round(out["cache_hits"] / looked, 3) if looked else None
+        return out
+
+    def close(self):
+        if self.store is not None:
+            self.store.close()
@@ -0,0 +1,157 @@
+import os, json, sqlite3, threading
+from typing import Dict, Iterator, List, Sequence
+from .sampler import stratum
+
+"""
+Banque de tests lue en flux (data/tests.jsonl, potentiellement des centaines de milliers de lignes):
+- index sur disque (SQLite): id -> (offset, longueur, strate), reconstruit seulement quand
+  le fichier change (taille / mtime); le schéma est validé une fois, à la construction
+- catalogue léger (id, strate) pour l'échantillonnage, puis lecture par seek des seuls tests tirés
+- lignes invalides et ids en double ignorés et comptés (premières erreurs gardées dans l'index)
+"""
+
+INDEX_VERSION = "1"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tests (
+    id TEXT PRIMARY KEY,
+    offset INTEGER NOT NULL,
+    length INTEGER NOT NULL,
+    stratum TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS tests_stratum ON tests(stratum);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+"""
+
+
+def _str_list(v) -> bool:
+    return isinstance(v, list) and all(isinstance(x, str) for x in v)
+
+
+def validate(test) -> str:
+    """'' si le test est valide, sinon la raison."""
+    if not isinstance(test, dict):
+        return "pas un objet JSON"
+    if not isinstance(test.get("id"), str) or not test["id"].strip():
+        return "id manquant"
+    if not isinstance(test.get("question"), str) or not test["question"].strip():
+        return "question manquante"
+    if not _str_list(test.get("expected_keywords", [])):
+        return "expected_keywords doit être une liste de chaînes"
+    if "tags" in test and not _str_list(test["tags"]):
+        return "tags doit être une liste de chaînes"
+    return ""
+
+
+class TestBank:
+    def __init__(self, path: str, index_path: str):
+        self.path = path
+        self.index_path = index_path
+        if os.path.dirname(index_path):
+            os.makedirs(os.path.dirname(index_path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(index_path, timeout=30, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(SCHEMA)
+        self._db.commit()
+        self.stats: Dict = {}
+
+    @classmethod
+    def from_cfg(cls, cfg: dict, root: str = "") -> "TestBank":
+        paths = cfg.get("paths", {}) or {}
+        path = paths.get("tests_file", "data/tests.jsonl")
+        index = paths.get("tests_index", "data/tests_index.sqlite")
+        if root:
+            path = path if os.path.isabs(path) else os.path.join(root, path)
+            index = index if os.path.isabs(index) else os.path.join(root, index)
+        bank = cls(path, index)
+        bank.ensure_index()
+        return bank
+
+    # -- index -------------------------------------------------------------------
+
+    def _signature(self) -> str:
+        st = os.stat(self.path)
+        return f"{INDEX_VERSION}:{st.st_size}:{st.st_mtime_ns}"
+
+    def ensure_index(self) -> Dict:
+        sig = self._signature()
+        with self._lock:
+            meta = dict(self._db.execute("SELECT key, value FROM meta"))
+            if meta.get("signature") == sig:
+                self.stats = json.loads(meta.get("stats", "{}"))
+                self.stats["rebuilt"] = False
+                return self.stats
+            rows, errors, invalid, dupes = [], [], 0, 0
+            seen = set()
+            offset = 0
+            with open(self.path, "rb") as f:
+                for lineno, line in enumerate(f, 1):
+                    start, offset = offset, offset + len(line)
+                    if not line.strip():
+                        continue
+                    try:
+                        test = json.loads(line)
+                        err = validate(test)
+                    except ValueError as e:
+                        err = f"JSON invalide ({e})"
+                    if not err and test["id"] in seen:
+                        dupes += 1
+                        err = f"id en double: {test['id']}"
+                    if err:
+                        invalid += 1
+                        if len(errors) < 20:
+                            errors.append(f"ligne {lineno}: {err}")
+                        continue
+                    seen.add(test["id"])
+                    rows.append((test["id"], start, len(line), stratum(test)))
+            self.stats = {"tests": len(rows), "invalid": invalid, "duplicates": dupes, "errors": errors}
+            self._db.execute("DELETE FROM tests")
+            self._db.executemany("INSERT INTO tests (id, offset, length, stratum) VALUES (?,?,?,?)", rows)
+            self._db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('signature', ?)", (sig,))
+            self._db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('stats', ?)", (json.dumps(self.stats, ensure_ascii=False),))
+            self._db.commit()
+        self.stats["rebuilt"] = True
+        return self.stats
+
+    # -- lecture -----------------------------------------------------------------
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM tests").fetchone()[0]
+
+    def catalog(self) -> List[Dict]:
+        """[{id, stratum}] sans lire les questions (pour sampler.py)."""
+        with self._lock:
+            return [{"id": i, "stratum": s} for i, s in self._db.execute("SELECT id, stratum FROM tests ORDER BY offset")]
+
+    def load(self, ids: Sequence[str]) -> List[Dict]:
+        """Tests complets dans l'ordre de ids (ids inconnus ignorés), lus par seek."""
+        ids = list(ids)
+        spans: Dict[str, tuple] = {}
+        with self._lock:
+            for i in range(0, len(ids), 500):
+                part = ids[i:i + 500]
+                marks = ",".join("?" * len(part))
+                for tid, off, ln in self._db.execute(f"SELECT id, offset, length FROM tests WHERE id IN ({marks})", part):
+                    spans[tid] = (off, ln)
+        out: Dict[str, Dict] = {}
+        with open(self.path, "rb") as f:
+            for tid in sorted(spans, key=lambda t: spans[t][0]):
+                off, ln = spans[tid]
+                f.seek(off)
+                out[tid] = json.loads(f.read(ln))
+        return [out[t] for t in ids if t in out]
+
+    def stream(self) -> Iterator[Dict]:
+        """Tous les tests valides, dans l'ordre du fichier, sans tout garder en mémoire."""
+        with self._lock:
+            spans = self._db.execute("SELECT offset, length FROM tests ORDER BY offset").fetchall()
+        with open(self.path, "rb") as f:
+            for off, ln in spans:
+                f.seek(off)
+                yield json.loads(f.read(ln))
+
+    def close(self):
+        with self._lock:
+            self._db.close()
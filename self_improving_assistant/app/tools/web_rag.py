@@ -1,145 +1,14 @@
-import os, re, json, time, hashlib, socket, ipaddress
+import os, json, time, hashlib, threading
 from typing import List, Dict, Tuple
-import requests
-from bs4 import BeautifulSoup
-from duckduckgo_search import DDGS
 from rank_bm25 import BM25Okapi
-from urllib.parse import urlparse, urljoin
-from urllib import robotparser
 import yaml
-
-
-def web_search(query: str, max_results: int = 5) -> List[Dict]:
-    results = []
-    with DDGS() as ddgs:
-        for r in ddgs.text(query, max_results=max_results):
-            results.append({
-                "title": r.get("title"),
-                "href": r.get("href"),
-                "body": r.get("body"),
-            })
-    return results
-
-
-def _get_domain(url: str) -> str:
-    try:
-        return urlparse(url).hostname or ""
-    except:
-        return ""
-
-def _is_private_ip(host: str) -> bool:
-    try:
-        infos = socket.getaddrinfo(host, None)
-        for fam, _, _, _, sockaddr in infos:
-            ip = sockaddr[0]
-            try:
-                if ipaddress.ip_address(ip).is_private:
-                    return True
-            except ValueError:
-                continue
-    except Exception:
-        return False
-    return False
-
-_robots_cache: Dict[str, robotparser.RobotFileParser] = {}
-
-def _robots_allowed(sec: dict, url: str, ua: str) -> bool:
-    if not sec.get("respect_robots", True):
-        return True
-    parsed = urlparse(url)
-    host = parsed.hostname or ""
-    if not host:
-        return False
-    base = f"{parsed.scheme}://{host}"
-    if host not in _robots_cache:
-        rp = robotparser.RobotFileParser()
-        try:
-            rp.set_url(urljoin(base, "/robots.txt"))
-            rp.read()
-        except Exception:
-            rp = None
-        _robots_cache[host] = rp
-    rp = _robots_cache.get(host)
-    if not rp:
-        return True
-    try:
-        return rp.can_fetch(ua, url)
-    except Exception:
-        return True
-
-def _is_allowed_url(sec: dict, url: str) -> Tuple[bool, str]:
-    parsed = urlparse(url)
-    scheme = (parsed.scheme or '').lower()
-    host = (parsed.hostname or '').lower()
-    if scheme not in (sec.get("allowed_schemes") or ["http","https"]):
-        return False, f"scheme_not_allowed:{scheme}"
-    if not host:
-        return False, "no_host"
-    for bd in (sec.get("block_domains") or []):
-        if host == bd.lower() or host.endswith("."+bd.lower()):
-            return False, f"blocked_domain:{host}"
-    allow = [d.lower() for d in (sec.get("allow_domains") or [])]
-    if allow:
-        if not any(host == d or host.endswith("."+d) for d in allow):
-            return False, f"not_in_allowlist:{host}"
-    if sec.get("disallow_private_ips", True) and _is_private_ip(host):
-        return False, f"private_ip:{host}"
-    return True, "ok"
-
-def _redact(text: str, patterns: List[str]) -> str:
-    if not patterns:
-        return text
-    out = text
-    for p in patterns:
-        try:
-            out = re.sub(p, "[REDACTED]", out)
-        except re.error:
-            continue
-    return out
-
-def _openai_summarize(cfg: dict, text: str) -> str:
-    rag_sum = cfg.get("rag", {}).get("summarize", {})
-    if not rag_sum.get("enabled", False):
-        return ""
-    api_key = os.getenv("OPENAI_API_KEY")
-    if not api_key:
-        return ""
-    try:
-        from openai import OpenAI
-        client = OpenAI()
-        prompt = rag_sum.get("prompt") or "Résumé"
-        model = rag_sum.get("model") or cfg.get("model") or "gpt-4o-mini"
-        max_tokens = int(rag_sum.get("max_tokens", 600))
-        resp = client.chat.completions.create(
-            model=model,
-            messages=[
-                {"role":"system","content": prompt},
-                {"role":"user","content": text},
-            ],
-            temperature=0,
-            max_tokens=max_tokens,
-        )
-        return (resp.choices[0].message.content or "").strip()
-    except Exception:
-        return ""
-
-def fetch_page(url: str, sec: dict) -> Tuple[str, str]:
-    ok, reason = _is_allowed_url(sec, url)
-    if not ok:
-        return "", reason
-    ua = sec.get("user_agent", "SelfImprover/1.0")
-    if not _robots_allowed(sec, url, ua):
-        return "", "robots_disallow"
-    try:
-        r = requests.get(url, timeout=int(sec.get("timeout_seconds", 20)), headers={"User-Agent": ua})
-        r.raise_for_status()
-        soup = BeautifulSoup(r.text, "lxml")
-        for s in soup(["script", "style", "noscript"]):
-            s.decompose()
-        text = "\n".join(t.strip() for t in soup.get_text("\n").splitlines() if t.strip())
-        return text[: int(sec.get("max_chars_per_page", 20000))], "ok"
-    except Exception as e:
-        return "", f"fetch_error:{e}"
+from .crawler import PoliteCrawler, make_session
+from .fetch import fetch_page
+from .frontier import UrlFrontier
+from .netpolicy import RobotsCache
+from .pipeline import Redactor
+from .search import SearchCache
+from .summaries import Summarizer
 
 
 class TinyRAG:
@@ -150,6 +19,7 @@ class TinyRAG:
         self.store_path = store_path
         os.makedirs(os.path.dirname(store_path), exist_ok=True)
         self.docs = []
+        self._ids = set()
         self._load()
         self._bm25 = None
         self._reindex()
@@ -166,10 +36,11 @@ class TinyRAG:
                     self.docs.append(json.loads(line))
                 except:
                     pass
+        self._ids = {d.get("id") for d in self.docs}
 
-    def _save_one(self, doc: Dict):
+    def _save_many(self, docs: List[Dict]):
         with open(self.store_path, "a", encoding="utf-8") as f:
-            f.write(json.dumps(doc, ensure_ascii=False) + "\n")
+            f.write("".join(json.dumps(doc, ensure_ascii=False) + "\n" for doc in docs))
 
     def _reindex(self):
         if not self.docs:
@@ -178,14 +49,28 @@ class TinyRAG:
         tokenized = [d.get("text", "").lower().split() for d in self.docs]
         self._bm25 = BM25Okapi(tokenized)
 
-    def upsert(self, text: str, meta: Dict):
-        h = hashlib.sha1(text.encode("utf-8", errors="ignore")).hexdigest()
-        if any(d.get("id") == h for d in self.docs):
-            return
-        doc = {"id": h, "text": text, "meta": meta, "ts": time.time()}
-        self.docs.append(doc)
-        self._save_one(doc)
-        self._reindex()
+    def upsert_many(self, items: List[Tuple[str, Dict]]) -> List[bool]:
+        """Ajoute un lot de (texte, meta): une seule écriture disque et une seule réindexation."""
+        added = []
+        new_docs = []
+        now = time.time()
+        for text, meta in items:
+            h = hashlib.sha1(text.encode("utf-8", errors="ignore")).hexdigest()
+            if h in self._ids:
+                added.append(False)
+                continue
+            doc = {"id": h, "text": text, "meta": meta, "ts": now}
+            self._ids.add(h)
+            self.docs.append(doc)
+            new_docs.append(doc)
+            added.append(True)
+        if new_docs:
+            self._save_many(new_docs)
+            self._reindex()
+        return added
+
+    def upsert(self, text: str, meta: Dict) -> bool:
+        return self.upsert_many([(text, meta)])[0]
 
     def query(self, q: str, top_k: int = 3) -> List[Dict]:
         if not self._bm25:
@@ -206,40 +91,53 @@ def _load_cfg() -> dict:
     except Exception:
         return {}
 
+_SEARCH = None
+_SEARCH_KEY = None
+_SEARCH_LOCK = threading.Lock()
+
+
+def _search_cache(cfg: dict, root: str) -> SearchCache:
+    # un cache par processus serveur: les rafraîchissements en arrière-plan survivent à la requête;
+    # reconstruit quand la config de recherche (backend, TTL, store) change
+    global _SEARCH, _SEARCH_KEY
+    rag = cfg.get("rag", {}) or {}
+    key = json.dumps([rag.get("search") or {}, rag.get("state_path"), root], sort_keys=True, default=str)
+    with _SEARCH_LOCK:
+        if _SEARCH is None or key != _SEARCH_KEY:
+            old = _SEARCH
+            _SEARCH, _SEARCH_KEY = SearchCache.from_cfg(cfg, root), key
+            if old is not None:
+                # l'ancien cache se ferme une fois ses rafraîchissements terminés
+                threading.Thread(target=old.close, daemon=True).start()
+        return _SEARCH
+
+
 def learn_from_web(query: str, results: int = 3, store_path: str = "data/rag.jsonl") -> Dict:
     cfg = _load_cfg()
     sec = (cfg.get("rag", {}) or {}).get("security", {})
     sum_cfg = (cfg.get("rag", {}) or {}).get("summarize", {})
     rag = TinyRAG(store_path)
-    found = web_search(query, max_results=results)
+    root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    found = _search_cache(cfg, root).search(query, max_results=results)
     kept = []
-    last_req: Dict[str, float] = {}
-    domain_counts: Dict[str, int] = {}
-    redact_patterns = (sec.get("redact_patterns") or [])
-    for r in found:
-        url = r.get("href")
-        if not url:
-            continue
-        domain = _get_domain(url)
-        if domain_counts.get(domain, 0) >= int(sec.get("max_pages_per_domain", 5)):
-            continue
-        # simple rate limiting
-        rpm = int(sec.get("rate_limit_per_domain", 6))
-        spacing = 60.0 / max(1, rpm)
-        t0 = last_req.get(domain, 0.0)
-        delay = t0 + spacing - time.time()
-        if delay > 0:
-            time.sleep(min(delay, 5.0))
-        last_req[domain] = time.time()
-
-        text, reason = fetch_page(url, sec)
-        if not text:
-            continue
-        domain_counts[domain] = domain_counts.get(domain, 0) + 1
-        text = _redact(text, redact_patterns)
-        if (sum_cfg.get("enabled", False)):
-            max_in = int(sum_cfg.get("max_input_chars", 8000))
-            summary = _openai_summarize(cfg, text[:max_in])
+    redact = Redactor(sec.get("redact_patterns") or [])
+    items = [{"url": r["href"], "title": r.get("title")} for r in found if r.get("href")]
+    frontier = UrlFrontier.from_cfg(cfg, root)
+    if frontier is not None:
+        items, _ = frontier.partition(items)
+    robots = RobotsCache.from_cfg(cfg, root)
+    session = make_session(sec)
+    crawler = PoliteCrawler(sec, lambda url: fetch_page(url, sec, session, frontier, robots))
+    summarizer = Summarizer.from_cfg(cfg, root)
+    try:
+        pages = []
+        for r, text, reason in crawler.crawl(items):
+            if text:
+                pages.append((r, redact(text)))
+        # résumés en une vague (cache + requêtes parallèles), puis stockage dans l'ordre du crawl
+        summaries = summarizer.summarize_many([text for _, text in pages])
+        for (r, text), summary in zip(pages, summaries):
+            url = r["url"]
             if summary:
                 if rag.upsert(summary, {"source": url, "title": r.get("title"), "kind": "learn_summary", "q": query, "raw_len": len(text)}):
                     kept.append(url)
@@ -248,7 +146,12 @@ def learn_from_web(query: str, results: int = 3, store_path: str = "data/rag.jso
             else:
                 if rag.upsert(text, {"source": url, "title": r.get("title"), "kind": "learn", "q": query}):
                     kept.append(url)
-        else:
-            if rag.upsert(text, {"source": url, "title": r.get("title"), "kind": "learn", "q": query}):
-                kept.append(url)
+            if frontier is not None:
+                frontier.confirm(url)
+    finally:
+        session.close()
+        robots.store.close()
+        summarizer.close()
+        if frontier is not None:
+            frontier.store.close()
     return {"learned": kept, "count": len(kept)}
@@ -1,18 +1,28 @@
-import os, json, yaml, datetime, csv, random
+import os, sys, yaml, datetime, csv, math
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+from app.tools.ollama import ollama_settings, ollama_chat, warm_up
+from app.tools.evalrun import llm_limiter, evaluation_pool
+from app.tools.scoring import KeywordScorer
+from app.tools.stats import mean
+from app.tools.score_cache import ScoreCache, scorer_signature
+from app.tools.results_db import ResultsDB, csv_export
+from app.tools.sampler import cycle_sample
+from app.tools.testbank import TestBank
+from app.tools.judge import LlmJudge, RunScorer
+from app.tools.candidates import CandidateRegistry
 
 def load_cfg():
     with open("configs/config.yaml", "r", encoding="utf-8") as f:
         return yaml.safe_load(f)
 
-def load_tests(path):
-    with open(path, "r", encoding="utf-8") as f:
-        return [json.loads(l) for l in f if l.strip()]
-
 def load_prompt(path):
     with open(path, "r", encoding="utf-8") as f:
         return f.read()
 
-def call_llm(prompt, question, provider="dummy", model=""):
+def call_llm(prompt, question, provider="dummy", model="", ollama=None):
     provider = (provider or "dummy").lower()
     if provider == "openai":
         try:
@@ -32,20 +42,10 @@ def call_llm(prompt, question, provider="dummy", model=""):
             return f"[openai error] {e}"
     if provider == "ollama":
         try:
-            import requests
-            payload = {
-                "model": model or "llama3",
-                "messages": [
-                    {"role": "system", "content": prompt or ""},
-                    {"role": "user", "content": question},
-                ],
-                "stream": False,
-                "options": {"temperature": 0.2}
-            }
-            r = requests.post("http://localhost:11434/api/chat", json=payload, timeout=60)
-            r.raise_for_status()
-            data = r.json()
-            return (data.get("message", {}).get("content") or data.get("response") or "").strip()
+            return ollama_chat(ollama or ollama_settings(None), model, [
+                {"role": "system", "content": prompt or ""},
+                {"role": "user", "content": question},
+            ])
         except Exception as e:
             return f"[ollama error] {e}"
     # dummy fallback
@@ -58,55 +58,154 @@ def call_llm(prompt, question, provider="dummy", model=""):
         return "La RAM est une mémoire vive temporaire; le stockage (disque) conserve les données de façon plus permanente."
     return "Réponse générique pour test."
 
-def score_answer(answer, expected_keywords, fail_keywords):
-    a = answer.lower()
-    hits = sum(1 for k in expected_keywords if k.lower() in a)
-    for fk in fail_keywords:
-        if fk.lower() in a:
-            return 0.0, {"hits": hits, "fail": fk}
-    max_hits = max(1, len(expected_keywords))
-    return hits / max_hits, {"hits": hits}
-
 def main():
     cfg = load_cfg()
-    tests = load_tests(cfg["paths"]["tests_file"])
-    sample_n = int(cfg.get("scheduler", {}).get("sample_tests", 0))
-    if sample_n and sample_n < len(tests):
-        tests = random.sample(tests, sample_n)
-    # Découverte automatique de candidats: tous les .txt du dossier prompts sauf le prompt actif
-    prompts_dir = os.path.dirname(cfg["paths"]["active_prompt"])
-    active = os.path.abspath(cfg["paths"]["active_prompt"])
-    cands_set = set(cfg["paths"].get("candidates", []) or [])
-    import glob
-    for p in glob.glob(os.path.join(prompts_dir, "*.txt")):
-        if os.path.abspath(p) != active:
-            cands_set.add(p)
-    cands = sorted(cands_set)
+    # même tirage que l'évaluation du cycle (nombres aléatoires communs)
+    bank = TestBank.from_cfg(cfg, ROOT)
+    sampler, drawn = cycle_sample(cfg, bank.catalog(), ROOT)
+    tests = bank.load([t["id"] for t in drawn])
+    bank.close()
+    # candidats vivants du registre (nouveaux .txt du dossier prompts pris en compte, doublons
+    # et perdants archivés, au plus candidates.max_live): coût de l'A/B borné
+    registry = CandidateRegistry.from_cfg(cfg, ROOT)
+    synced = registry.sync()
+    retired = registry.enforce()
+    cands = sorted(os.path.relpath(r["path"], ROOT) for r in registry.live())
+    print(f"Candidats: {len(cands)} vivants, {synced['added']} nouveaux, {synced['duplicates']} doublons et {len(retired)} archivés")
+    if not cands:
+        registry.close()
+        print("Aucun candidat à évaluer.")
+        return
     logs_dir = cfg["paths"]["logs_dir"]
     os.makedirs(logs_dir, exist_ok=True)
 
-    results = []
-    for cand in cands:
-        prompt = load_prompt(cand)
-        total = 0.0
-        for t in tests:
-            ans = call_llm(prompt, t["question"], cfg["provider"], cfg["model"])
-            s, _ = score_answer(ans, t.get("expected_keywords", []), cfg["evaluation"]["fail_keywords"])
-            total += s
-        avg = total / max(1, len(tests))
-        results.append((cand, avg))
-
-    stamp = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
-    path = os.path.join(logs_dir, f"abtest_{stamp}.csv")
-    with open(path, "w", newline="", encoding="utf-8") as f:
-        w = csv.writer(f)
-        w.writerow(["candidate", "avg_score"])
-        for c, s in results:
-            w.writerow([c, s])
+    # matrice candidats x tests dans un seul pool borné (parallel_workers + rpm du provider)
+    prompts = {c: load_prompt(c) for c in cands}
+    judge = LlmJudge.from_cfg(cfg, ROOT)
+    cache = ScoreCache.from_cfg(cfg, ROOT, judge)
+    known = {c: cache.lookup(prompts[c], tests) if cache else {} for c in cands}
+    fresh = {c: [] for c in cands}
+    ollama = ollama_settings(cfg)
+    if (cfg.get("provider") or "").lower() == "ollama" and any(len(known[c]) < len(tests) for c in cands):
+        print("Warm-up ollama:", warm_up(ollama, cfg["model"]))
+    limiter = llm_limiter(cfg, ROOT)
+    scoring = RunScorer(KeywordScorer(cfg["evaluation"]["fail_keywords"], tests), judge)
+    by_id = {t["id"]: t for t in tests}
+
+    calls = 0
 
+    def work(job):
+        cand, t = job
+        limiter.wait()
+        return call_llm(prompts[cand], t["question"], cfg["provider"], cfg["model"], ollama=ollama)
+
+    ev = cfg.get("evaluation", {}) or {}
+    selection = (ev.get("ab_selection") or "exhaustive").lower()
+    scores = {c: {} for c in cands}  # candidat -> {test_id: score}
+    status = {c: "full" for c in cands}
+    detail = []
+    rescored = False
+
+    def to_keywords():
+        # juge lâché: toutes les notes du run (cache du juge compris) refaites aux mots-clés
+        kw = scoring.keywords([by_id[d[1]] for d in detail], [d[3] for d in detail])
+        for d, s in zip(detail, kw):
+            d[2] = s
+            scores[d[0]][d[1]] = s
+        for c in cands:
+            fresh[c] = [(by_id[d[1]], d[2], d[3]) for d in detail if d[0] == c]
+
+    def run(ex, jobs):
+        nonlocal calls, rescored
+        todo = []
+        for cand, t in jobs:
+            if t["id"] in known[cand]:
+                s, ans = known[cand][t["id"]]
+                scores[cand][t["id"]] = s
+                detail.append([cand, t["id"], s, ans])
+            else:
+                todo.append((cand, t))
+        answers = list(ex.map(work, todo))
+        calls += len(todo)
+        # notation du lot d'un coup (juge: plusieurs réponses par requête)
+        for (cand, t), ans, s in zip(todo, answers, scoring.score([t for _, t in todo], answers)):
+            ans = ans.replace("\n", " ")
+            scores[cand][t["id"]] = s
+            detail.append([cand, t["id"], s, ans])
+            fresh[cand].append((t, s, ans))
+        if scoring.fallen_back and not rescored:
+            # avant tout classement: une seule échelle pour la suite (éliminations déjà faites conservées)
+            to_keywords()
+            rescored = True
+
+    with evaluation_pool(cfg, ROOT, lambda job: (prompts[job[0]], job[1])) as ex:
+        alive = list(cands)
+        if selection == "halving" and len(cands) > 2:
+            # élimination successive: tous les candidats sur un petit échantillon, on garde la tête,
+            # on agrandit l'échantillon; seuls les survivants vont jusqu'au bout
+            order = list(tests)  # déjà entrelacé par strate: chaque tour couvre toutes les strates
+            keep_frac = min(0.9, max(0.1, float(ev.get("ab_keep_fraction", 0.5))))
+            n = min(len(order), max(1, int(ev.get("ab_initial_tests", 10))))
+            rnd = 0
+            while len(alive) > 1 and n < len(order):
+                run(ex, [(c, t) for c in alive for t in order[:n] if t["id"] not in scores[c]])
+                ranked = sorted(alive, key=lambda c: mean(scores[c].values()), reverse=True)
+                cut = mean(scores[ranked[max(1, math.ceil(len(alive) * keep_frac)) - 1]].values())
+                kept = [c for c in ranked if mean(scores[c].values()) >= cut]  # ex-aequo gardés
+                for c in alive:
+                    if c not in kept:
+                        status[c] = f"dropped_round_{rnd}"
+                alive = kept
+                n = min(len(order), int(math.ceil(n / keep_frac)))
+                rnd += 1
+        run(ex, [(c, t) for c in alive for t in tests if t["id"] not in scores[c]])
+
+    if judge:
+        judge.close()
+        print("Juge LLM:", judge.stats)
+    if cache and scoring.fallen_back:
+        cache.close()
+        cache = ScoreCache.from_cfg(cfg, ROOT)  # clé sans juge
+    if cache:
+        for c in cands:
+            cache.save(prompts[c], fresh[c])
+        cache.close()
+    print(f"Appels LLM: {calls} / {len(cands) * len(tests)} (sélection {selection}, {len(detail) - calls} scores en cache)")
+    # le gagnant est choisi parmi les candidats évalués sur tout l'échantillon
+    results = [(c, sampler.estimate(scores[c])[0]) for c in alive]
+
+    summary = []
+    for c in cands:
+        m, lo, hi = sampler.estimate(scores[c])
+        summary.append({"candidate": c, "avg_score": m, "n_tests": len(scores[c]),
+                        "ci_low": round(lo, 4), "ci_high": round(hi, 4), "status": status[c]})
     # tri décroissant
     results.sort(key=lambda x: x[1], reverse=True)
     best = results[0]
+
+    path = ""
+    if csv_export(cfg):
+        stamp = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+        path = os.path.join(logs_dir, f"abtest_{stamp}.csv")
+        with open(path, "w", newline="", encoding="utf-8") as f:
+            w = csv.writer(f)
+            w.writerow(["candidate", "avg_score", "n_tests", "ci_low", "ci_high", "status"])
+            for r in summary:
+                w.writerow([r["candidate"], r["avg_score"], r["n_tests"], r["ci_low"], r["ci_high"], r["status"]])
+        # résultats par test (même échantillon pour tous les candidats -> comparaisons appariées)
+        with open(os.path.join(logs_dir, f"abdetail_{stamp}.csv"), "w", newline="", encoding="utf-8") as f:
+            w = csv.writer(f)
+            w.writerow(["candidate", "test_id", "score", "answer"])
+            w.writerows(detail)
+    db = ResultsDB.from_cfg(cfg, ROOT)
+    db.record_ab(cfg["provider"], cfg["model"], summary, detail, prompts, best[0], best[1], path,
+                 scorer=scorer_signature(cfg, scoring.judge))
+    db.close()
+    registry.record_ab({r["candidate"]: r["avg_score"] for r in summary}, prompts, best[0])
+    retired = registry.enforce(keep=[os.path.join(ROOT, best[0])])  # promote relit le gagnant
+    registry.close()
+    if retired:
+        print("Candidats archivés:", ", ".join(os.path.relpath(p, ROOT) for p in retired))
     print("A/B terminé:", results)
     # écris le gagnant dans un fichier 'last_winner.txt'
     with open(os.path.join(logs_dir, "last_winner.txt"), "w", encoding="utf-8") as f:
@@ -0,0 +1,89 @@
+import os, sys, json, time, random, argparse, datetime, tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+from app.tools.extract import extract_text
+
+"""
+Benchmark extraction HTML: ancien chemin BeautifulSoup (document complet puis troncature)
+contre l'extracteur lxml en flux (arrêt dès max_chars).
+Usage: python scripts/bench_extract.py [max_chars] -> logs/bench/extract_<stamp>.json
+"""
+
+WORDS = "git python macos terminal commande option branche fichier dossier réseau paquet version".split()
+
+
+def synthetic_page(target_bytes: int, seed: int = 0) -> bytes:
+    rnd = random.Random(seed)
+    head = "<html><head><meta charset='utf-8'><title>Page</title><style>body{color:#333}</style>" \
+           "<script>var x = 1;</script></head><body><header><nav><ul>" + \
+           "".join(f"<li><a href='/m{i}'>Menu {i}</a></li>" for i in range(30)) + "</ul></nav></header><main>"
+    parts = [head]
+    size = len(head)
+    i = 0
+    while size < target_bytes:
+        p = " ".join(rnd.choice(WORDS) for _ in range(rnd.randint(20, 80)))
+        block = f"<h2>Section {i}</h2><div class='c'><p>{p} <a href='#{i}'>lien</a>.</p><ul><li>{p[:40]}</li></ul></div>"
+        if i % 7 == 0:
+            block += "<script>" + "x=1;" * 200 + "</script>"
+        parts.append(block)
+        size += len(block)
+        i += 1
+    parts.append("</main><footer>footer</footer></body></html>")
+    return "".join(parts).encode("utf-8")
+
+
+def bs4_text(data: bytes, max_chars: int) -> str:
+    # chemin historique de fetch_page
+    from bs4 import BeautifulSoup
+    soup = BeautifulSoup(data.decode("utf-8", errors="replace"), "lxml")
+    for s in soup(["script", "style", "noscript"]):
+        s.decompose()
+    text = "\n".join(t.strip() for t in soup.get_text("\n").splitlines() if t.strip())
+    return text[:max_chars]
+
+
+def measure(fn, data: bytes, max_chars: int, repeat: int):
+    best = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        out = fn(data, max_chars)
+        dt = time.perf_counter() - t0
+        best = dt if best is None else min(best, dt)
+    tracemalloc.start()
+    fn(data, max_chars)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"ms": round(best * 1000, 2), "peak_kb": round(peak / 1024, 1), "chars": len(out)}
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark extraction HTML: BeautifulSoup contre lxml en flux")
+    ap.add_argument("max_chars", nargs="?", type=int, default=20000, help="texte collecté par page")
+    max_chars = ap.parse_args().max_chars
+    results = []
+    for kb in (20, 200, 2000):
+        data = synthetic_page(kb * 1024, seed=kb)
+        repeat = 5 if kb < 2000 else 2
+        row = {
+            "page_kb": kb,
+            "bs4": measure(bs4_text, data, max_chars, repeat),
+            "stream": measure(extract_text, data, max_chars, repeat),
+        }
+        row["speedup"] = round(row["bs4"]["ms"] / max(0.01, row["stream"]["ms"]), 1)
+        results.append(row)
+        print(f"{kb:>5} kB  bs4 {row['bs4']['ms']:>8.1f} ms {row['bs4']['peak_kb']:>9.0f} kB  |  "
+              f"stream {row['stream']['ms']:>7.1f} ms {row['stream']['peak_kb']:>7.0f} kB  |  x{row['speedup']}")
+
+    out_dir = os.path.join(ROOT, "logs", "bench")
+    os.makedirs(out_dir, exist_ok=True)
+    stamp = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+    path = os.path.join(out_dir, f"extract_{stamp}.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"max_chars": max_chars, "results": results}, f, indent=2)
+    print("Résultats:", path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+import random, threading, time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse
+
+"""
+Serveur HTTP local pour les benchmarks d'ingestion (aucun accès internet):
+- N sites virtuels site<i>.bench (routage par en-tête Host, tous sur 127.0.0.1)
+- /p/<n>: page HTML synthétique de page_kb ko, imbriquée sur depth niveaux de <div>
+- /slow/<n>: même page servie après slow_ms
+- /robots.txt (Disallow: /private/) et /feed.xml (RSS des pages du site)
+- ETag par page et par flux -> les requêtes conditionnelles reçoivent 304
+Usage: FixtureServer(...).start(); urls via page_url()/feed_url(); stop().
+"""
+
+WORDS = "git python macos terminal commande option branche fichier dossier réseau paquet version".split()
+
+
+class FixtureServer:
+    def __init__(self, sites: int = 4, pages: int = 50, page_kb: int = 30, depth: int = 4,
+                 slow_every: int = 0, slow_ms: int = 500, seed: int = 0):
+        self.sites = int(sites)
+        self.pages = int(pages)
+        self.page_kb = int(page_kb)
+        self.depth = max(1, int(depth))
+        self.slow_every = int(slow_every)
+        self.slow_ms = int(slow_ms)
+        self.seed = int(seed)
+        self._cache = {}
+        self._lock = threading.Lock()
+        self.stats = {"requests": 0, "bytes_sent": 0, "not_modified": 0, "robots": 0, "feeds": 0}
+        self.httpd = None
+        self.port = 0
+
+    def hosts(self):
+        return [f"site{i}.bench" for i in range(self.sites)]
+
+    def page_path(self, n: int) -> str:
+        return f"/slow/{n}" if self.slow_every and n % self.slow_every == self.slow_every - 1 else f"/p/{n}"
+
+    def page_url(self, site: int, n: int) -> str:
+        return f"http://site{site}.bench:{self.port}{self.page_path(n)}"
+
+    def feed_url(self, site: int) -> str:
+        return f"http://site{site}.bench:{self.port}/feed.xml"
+
+    def page(self, host: str, n: int) -> bytes:
+        key = (host, n)
+        if key not in self._cache:
+            rnd = random.Random(f"{self.seed}:{host}:{n}")
+            target = self.page_kb * 1024
+            open_divs = "".join(f"<div class='d{d}'>" for d in range(self.depth))
+            close_divs = "</div>" * self.depth
+            head = f"<html><head><meta charset='utf-8'><title>{host} page {n}</title><script>var a=1;</script></head>" \
+                   f"<body><nav>" + "".join(f"<a href='/p/{j}'>p{j}</a>" for j in range(min(20, self.pages))) + "</nav><main>"
+            parts, size, i = [head], len(head), 0
+            while size < target:
+                p = " ".join(rnd.choice(WORDS) for _ in range(rnd.randint(30, 90)))
+                block = f"{open_divs}<h2>{host} {n}.{i}</h2><p>{p}</p><ul><li>{p[:50]}</li></ul>{close_divs}"
+                parts.append(block)
+                size += len(block)
+                i += 1
+            parts.append("</main><footer>pied</footer></body></html>")
+            self._cache[key] = "".join(parts).encode("utf-8")
+        return self._cache[key]
+
+    def feed(self, host: str) -> bytes:
+        items = "".join(
+            f"<item><title>{host} {n}</title><link>http://{host}:{self.port}{self.page_path(n)}</link>"
+            f"<guid>{host}-{n}</guid></item>"
+            for n in range(self.pages - 1, -1, -1)
+        )
+        return f"<?xml version='1.0' encoding='utf-8'?><rss version='2.0'><channel><title>{host}</title>{items}</channel></rss>".encode("utf-8")
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *a):
+                pass
+
+            def _send(self, status: int, body: bytes = b"", ctype: str = "text/html; charset=utf-8", etag: str = ""):
+                self.send_response(status)
+                if etag:
+                    self.send_header("ETag", etag)
+                if status != 304:
+                    self.send_header("Content-Type", ctype)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                if body:
+                    self.wfile.write(body)
+                with server._lock:
+                    server.stats["requests"] += 1
+                    server.stats["bytes_sent"] += len(body)
+                    if status == 304:
+                        server.stats["not_modified"] += 1
+
+            def do_GET(self):
+                host = (self.headers.get("Host") or "").split(":")[0].lower()
+                path = urlparse(self.path).path
+                if host not in server.hosts():
+                    return self._send(404)
+                if path == "/robots.txt":
+                    with server._lock:
+                        server.stats["robots"] += 1
+                    return self._send(200, b"User-agent: *\nDisallow: /private/\n", "text/plain")
+                if path == "/feed.xml":
+                    with server._lock:
+                        server.stats["feeds"] += 1
+                    etag = f'"feed-{host}-{server.pages}"'
+                    if self.headers.get("If-None-Match") == etag:
+                        return self._send(304, etag=etag)
+                    return self._send(200, server.feed(host), "application/rss+xml", etag)
+                parts = path.strip("/").split("/")
+                if len(parts) != 2 or parts[0] not in ("p", "slow") or not parts[1].isdigit():
+                    return self._send(404)
+                n = int(parts[1])
+                if n >= server.pages:
+                    return self._send(404)
+                if parts[0] == "slow":
+                    time.sleep(server.slow_ms / 1000)
+                etag = f'"{host}-{n}-{server.seed}"'
+                if self.headers.get("If-None-Match") == etag:
+                    return self._send(304, etag=etag)
+                return self._send(200, server.page(host, n), etag=etag)
+
+        return Handler
+
+    def start(self):
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self.httpd.daemon_threads = True
+        self.port = self.httpd.server_address[1]
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        if self.httpd is not None:
+            self.httpd.shutdown()
+            self.httpd.server_close()
+
+    def reset_stats(self):
+        with self._lock:
+            for k in self.stats:
+                self.stats[k] = 0
@@ -0,0 +1,140 @@
+import os, sys, json, time, shutil, argparse, datetime, tempfile, tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+import yaml
+import ingest
+from bench_fixtures import FixtureServer
+from app.tools.netpolicy import DNS
+from app.tools.search import SearchCache, FixtureBackend
+from app.tools.summaries import Summarizer
+from app.tools.web_rag import TinyRAG
+
+"""
+Benchmark d'ingestion hors-ligne et reproductible:
+- serveur de fixtures local (bench_fixtures.py), sites siteN.bench épinglés sur 127.0.0.1 dans le cache DNS
+- backend de recherche stub (FixtureBackend) -> ingest_from_search; flux RSS locaux -> ingest_from_rss
+- deux passes: à froid puis à chaud (frontière d'URL, robots et ETag déjà connus)
+- mesures: pages/s, octets/s, temps de parse, temps d'indexation, mémoire du store pour 1k chunks
+Usage: python scripts/bench_ingest.py [--sites 4 --pages 50 --page-kb 30 ...] -> logs/bench/ingest_<stamp>.json
+"""
+
+
+def bench_cfg(args, work: str, hosts) -> dict:
+    with open(os.path.join(ROOT, "configs", "config.yaml"), "r", encoding="utf-8") as f:
+        cfg = yaml.safe_load(f)
+    rag = cfg.setdefault("rag", {})
+    rag["state_path"] = os.path.join(work, "state.sqlite")
+    rag["summarize"] = dict(rag.get("summarize", {}) or {}, enabled=False)
+    rag["pipeline"] = dict(rag.get("pipeline", {}) or {}, cpu_workers=args.cpu_workers)
+    rag["search"] = dict(rag.get("search", {}) or {}, backend="fixture", max_results=args.pages)
+    rag["rss"] = dict(rag.get("rss", {}) or {}, limit_per_feed=args.pages)
+    sec = rag.setdefault("security", {})
+    sec.update(
+        allow_domains=list(hosts),
+        block_domains=[],
+        disallow_private_ips=False,  # les fixtures sont sur 127.0.0.1
+        max_pages_per_domain=args.pages * 2,
+        rate_limit_per_domain=args.rate,
+        max_concurrency=args.concurrency,
+    )
+    return cfg
+
+
+def stub_search(server: FixtureServer) -> SearchCache:
+    # une requête par site, qui renvoie toutes ses pages
+    results = {
+        f"bench site{s}": [{"title": f"site{s} {n}", "href": server.page_url(s, n), "body": ""} for n in range(server.pages)]
+        for s in range(server.sites)
+    }
+    return SearchCache(FixtureBackend(results=results), store=None)
+
+
+def run_pass(cfg: dict, server: FixtureServer, store: TinyRAG, mode: str) -> dict:
+    server.reset_stats()
+    summarizer = Summarizer(cfg)
+    t0 = time.perf_counter()
+    if mode == "search":
+        queries = [f"bench site{s}" for s in range(server.sites)]
+        out = ingest.ingest_from_search(cfg, queries, server.pages, store, summarizer, stub_search(server))
+    else:
+        feeds = [server.feed_url(s) for s in range(server.sites)]
+        out = ingest.ingest_from_rss(cfg, feeds, server.pages, store, summarizer)
+    wall = time.perf_counter() - t0
+    pipe = out.get("pipeline", {})
+    pages = out.get("crawl", {}).get("fetched", 0)
+    return {
+        "wall_s": round(wall, 3),
+        "pages": pages,
+        "pages_per_s": round(pages / wall, 1) if wall else None,
+        "bytes": server.stats["bytes_sent"],
+        "bytes_per_s": round(server.stats["bytes_sent"] / wall) if wall else None,
+        "parse_ms": pipe.get("parse_ms"),
+        "parse_ms_per_page": round(pipe["parse_ms"] / pipe["pages"], 2) if pipe.get("pages") else None,
+        "index_ms": pipe.get("write_ms"),
+        "learned_chunks": out.get("learned_chunks", 0),
+        "server": dict(server.stats),
+        "ingest": out,
+    }
+
+
+def store_memory(path: str) -> dict:
+    # coût mémoire du store rechargé (docs + index BM25), ramené à 1000 chunks
+    tracemalloc.start()
+    rag = TinyRAG(path)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    n = len(rag.docs)
+    return {
+        "chunks": n,
+        "kb_per_1k_chunks": round(current / 1024 / n * 1000, 1) if n else None,
+        "peak_kb_per_1k_chunks": round(peak / 1024 / n * 1000, 1) if n else None,
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark d'ingestion hors-ligne")
+    ap.add_argument("--sites", type=int, default=4)
+    ap.add_argument("--pages", type=int, default=50, help="pages par site")
+    ap.add_argument("--page-kb", type=int, default=30)
+    ap.add_argument("--depth", type=int, default=4, help="imbrication des blocs HTML")
+    ap.add_argument("--slow-every", type=int, default=10, help="une page lente toutes les N (0 = aucune)")
+    ap.add_argument("--slow-ms", type=int, default=300)
+    ap.add_argument("--rate", type=int, default=6000, help="requêtes/minute par domaine")
+    ap.add_argument("--concurrency", type=int, default=8)
+    ap.add_argument("--cpu-workers", default="auto")
+    ap.add_argument("--mode", choices=["search", "rss"], default="search")
+    args = ap.parse_args()
+
+    server = FixtureServer(args.sites, args.pages, args.page_kb, args.depth, args.slow_every, args.slow_ms).start()
+    for h in server.hosts():
+        DNS.add_static(h, ["127.0.0.1"])
+    work = tempfile.mkdtemp(prefix="bench_ingest_")
+    try:
+        cfg = bench_cfg(args, work, server.hosts())
+        rag_path = os.path.join(work, "rag.jsonl")
+        store = TinyRAG(rag_path)
+        passes = {}
+        for name in ("cold", "warm"):
+            passes[name] = run_pass(cfg, server, store, args.mode)
+            p = passes[name]
+            print(f"{name:>5}: {p['pages']:>5} pages {p['wall_s']:>7.2f} s  {p['pages_per_s'] or 0:>8.1f} p/s  "
+                  f"{(p['bytes_per_s'] or 0) / 1024:>9.0f} kB/s  parse {p['parse_ms']} ms  index {p['index_ms']} ms")
+        memory = store_memory(rag_path)
+        print(f"store: {memory['chunks']} chunks, {memory['kb_per_1k_chunks']} kB / 1k chunks")
+    finally:
+        server.stop()
+        shutil.rmtree(work, ignore_errors=True)
+
+    out_dir = os.path.join(ROOT, "logs", "bench")
+    os.makedirs(out_dir, exist_ok=True)
+    stamp = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+    path = os.path.join(out_dir, f"ingest_{stamp}.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"params": vars(args), "passes": passes, "memory": memory}, f, ensure_ascii=False, indent=2)
+    print("Résultats:", path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+import os, sys, json, time, random, shutil, argparse, datetime, tempfile, statistics
+from pathlib import Path
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+import yaml
+from app import main as server
+from app.tools.web_rag import TinyRAG
+
+"""
+Micro-benchmarks du code de l'arbre courant (hors réseau, provider dummy), pour la barrière
+de performance de self_update (perfgate.py):
+- /ask: latence de ask() dans le processus, avec et sans RAG (store synthétique)
+- TinyRAG: débit d'upsert (lots comme l'ingestion) et de requêtes BM25
+Chaque mesure est répétée --repeat fois, médiane retenue.
+Usage: python scripts/bench_perf.py [--docs 1000 --queries 100 --asks 50] -> logs/bench/perf_<stamp>.json
+"""
+
+WORDS = ("git python macos terminal commande option branche fichier dossier réseau paquet version "
+         "mémoire disque processus noyau serveur client requête réponse cache index").split()
+
+
+def synthetic_docs(n: int, seed: int = 0):
+    rnd = random.Random(seed)
+    return [(f"doc {i} " + " ".join(rnd.choice(WORDS) for _ in range(rnd.randint(40, 120))), {"url": f"bench://{i}"})
+            for i in range(n)]
+
+
+def synthetic_queries(n: int, seed: int = 1):
+    rnd = random.Random(seed)
+    return [" ".join(rnd.choice(WORDS) for _ in range(rnd.randint(2, 6))) for _ in range(n)]
+
+
+def bench_rag(work: str, docs, queries, batch: int) -> dict:
+    path = os.path.join(work, f"rag_{time.time_ns()}.jsonl")
+    rag = TinyRAG(path)
+    t0 = time.perf_counter()
+    for i in range(0, len(docs), batch):
+        rag.upsert_many(docs[i:i + batch])
+    upsert = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    for q in queries:
+        rag.query(q, top_k=3)
+    query = time.perf_counter() - t0
+    os.remove(path)
+    return {"rag_upsert_per_s": len(docs) / upsert if upsert else 0.0,
+            "rag_query_per_s": len(queries) / query if query else 0.0}
+
+
+def bench_ask(queries, use_rag: bool) -> float:
+    t0 = time.perf_counter()
+    for q in queries:
+        server.ask(server.AskReq(question=q, use_rag=use_rag))
+    return (time.perf_counter() - t0) * 1000 / len(queries)
+
+
+def ask_tree(work: str, docs) -> str:
+    # racine factice pour ask(): config du projet en provider dummy, store RAG synthétique
+    with open(os.path.join(ROOT, "configs", "config.yaml"), "r", encoding="utf-8") as f:
+        cfg = yaml.safe_load(f)
+    cfg["provider"] = "dummy"
+    paths = cfg.setdefault("paths", {})
+    active = paths.get("active_prompt", "prompts/active_prompt.txt")
+    paths["active_prompt"] = active if os.path.isabs(active) else os.path.join(ROOT, active)
+    os.makedirs(os.path.join(work, "configs"), exist_ok=True)
+    with open(os.path.join(work, "configs", "config.yaml"), "w", encoding="utf-8") as f:
+        yaml.safe_dump(cfg, f, allow_unicode=True)
+    TinyRAG(os.path.join(work, "data", "rag.jsonl")).upsert_many(docs)
+    return work
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Micro-benchmarks /ask et TinyRAG")
+    ap.add_argument("--docs", type=int, default=1000)
+    ap.add_argument("--batch", type=int, default=50, help="taille des lots d'upsert")
+    ap.add_argument("--queries", type=int, default=100)
+    ap.add_argument("--asks", type=int, default=50)
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--out", default="", help="fichier JSON (défaut: logs/bench/perf_<stamp>.json)")
+    args = ap.parse_args()
+
+    docs = synthetic_docs(args.docs)
+    queries = synthetic_queries(args.queries)
+    work = tempfile.mkdtemp(prefix="bench_perf_")
+    runs = []
+    try:
+        server.BASE_DIR = Path(ask_tree(os.path.join(work, "ask"), docs[:200]))
+        for _ in range(max(1, args.repeat)):
+            m = bench_rag(work, docs, queries, args.batch)
+            m["ask_ms"] = bench_ask(queries[:args.asks], use_rag=False)
+            m["ask_rag_ms"] = bench_ask(queries[:args.asks], use_rag=True)
+            runs.append(m)
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+    metrics = {k: round(statistics.median(r[k] for r in runs), 3) for k in runs[0]}
+    print(f"ask {metrics['ask_ms']:.2f} ms (RAG {metrics['ask_rag_ms']:.2f} ms)  "
+          f"upsert {metrics['rag_upsert_per_s']:.0f} docs/s  query {metrics['rag_query_per_s']:.0f} req/s")
+
+    path = args.out
+    if not path:
+        out_dir = os.path.join(ROOT, "logs", "bench")
+        os.makedirs(out_dir, exist_ok=True)
+        stamp = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+        path = os.path.join(out_dir, f"perf_{stamp}.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"params": vars(args), "metrics": metrics, "runs": runs}, f, ensure_ascii=False, indent=2)
+    print("Résultats:", path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+import os, sys, time, argparse, threading, concurrent.futures
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+import yaml
+from evaluate import call_llm
+from app.tools.ollama import ollama_settings
+from app.tools.evalrun import parallel_workers, llm_limiter
+from app.tools.jobqueue import JobQueue, worker_id
+
+"""
+Worker d'évaluation: prend des cellules (prompt, test) dans la file partagée (evaluation.queue.path),
+appelle le LLM (provider / modèle du coordinateur) et écrit la réponse; la notation reste chez le coordinateur.
+Autant de workers que voulu sur la machine de la file (WAL SQLite: pas de file sur un partage réseau).
+rate_limit_rpm est un plafond global, tenu dans la file (coordinateur + tous les workers).
+Les baux sont prolongés tant que l'appel tourne; un worker tué -> bail expiré -> travail repris ailleurs.
+Usage: python scripts/eval_worker.py [--threads 8] [--idle-exit 60] [--queue data/eval_queue.sqlite]
+"""
+
+
+def load_cfg():
+    with open(os.path.join(ROOT, "configs", "config.yaml"), "r", encoding="utf-8") as f:
+        return yaml.safe_load(f)
+
+
+def main():
+    cfg = load_cfg()
+    q = (cfg.get("evaluation", {}) or {}).get("queue", {}) or {}
+    ap = argparse.ArgumentParser(description="Worker de la file d'évaluation")
+    ap.add_argument("--queue", default="", help="fichier SQLite de la file (défaut: evaluation.queue.path)")
+    ap.add_argument("--threads", type=int, default=parallel_workers(cfg))
+    ap.add_argument("--lease", type=float, default=float(q.get("lease_seconds", 120)))
+    ap.add_argument("--poll", type=float, default=float(q.get("poll_seconds", 0.5)))
+    ap.add_argument("--idle-exit", type=float, default=0, help="s sans travail avant de quitter (0 = jamais)")
+    args = ap.parse_args()
+
+    queue = JobQueue(args.queue, int(q.get("max_attempts", 3))) if args.queue else JobQueue.from_cfg(cfg, ROOT)
+    me = worker_id()
+    limiter = llm_limiter(cfg, queue=queue)  # créneaux réservés dans la file: plafond global
+    ollama = ollama_settings(cfg)
+    prompts = {}
+    inflight = set()
+    lock = threading.Lock()
+    stop = threading.Event()
+    stats = {"done": 0, "failed": 0}
+
+    def heartbeat():
+        while not stop.wait(max(1.0, args.lease / 3)):
+            with lock:
+                ids = list(inflight)
+            if ids:
+                queue.extend(ids, me, args.lease)
+
+    def run(job):
+        job_id, p = job
+        try:
+            if p["prompt"] not in prompts:
+                prompts[p["prompt"]] = queue.prompt(p["prompt"])
+            limiter.wait()
+            ans = call_llm(prompts[p["prompt"]], p["test"]["question"], p.get("provider"), p.get("model"), ollama=ollama)
+            queue.complete(job_id, me, {"answer": ans})
+            stats["done"] += 1
+        except Exception as e:
+            queue.fail(job_id, me, str(e))
+            stats["failed"] += 1
+        finally:
+            with lock:
+                inflight.discard(job_id)
+
+    threading.Thread(target=heartbeat, daemon=True).start()
+    print(f"Worker {me}: {args.threads} threads sur {queue.path}")
+    idle_since = time.time()
+    try:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=args.threads) as ex:
+            while True:
+                with lock:
+                    free = args.threads - len(inflight)
+                jobs = queue.claim(me, free, args.lease) if free > 0 else []
+                if jobs:
+                    idle_since = time.time()
+                    with lock:
+                        inflight.update(i for i, _ in jobs)
+                    for job in jobs:
+                        ex.submit(run, job)
+                    continue
+                with lock:
+                    if inflight:
+                        idle_since = time.time()
+                if args.idle_exit and time.time() - idle_since > args.idle_exit:
+                    break
+                time.sleep(args.poll)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop.set()
+        print(f"Worker {me}: {stats['done']} travaux faits, {stats['failed']} en échec")
+        queue.close()
+
+
+if __name__ == "__main__":
+    main()
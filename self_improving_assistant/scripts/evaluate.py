@@ -1,18 +1,26 @@
-import os, json, yaml, datetime, csv, re, random, concurrent.futures
+import os, sys, yaml, datetime, csv, re
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+from app.tools.ollama import ollama_settings, ollama_chat, warm_up
+from app.tools.evalrun import llm_limiter, evaluation_pool
+from app.tools.scoring import KeywordScorer
+from app.tools.results_db import ResultsDB, csv_export
+from app.tools.score_cache import ScoreCache, scorer_signature
+from app.tools.sampler import cycle_sample
+from app.tools.testbank import TestBank
+from app.tools.judge import LlmJudge, RunScorer
 
 def load_cfg():
     with open("configs/config.yaml", "r", encoding="utf-8") as f:
         return yaml.safe_load(f)
 
-def load_tests(path):
-    with open(path, "r", encoding="utf-8") as f:
-        return [json.loads(l) for l in f if l.strip()]
-
 def load_prompt(path):
     with open(path, "r", encoding="utf-8") as f:
         return f.read()
 
-def call_llm(prompt, question, provider="dummy", model=""):
+def call_llm(prompt, question, provider="dummy", model="", ollama=None):
     provider = (provider or "dummy").lower()
     if provider == "openai":
         try:
@@ -32,20 +40,10 @@ def call_llm(prompt, question, provider="dummy", model=""):
             return f"[openai error] {e}"
     if provider == "ollama":
         try:
-            import requests
-            payload = {
-                "model": model or "llama3",
-                "messages": [
-                    {"role": "system", "content": prompt or ""},
-                    {"role": "user", "content": question},
-                ],
-                "stream": False,
-                "options": {"temperature": 0.2}
-            }
-            r = requests.post("http://localhost:11434/api/chat", json=payload, timeout=60)
-            r.raise_for_status()
-            data = r.json()
-            return (data.get("message", {}).get("content") or data.get("response") or "").strip()
+            return ollama_chat(ollama or ollama_settings(None), model, [
+                {"role": "system", "content": prompt or ""},
+                {"role": "user", "content": question},
+            ])
         except Exception as e:
             return f"[ollama error] {e}"
     # dummy fallback
@@ -58,64 +56,85 @@ def call_llm(prompt, question, provider="dummy", model=""):
         return "La RAM est une mémoire vive temporaire; le stockage (disque) conserve les données de façon plus permanente."
     return "Réponse générique pour test."
 
-def score_answer(answer, expected_keywords, fail_keywords):
-    # scoring simple: +1 par mot-clé présent (normalisé)
-    a = answer.lower()
-    hits = sum(1 for k in expected_keywords if k.lower() in a)
-    # fail si mots clefs interdits
-    for fk in fail_keywords:
-        if fk.lower() in a:
-            return 0.0, {"hits": hits, "fail": fk}
-    # normalisation 0..1
-    max_hits = max(1, len(expected_keywords))
-    return hits / max_hits, {"hits": hits}
-
 def main():
     cfg = load_cfg()
-    tests = load_tests(cfg["paths"]["tests_file"])
-    # sampling optionnel
-    sample_n = int(cfg.get("scheduler", {}).get("sample_tests", 0)) or int(cfg.get("evaluation", {}).get("daily_sample_size", 0) or 0)
-    if sample_n and sample_n < len(tests):
-        tests = random.sample(tests, sample_n)
+    # nouveau cycle: tirage stratifié mémorisé, repris par ab_test et promote
+    bank = TestBank.from_cfg(cfg, ROOT)
+    if bank.stats.get("invalid"):
+        print(f"Tests ignorés (schéma): {bank.stats['invalid']}", *bank.stats["errors"][:5], sep="\n  ")
+    sampler, drawn = cycle_sample(cfg, bank.catalog(), ROOT, new_cycle=True)
+    tests = bank.load([t["id"] for t in drawn])  # seuls les tests tirés sont lus
+    bank.close()
+    plan = sampler.report(tests)
+    print(f"Échantillon: {plan['n']}/{plan['population']} tests, {len(plan['strata'])} strates (graine {plan['seed']})")
     prompt = load_prompt(cfg["paths"]["active_prompt"])
+    # cellules (prompt, test) déjà notées: pas d'appel LLM
+    judge = LlmJudge.from_cfg(cfg, ROOT)
+    cache = ScoreCache.from_cfg(cfg, ROOT, judge)
+    known = cache.lookup(prompt, tests) if cache else {}
+    todo = [t for t in tests if t["id"] not in known]
+    ollama = ollama_settings(cfg)
+    if todo and (cfg.get("provider") or "").lower() == "ollama":
+        # charge le modèle avant la rafale (sinon le 1er appel paie le chargement)
+        print("Warm-up ollama:", warm_up(ollama, cfg["model"]))
 
     os.makedirs(cfg["paths"]["logs_dir"], exist_ok=True)
     stamp = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
     out_csv = os.path.join(cfg["paths"]["logs_dir"], f"eval_{stamp}.csv")
 
+    limiter = llm_limiter(cfg, ROOT)
+
     def work(item):
         t = item
-        ans = call_llm(prompt, t["question"], cfg["provider"], cfg["model"])
-        s, _ = score_answer(ans, t.get("expected_keywords", []), cfg["evaluation"]["fail_keywords"])
-        return t["id"], s, ans.replace("\n", " ")
+        limiter.wait()
+        return call_llm(prompt, t["question"], cfg["provider"], cfg["model"], ollama=ollama)
 
-    # Parallel workers
-    pw = cfg.get("evaluation", {}).get("parallel_workers", "auto")
-    if isinstance(pw, str) and pw.lower() == "auto":
-        cpu = os.cpu_count() or 4
-        workers = max(1, min(cpu-1, 24))
-    else:
-        try:
-            workers = max(1, int(pw))
-        except:
-            workers = 4
+    # pool local (parallel_workers) ou file de travaux partagée avec scripts/eval_worker.py
+    with evaluation_pool(cfg, ROOT, lambda t: (prompt, t)) as ex:
+        answers = list(ex.map(work, todo))
+    # notation en un seul passage sur le lot (automate compilé une fois pour l'échantillon, juge par lots)
+    scoring = RunScorer(KeywordScorer(cfg["evaluation"]["fail_keywords"], todo), judge)
+    scored = scoring.score(todo, answers)
+    done = dict(known)
+    final = []
+    for t, ans, s in zip(todo, answers, scored):
+        done[t["id"]] = (s, ans.replace("\n", " "))
+        final.append((t, *done[t["id"]]))
+    if scoring.fallen_back:
+        # juge lâché: tout le run aux mots-clés (scores repris du cache du juge compris)
+        kw = scoring.keywords(tests, [done[t["id"]][1] for t in tests])
+        done = {t["id"]: (s, done[t["id"]][1]) for t, s in zip(tests, kw)}
+        final = [(t, *done[t["id"]]) for t in tests]
+        if cache:
+            cache.close()
+            cache = ScoreCache.from_cfg(cfg, ROOT)  # clé sans juge
+    if judge:
+        judge.close()
+        print("Juge LLM:", judge.stats)
+    if cache:
+        cache.save(prompt, final)
+        cache.close()
+        print(f"Cache des scores: {len(known)}/{len(tests)} réutilisés")
 
-    rows = []
-    total = 0.0
-    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as ex:
-        for tid, s, ans in ex.map(work, tests):
-            rows.append([tid, s, ans])
-            total += s
-    avg = total / max(1, len(tests))
+    rows = [[t["id"], *done[t["id"]]] for t in tests]
+    # moyenne stratifiée (poids des strates dans le jeu complet)
+    avg, lo, hi = sampler.estimate({r[0]: r[1] for r in rows})
 
-    with open(out_csv, "w", newline="", encoding="utf-8") as f:
-        w = csv.writer(f)
-        w.writerow(["test_id", "score", "answer"])
-        w.writerows(rows)
-        w.writerow([])
-        w.writerow(["avg_score", avg])
+    if csv_export(cfg):
+        with open(out_csv, "w", newline="", encoding="utf-8") as f:
+            w = csv.writer(f)
+            w.writerow(["test_id", "score", "answer"])
+            w.writerows(rows)
+            w.writerow([])
+            w.writerow(["avg_score", avg])
+    else:
+        out_csv = ""
+    db = ResultsDB.from_cfg(cfg, ROOT)
+    run_id = db.record_eval(prompt, cfg["paths"]["active_prompt"], cfg["provider"], cfg["model"], rows, avg, out_csv,
+                            scorer=scorer_signature(cfg, scoring.judge))
+    db.close()
 
-    print(f"Évaluation terminée. Score moyen = {avg:.3f}. Résultats: {out_csv}")
+    print(f"Évaluation terminée. Score moyen = {avg:.3f} [IC {lo:.3f}, {hi:.3f}]. Résultats: run #{run_id} {out_csv}")
 
 if __name__ == "__main__":
     main()
@@ -1,12 +1,31 @@
-import os, yaml, glob, random, re
+import os, sys, yaml, re
 from datetime import datetime
 
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+from app.tools.results_db import ResultsDB, prompt_hash
+from app.tools.testbank import TestBank
+from app.tools.sampler import stratum
+from app.tools.stats import mean
+from app.tools.candidates import CandidateRegistry
+
 """
 Crée automatiquement de nouveaux prompts candidats à partir du prompt actif
-et des zones faibles observées (tags) dans le dataset.
-Heuristique simple: injecter des consignes ciblées pour renforcer les domaines.
+et de ses résultats récents (results_db): scores par test ramenés aux tags, tags les plus
+faibles et questions en échec -> quelques mutations ciblées (une par tag faible).
+Sans résultat pour le prompt actif: aucun candidat (pas de mutation à l'aveugle).
 """
 
+TAG_HINTS = {
+    "macos": "Quand la question concerne macOS, inclure la commande exacte avec options, et un exemple de sortie.",
+    "cli": "Pour la ligne de commande, donner la commande complète prête à copier, avec chaque option expliquée.",
+    "git": "Pour git, fournir la commande précise et rappeler les flags importants, avec une alternative si applicable.",
+    "python": "Pour Python, inclure la commande pip/venv et un snippet minimal exécutable.",
+    "safety": "Si la requête est risquée, proposer explicitement des alternatives sûres et prévenir des conséquences.",
+    "network": "Pour réseau, expliquer rapidement la signification des flags (ex: -c pour ping) et interpréter le résultat attendu.",
+}
+
 def load_cfg():
     with open("configs/config.yaml", "r", encoding="utf-8") as f:
         return yaml.safe_load(f)
@@ -17,62 +36,93 @@ def read(path, default=""):
     except:
         return default
 
-def write(path, content):
-    os.makedirs(os.path.dirname(path), exist_ok=True)
-    with open(path, "w", encoding="utf-8") as f:
-        f.write(content)
+def hint_for(tag):
+    return TAG_HINTS.get(tag) or (
+        f"Pour les questions du domaine « {tag} », répondre directement avec les termes techniques exacts "
+        "(commandes, noms, valeurs), puis un exemple concret."
+    )
+
+def test_tags(t):
+    return list(t.get("tags") or []) or [stratum(t)]
 
-def infer_weak_hints(tags_counts):
-    # Retourne quelques messages d'amélioration en fonction des tags fréquents
-    hints = []
-    if tags_counts.get("macos") or tags_counts.get("cli"):
-        hints.append("Quand la question concerne macOS/CLI, inclure la commande exacte avec options, et un exemple de sortie.")
-    if tags_counts.get("git"):
-        hints.append("Pour git, fournir la commande précise et rappeler les flags importants, avec une alternative si applicable.")
-    if tags_counts.get("python"):
-        hints.append("Pour Python, inclure la commande pip/venv et un snippet minimal exécutable.")
-    if tags_counts.get("safety"):
-        hints.append("Si la requête est risquée, proposer explicitement des alternatives sûres et prévenir des conséquences.")
-    if tags_counts.get("network"):
-        hints.append("Pour réseau, expliquer rapidement la signification des flags (ex: -c pour ping) et interpréter le résultat attendu.")
-    return hints
+def weak_tags(cfg, active):
+    """[(tag, moyenne, nb de tests, questions en échec)] du plus faible au plus fort,
+    d'après les scores récents du prompt actif (eval et A/B)."""
+    g = cfg.get("grow", {}) or {}
+    db = ResultsDB.from_cfg(cfg, ROOT)
+    rows = db.prompt_scores(prompt_hash(active), int(g.get("max_scores", 5000)))
+    db.close()
+    per_test = {}
+    for r in rows:
+        per_test.setdefault(r["test_id"], []).append(r["score"])
+    if not per_test:
+        return []
+    bank = TestBank.from_cfg(cfg, ROOT)
+    tests = bank.load(list(per_test))
+    bank.close()
+    fail_below = float(g.get("fail_below", 0.5))
+    by_tag = {}
+    for t in tests:
+        s = mean(per_test[t["id"]])
+        for tag in test_tags(t):
+            e = by_tag.setdefault(tag, {"scores": [], "failing": []})
+            e["scores"].append(s)
+            if s < fail_below:
+                e["failing"].append((s, t["question"]))
+    overall = mean(s for v in per_test.values() for s in v)
+    min_tests = int(g.get("min_tests_per_tag", 2))
+    out = []
+    for tag, e in by_tag.items():
+        m = mean(e["scores"])
+        # tag sous la moyenne générale avec des échecs, sur assez de tests pour que ce soit un signal
+        if len(e["scores"]) >= min_tests and e["failing"] and m <= overall:
+            out.append((tag, m, len(e["scores"]), list(dict.fromkeys(q for _, q in sorted(e["failing"])))))
+    out.sort(key=lambda x: (x[1], -x[2]))
+    return out
 
-def discover_recent_eval(logs_dir):
-    files = sorted(glob.glob(os.path.join(logs_dir, "eval_*.csv")))
-    return files[-1] if files else None
+def mutation(active, tag, failing, max_examples):
+    extra = "\n\nAMÉLIORATIONS DEMANDÉES:\n- " + hint_for(tag) + "\n"
+    if failing and max_examples > 0:
+        extra += "Exemples de questions de ce domaine à traiter avec plus de précision:\n"
+        extra += "".join(f"- {q}\n" for q in failing[:max_examples])
+    return active.strip() + extra
 
 def main():
     cfg = load_cfg()
     active_path = cfg["paths"]["active_prompt"]
     prompts_dir = os.path.dirname(active_path)
-    logs_dir = cfg["paths"]["logs_dir"]
+    g = cfg.get("grow", {}) or {}
 
     active = read(active_path)
-    # Heuristique: on ne parse pas encore les scores par tag (CSV minimal), on part sur la couverture des tags du dataset
-    # Amélioration future: stocker test_id->tags dans le CSV pour cibler précisément.
-    # Ici, on ajoute des consignes génériques orientées domaines usuels.
-    tags_counts = {"macos": 1, "cli": 1, "git": 1, "python": 1, "safety": 1, "network": 1}
-    hints = infer_weak_hints(tags_counts)
+    weak = weak_tags(cfg, active)
+    if not weak:
+        print("Aucun tag faible dans les résultats récents du prompt actif: pas de nouveau candidat.")
+        return
+    print("Tags faibles:", ", ".join(f"{tag} {m:.2f} ({n} tests, {len(f)} échecs)" for tag, m, n, f in weak))
 
     stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
-    suffixes = [
-        "mac_cli_focus",
-        "git_safety_focus",
-        "python_env_focus",
-    ]
-    created = []
-    for suf in suffixes:
-        extra = "\n\nAMÉLIORATIONS DEMANDÉES:\n- " + "\n- ".join(hints) + "\n"
-        mutated = active.strip() + extra
-        out_path = os.path.join(prompts_dir, f"auto_{suf}_{stamp}.txt")
-        write(out_path, mutated)
-        created.append(out_path)
+    registry = CandidateRegistry.from_cfg(cfg, ROOT)
+    created, skipped = [], []
+    for tag, m, n, failing in weak[: max(1, int(g.get("max_mutations", 3)))]:
+        mutated = mutation(active, tag, failing, int(g.get("max_examples", 2)))
+        slug = re.sub(r"[^a-z0-9]+", "_", tag.lower()).strip("_") or "tag"
+        out_path = os.path.join(ROOT, prompts_dir, f"auto_{slug}_focus_{stamp}.txt")
+        # contenu déjà connu (candidat vivant, archivé ou prompt actif): rien d'écrit
+        if registry.register(out_path, mutated, parent=active, mutation=f"tag:{tag}"):
+            created.append(out_path)
+        else:
+            skipped.append(tag)
+    retired = registry.enforce()
+    registry.close()
 
-    # Met à jour la liste des candidats dans la config ? Non (on garde la config statique)
-    # Les A/B tests découvriront automatiquement les nouveaux fichiers en plus des candidats déclarés.
-    print("Candidats générés:")
+    # Les A/B tests prennent les candidats vivants du registre (au plus candidates.max_live).
+    print("Candidats générés:" if created else "Aucun nouveau candidat.")
     for p in created:
-        print(" -", p)
+        print(" -", os.path.relpath(p, ROOT))
+    if skipped:
+        print("Mutations déjà connues:", ", ".join(skipped))
+    if retired:
+        print("Candidats archivés:", ", ".join(os.path.relpath(p, ROOT) for p in retired))
 
 if __name__ == "__main__":
     main()
@@ -1,4 +1,18 @@
-import os, yaml, time
+import os, sys, json, yaml, time, glob
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+from app.tools.ollama import ollama_settings, warm_up
+from app.tools.evalrun import parallel_workers, llm_limiter, evaluation_pool
+from app.tools.stats import PairedSprt, mean, mean_ci
+from app.tools.score_cache import ScoreCache
+from app.tools.scoring import KeywordScorer
+from app.tools.results_db import ResultsDB
+from app.tools.sampler import cycle_sample
+from app.tools.testbank import TestBank
+from app.tools.judge import LlmJudge, RunScorer
+from evaluate import call_llm
 
 def load_cfg():
     with open("configs/config.yaml","r",encoding="utf-8") as f:
@@ -18,6 +32,137 @@ def write_promotion_ts(logs_dir):
     with open(os.path.join(logs_dir,"last_promotion.ts"),"w") as f:
         f.write(str(time.time()))
 
+def last_active_score(cfg, logs_dir):
+    # score actuel: dernier run d'évaluation (recherche indexée dans la base des résultats)
+    db = ResultsDB.from_cfg(cfg, ROOT)
+    run = db.last_run("eval")
+    db.close()
+    if run is not None:
+        return float(run["avg_score"] or 0.0)
+    # base encore vide: anciens CSV
+    eval_files = sorted(glob.glob(os.path.join(logs_dir, "eval_*.csv")))
+    active_score = 0.0
+    if eval_files:
+        with open(eval_files[-1], "r", encoding="utf-8", errors="ignore") as f:
+            for line in f:
+                if line.strip().startswith("avg_score"):
+                    parts = line.strip().split(",")
+                    if len(parts)>1: active_score = float(parts[1])
+    return active_score
+
+def same_scale(cfg):
+    # derniers runs eval et A/B notés à la même échelle (juge, ou mots-clés après repli)?
+    db = ResultsDB.from_cfg(cfg, ROOT)
+    ev, ab = db.last_run("eval"), db.last_run("abtest")
+    db.close()
+    if not ev or not ab or not ev.get("scorer") or not ab.get("scorer"):
+        return True
+    return ev["scorer"] == ab["scorer"]
+
+def sequential_test(cfg, cand):
+    """Actif vs gagnant sur les mêmes tests, par lots, jusqu'à décision du SPRT (ou sprt_max_tests).
+    Le gagnant a été retenu pour ses scores sur le tirage de l'A/B (biaisés vers le haut): la confirmation
+    se fait hors de ce tirage, et le gagnant est noté à neuf (jamais depuis le cache des scores)."""
+    sch = cfg["scheduler"]
+
+    def new_sprt():
+        return PairedSprt(
+            effect=float(sch.get("sprt_effect", 0.05)),
+            alpha=float(sch.get("sprt_alpha", 0.05)),
+            beta=float(sch.get("sprt_beta", 0.2)),
+            min_n=int(sch.get("sprt_min_tests", 10)),
+        )
+    sprt = new_sprt()
+    max_tests = int(sch.get("sprt_max_tests", 200))
+    bank = TestBank.from_cfg(cfg, ROOT)
+    catalog = bank.catalog()
+    # tests hors du tirage de l'A/B, entrelacés par strate (tirage repris seulement si rien d'autre)
+    sampler, drawn = cycle_sample(cfg, catalog, ROOT)
+    drawn_ids = {t["id"] for t in drawn}
+    catalog = sampler.order(catalog)
+    rest = [t for t in catalog if t["id"] not in drawn_ids]
+    catalog = rest or catalog
+    tests = bank.load([t["id"] for t in catalog[:max_tests]])
+    bank.close()
+    prompts = {"active": open(cfg["paths"]["active_prompt"], "r", encoding="utf-8").read(),
+               "cand": open(cand, "r", encoding="utf-8").read()}
+    judge = LlmJudge.from_cfg(cfg, ROOT)
+    cache = ScoreCache.from_cfg(cfg, ROOT, judge)
+    # seul l'actif profite du cache: les scores connus du gagnant sont ceux qui l'ont fait gagner
+    cached = cache.lookup(prompts["active"], tests) if cache else {}
+    score_of = {("active", tid): s for tid, (s, _) in cached.items()}  # (qui, test_id) -> score
+    answer_of = {("active", tid): a for tid, (_, a) in cached.items()}
+    fresh = []  # cellules notées dans ce run (cache des scores)
+    ollama = ollama_settings(cfg)
+    if (cfg.get("provider") or "").lower() == "ollama":
+        print("Warm-up ollama:", warm_up(ollama, cfg["model"]))
+    limiter = llm_limiter(cfg, ROOT)
+    scoring = RunScorer(KeywordScorer(cfg["evaluation"]["fail_keywords"], tests), judge)
+    by_id = {t["id"]: t for t in tests}
+
+    def answer(job):
+        which, t = job
+        limiter.wait()
+        return call_llm(prompts[which], t["question"], cfg["provider"], cfg["model"], ollama=ollama)
+
+    def pair(t):
+        return score_of[("cand", t["id"])], score_of[("active", t["id"])]
+
+    workers = parallel_workers(cfg)
+    batch = max(1, int(sch.get("sprt_batch", workers)))
+    seen = []
+    calls = 0
+    rescored = False
+    with evaluation_pool(cfg, ROOT, lambda job: (prompts[job[0]], job[1])) as ex:
+        for i in range(0, len(tests), batch):
+            part = tests[i:i + batch]
+            jobs = [(w, t) for t in part for w in ("cand", "active") if (w, t["id"]) not in score_of]
+            answers = list(ex.map(answer, jobs))
+            calls += len(jobs)
+            for (w, t), ans, s in zip(jobs, answers, scoring.score([t for _, t in jobs], answers)):
+                score_of[(w, t["id"])], answer_of[(w, t["id"])] = s, ans.replace("\n", " ")
+                fresh.append((w, t["id"]))
+            if scoring.fallen_back and not rescored:
+                # juge lâché: toutes les notes du run (cache de l'actif compris) refaites aux mots-clés,
+                # SPRT repris depuis le début sur cette seule échelle
+                keys = list(answer_of)
+                kw = scoring.keywords([by_id[tid] for _, tid in keys], [answer_of[k] for k in keys])
+                score_of.update(zip(keys, kw))
+                sprt = new_sprt()
+                for t in seen:
+                    c, a = pair(t)
+                    sprt.add(c - a)
+                rescored = True
+            for t in part:
+                c, a = pair(t)
+                sprt.add(c - a)
+            seen += part
+            if sprt.decision():
+                break
+    if judge:
+        judge.close()
+    if cache and scoring.fallen_back:
+        cache.close()
+        cache = ScoreCache.from_cfg(cfg, ROOT)  # clé sans juge
+        fresh = list(answer_of)
+    if cache:
+        for w, p in prompts.items():
+            cache.save(p, [(by_id[tid], score_of[(x, tid)], answer_of[(x, tid)]) for x, tid in fresh if x == w])
+        cache.close()
+    pairs = [pair(t) for t in seen]
+    diffs = [c - a for c, a in pairs]
+    m, lo, hi = mean_ci(diffs)
+    return {
+        "decision": sprt.decision(),
+        "n_tests": len(pairs),
+        "llm_calls": calls,
+        "outside_ab_draw": bool(rest),
+        "keyword_fallback": scoring.fallen_back,
+        "cand_avg": mean(c for c, _ in pairs),
+        "active_avg": mean(a for _, a in pairs),
+        "gain": m, "gain_ci": [lo, hi], "llr": sprt.llr(),
+    }
+
 def main():
     cfg = load_cfg()
     logs_dir = cfg["paths"]["logs_dir"]
@@ -34,27 +179,33 @@ def main():
         print("Cooldown: pas de promotion.")
         return
 
-    # Lire score actuel (dernier eval CSV) pour comparer
-    import glob
-    eval_files = sorted(glob.glob(os.path.join(logs_dir, "eval_*.csv")))
-    active_score = 0.0
-    if eval_files:
-        with open(eval_files[-1], "r", encoding="utf-8", errors="ignore") as f:
-            for line in f:
-                if line.strip().startswith("avg_score"):
-                    parts = line.strip().split(",")
-                    if len(parts)>1: active_score = float(parts[1])
+    mode = (cfg["scheduler"].get("promotion_test") or "threshold").lower()
+    if mode == "sprt":
+        res = sequential_test(cfg, cand)
+        with open(os.path.join(logs_dir, "last_promotion_test.json"), "w", encoding="utf-8") as f:
+            json.dump(dict(res, candidate=cand, ts=now), f, indent=2)
+        gain = res["gain"]
+        # pas de décision au plafond de tests: on ne promeut que si l'intervalle exclut 0
+        promote = res["decision"] == "accept" or (not res["decision"] and res["gain_ci"][0] > 0 and gain >= min_gain)
+        info = f"SPRT {res['decision'] or 'indécis'} après {res['n_tests']} tests, {res['llm_calls']} appels"
+        cand_score = res["cand_avg"]
+    else:
+        gain = cand_score - last_active_score(cfg, logs_dir)
+        promote = gain >= min_gain
+        info = f"seuil {min_gain:.3f}"
+        if promote and not same_scale(cfg):
+            promote = False
+            info += "; scores A/B et éval à des échelles différentes (repli du juge), décision au prochain cycle"
 
-    gain = cand_score - active_score
-    if gain >= min_gain:
+    if promote:
         with open(cand, "r", encoding="utf-8") as src:
             content = src.read()
         with open(cfg["paths"]["active_prompt"], "w", encoding="utf-8") as dst:
             dst.write(content)
         write_promotion_ts(logs_dir)
-        print(f"PROMOTION: {cand} (score={cand_score:.3f}, gain={gain:.3f})")
+        print(f"PROMOTION: {cand} (score={cand_score:.3f}, gain={gain:.3f}; {info})")
     else:
-        print(f"Pas de promotion (gain {gain:.3f} < {min_gain:.3f}).")
+        print(f"Pas de promotion (gain {gain:.3f}; {info}).")
 
 if __name__ == "__main__":
     main()
@@ -1,11 +1,20 @@
-import os, json, yaml, subprocess, sys, shutil, datetime, tempfile
+import os, json, yaml, subprocess, sys, datetime, time, concurrent.futures
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+from app.tools.results_db import ResultsDB
+from app.tools.sandbox import Sandbox
+from app.tools.perfgate import PerfGate, best, report
+from app.tools.stats import mean_ci
 
 """
 Tentative d'auto-mise à jour du code:
 - Demande au LLM de proposer un petit patch (diff unifié) dans des zones autorisées
-- Applique le patch en local (dry-run possible)
-- Lance evaluate/ab_test/promote et mesure le gain
-- Si pas de gain, revert
+- Applique le patch dans un bac à sable (sandbox.py), jamais dans l'arbre vivant (dry-run possible)
+- Évalue en parallèle la base et le patch, chacun dans son bac à sable, sur le même échantillon
+- Barrière de performance (perfgate.py): micro-benchmarks /ask et RAG + durée d'évaluation, base contre patch
+- Gain suffisant sans régression: les fichiers patchés remplacent les fichiers vivants (os.replace); sinon rien à défaire
 """
 
 def load_cfg():
@@ -27,7 +36,14 @@ def venv_python():
 def run(cmd, cwd=None):
     return subprocess.run(cmd, cwd=cwd, capture_output=True, text=True)
 
-def last_eval_score(logs_dir):
+def last_eval_score(cfg, logs_dir):
+    # dernier run d'évaluation: recherche indexée dans la base des résultats
+    db = ResultsDB.from_cfg(cfg, ROOT)
+    last = db.last_run("eval")
+    db.close()
+    if last is not None:
+        return float(last["avg_score"] or 0.0)
+    # base encore vide: anciens CSV
     import glob
     files = sorted(glob.glob(os.path.join(logs_dir, "eval_*.csv")))
     if not files:
@@ -67,9 +83,9 @@ def call_llm_system(cfg, sys_prompt, user_prompt):
             return f"[openai error] {e}"
     return ""  # autres providers à ajouter si souhaité
 
-def apply_unified_patch(patch_text, allow_paths, max_files=3):
-    """Applique un diff unifié minimaliste via 'patch' si dispo, sinon best effort.
-    Par simplicité et robustesse, on crée un temp repo et on écrit directement les fichiers si le patch est annoté '*** Update File:' (format interne déjà utilisé).
+def apply_unified_patch(patch_text, sandbox, max_files=3):
+    """Applique un diff unifié minimaliste dans le bac à sable (chemins hors allow_paths ignorés).
+    Format interne: '*** Update File: <path>' suivi de '+++ NEW CONTENT' et du contenu complet.
     """
     # Supporte notre format interne si présent, sinon noop.
     blocks = [b for b in patch_text.split("*** Update File:") if b.strip()]
@@ -77,17 +93,9 @@ def apply_unified_patch(patch_text, allow_paths, max_files=3):
     for b in blocks[:max_files]:
         header, *rest = b.split("\n", 1)
         path = header.strip()
-        # sécurité chemins
-        if not any(path.startswith(ap) for ap in allow_paths):
-            continue
         if not rest:
             continue
         content = rest[0]
-        try:
-            with open(path, "r", encoding="utf-8") as f:
-                old = f.read()
-        except FileNotFoundError:
-            old = ""
         # naïf: si contient '->' on suppose remplacement complet
         if "->" in header:
             # format non supporté ici
@@ -98,11 +106,42 @@ def apply_unified_patch(patch_text, allow_paths, max_files=3):
         else:
             # fallback: remplacement total (dans un vrai système, parser le diff)
             new = content
-        with open(path, "w", encoding="utf-8") as f:
-            f.write(new)
-        changed.append(path)
+        # sécurité chemins: sandbox.write refuse ce qui sort des dossiers autorisés
+        if sandbox.write(path, new):
+            changed.append(path)
     return changed
 
+def sandbox_eval(py, box, timeout, seed):
+    """evaluate.py dans le bac à sable -> {test_id: score}, score moyen (None si échec), durée."""
+    env = dict(os.environ, EVAL_SEED=seed)
+    t0 = time.perf_counter()
+    try:
+        proc = subprocess.run([py, os.path.join("scripts", "evaluate.py")], cwd=box.path, env=env,
+                              capture_output=True, text=True, timeout=timeout)
+    except subprocess.TimeoutExpired:
+        return None, None, 0.0, "timeout"
+    wall = time.perf_counter() - t0
+    if proc.returncode != 0:
+        return None, None, wall, (proc.stderr or proc.stdout)[-2000:]
+    db = ResultsDB(os.path.join(box.path, "data", "results.sqlite"))
+    last = db.last_run("eval")
+    scores = db.run_scores(last["id"]) if last else {}
+    db.close()
+    return scores, (float(last["avg_score"] or 0.0) if last else None), wall, ""
+
+def sandbox_bench(py, box, bench, timeout):
+    """scripts/bench_perf.py dans le bac à sable -> mesures (None si échec)."""
+    out = os.path.join(box.path, "logs", f"perf_{time.time_ns()}.json")
+    args = [py, os.path.join("scripts", "bench_perf.py"), "--out", out]
+    for k, v in bench.items():
+        args += [f"--{k}", str(v)]
+    try:
+        proc = subprocess.run(args, cwd=box.path, capture_output=True, text=True, timeout=timeout)
+        with open(out, "r", encoding="utf-8") as f:
+            return json.load(f)["metrics"] if proc.returncode == 0 else None
+    except (subprocess.TimeoutExpired, OSError, ValueError, KeyError):
+        return None
+
 def main():
     cfg = load_cfg()
     su = cfg.get("self_update", {})
@@ -116,7 +155,7 @@ def main():
 
     logs_dir = cfg["paths"]["logs_dir"]
     os.makedirs(logs_dir, exist_ok=True)
-    before = last_eval_score(logs_dir)
+    current = last_eval_score(cfg, logs_dir)
 
     # Contexte minimal pour le LLM: objectifs et contraintes
     sys_prompt = (
@@ -126,7 +165,7 @@ def main():
         "Propose un patch au format '*** Update File: <path>\n+++ NEW CONTENT\n<contenu complet>' pour chaque fichier."
     )
     user_prompt = (
-        "Objectif: augmenter avg_score > " + str(su.get("min_gain",0.01)) + " par rapport à l'actuel.\n"
+        "Objectif: augmenter avg_score > " + str(su.get("min_gain",0.01)) + " par rapport à l'actuel (" + f"{current:.3f}" + ").\n"
         "Contexte: nous avons des tests variés (macOS/CLI, git, python, safety).\n"
         "Idées: améliorer prompts, ajouter détails dans réponses RAG, ajuster sampling/timeouts.\n"
         "Propose un patch minimal et sûr."
@@ -148,35 +187,84 @@ def main():
         print("Dry-run: patch non appliqué. Voir:", note_path)
         return
 
-    # Snapshot pour rollback
-    backup_dir = os.path.join(logs_dir, f"backup_{stamp}")
-    os.makedirs(backup_dir, exist_ok=True)
-    for p in allow_paths:
-        if os.path.exists(p):
-            shutil.copytree(p, os.path.join(backup_dir, p.strip("/")), dirs_exist_ok=True)
+    py = os.path.abspath(venv_python())
+    # bacs à sable: base (liens seuls) et patch; résultats et caches propres à chacun
+    overrides = {
+        "evaluation": {"score_cache": False, "csv_export": False, "sampling": "fixed", "executor": "local",
+                       "results_db": "data/results.sqlite"},
+        "scheduler": {"sample_tests": int(su.get("eval_sample_tests", 50))},
+        "self_update": {"enabled": False},
+    }
+    gate = PerfGate.from_cfg(cfg, ROOT)
+    base = Sandbox(ROOT, allow_paths, cfg, overrides, name="su_base")
+    box = Sandbox(ROOT, allow_paths, cfg, overrides, name="su_patch")
+    try:
+        changed = apply_unified_patch(patch, box, max_files=max_files)
+        if not changed:
+            print("Patch non appliqué (aucun fichier autorisé modifié).")
+            return
 
-    changed = apply_unified_patch(patch, allow_paths, max_files=max_files)
-    if not changed:
-        print("Patch non appliqué (aucun fichier autorisé modifié).")
-        return
+        # base et patch évalués en même temps, même graine -> mêmes tests
+        timeout = int(cfg.get("scheduler", {}).get("script_timeout_seconds", 180))
+        with concurrent.futures.ThreadPoolExecutor(max_workers=2) as ex:
+            fb = ex.submit(sandbox_eval, py, base, timeout, stamp)
+            fp = ex.submit(sandbox_eval, py, box, timeout, stamp)
+            (b_scores, before, b_wall, b_err), (p_scores, after, p_wall, p_err) = fb.result(), fp.result()
+        if before is None or after is None:
+            result = f"Évaluation impossible ({'base' if before is None else 'patch'}): {b_err or p_err}"
+            accepted = False
+        else:
+            common = [t for t in b_scores if t in p_scores]
+            gain, lo, hi = mean_ci(p_scores[t] - b_scores[t] for t in common)
+            # gain moyen suffisant et IC au-dessus de 0 (sinon bruit de l'échantillon)
+            accepted = bool(common) and gain >= float(su.get("min_gain", 0.01)) and lo > 0
+            result = (f"Score base: {before:.3f}, patch: {after:.3f}, gain apparié: {gain:.3f} "
+                      f"[IC {lo:.3f}, {hi:.3f}] sur {len(common)} tests")
+        print(result)
 
-    # Évaluer après patch
-    py = venv_python()
-    run([py, "scripts/evaluate.py"]).check_returncode()
-    after = last_eval_score(logs_dir)
-    gain = after - before
-    print(f"Score avant: {before:.3f}, après: {after:.3f}, gain: {gain:.3f}")
-
-    min_gain = float(su.get("min_gain", 0.01))
-    if gain >= min_gain:
-        print("Patch accepté.")
-    else:
-        print("Gain insuffisant, rollback…")
-        # Rollback
-        for p in allow_paths:
-            src = os.path.join(backup_dir, p.strip("/"))
-            if os.path.exists(src):
-                shutil.copytree(src, p, dirs_exist_ok=True)
+        # performance: benchmarks base / patch alternés (jamais en même temps), meilleur tour retenu
+        perf, perf_ok = "", True
+        if gate is not None and before is not None and after is not None:
+            pg = su.get("perf_gate", {}) or {}
+            bench = pg.get("bench", {}) or {}
+            b_runs, p_runs = [{"eval_wall_s": b_wall}], [{"eval_wall_s": p_wall}]
+            crashed = 0  # tours où le benchmark du patch échoue alors que celui de la base passe
+            for _ in range(max(1, int(pg.get("rounds", 2)))):
+                mb = sandbox_bench(py, base, bench, timeout)
+                mp = sandbox_bench(py, box, bench, timeout)
+                for runs, m in ((b_runs, mb), (p_runs, mp)):
+                    if m:
+                        runs.append(m)
+                if mb and not mp:
+                    crashed += 1
+            b_perf, p_perf = best(b_runs), best(p_runs)
+            perf_ok, rows = gate.check(b_perf, p_perf)
+            perf = report(rows)
+            if crashed:
+                perf_ok = False
+                perf += f"\nbench_perf en échec sur le patch ({crashed} tour(s)), pas sur la base"
+            print(perf)
+            gate.record(p_perf if accepted and perf_ok else b_perf)
+
+        if accepted and perf_ok:
+            swapped = box.swap()
+            print("Patch accepté:", ", ".join(swapped))
+        elif accepted:
+            accepted = False
+            print("Régression de performance: arbre vivant inchangé.")
+        else:
+            print("Gain insuffisant ou non significatif: arbre vivant inchangé.")
+        if explain:
+            with open(note_path, "a", encoding="utf-8") as f:
+                f.write(f"\n\n=== Résultat ===\nFichiers: {', '.join(changed)}\n{result}\n")
+                if perf:
+                    f.write(f"\n=== Performance ===\n{perf}\n")
+                f.write(f"Décision: {'accepté' if accepted else 'rejeté'}\n")
+    finally:
+        base.cleanup()
+        box.cleanup()
+        if gate is not None:
+            gate.close()
 
 if __name__ == "__main__":
     main()